@@ -1,3 +1,196 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
 
-# Register your models here.
+from .fields import HTMLField
+from .models import Category, Note, Task
+from . import tags
+
+
+def estimated_count(queryset):
+    """The row count of ``queryset``'s table from the database statistics, or None if unavailable."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'mysql':
+        sql = (
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s"
+        )
+    elif connection.vendor == 'postgresql':
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+# The `EstimatedCountPaginator` class keeps the changelist from running COUNT(*) over the
+# whole table: unfiltered lists above ADMIN_ESTIMATED_COUNT_THRESHOLD rows use the
+# table statistics; filtered lists (indexed filters only) are counted exactly.
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def pk_chunks(queryset):
+    """Yield the primary keys of ``queryset`` in lists of ADMIN_ACTION_CHUNK_SIZE, walking the pk index."""
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        chunk = list((pks if last_pk is None else pks.filter(pk__gt=last_pk))[:settings.ADMIN_ACTION_CHUNK_SIZE])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]
+
+
+class TrashFilter(admin.SimpleListFilter):
+    title = 'trash'
+    parameter_name = 'trashed'
+
+    def lookups(self, request, model_admin):
+        return (('no', 'Live'), ('yes', 'In trash'))
+
+    def queryset(self, request, queryset):
+        if self.value() in ('no', 'yes'):
+            return queryset.filter(deleted_at__isnull=self.value() == 'no')
+        return queryset
+
+
+# The `SoftDeleteAdmin` class is the base for admin classes of soft-deletable models:
+# it lists trashed rows too, avoids full-table counts, and replaces the built-in
+# "delete selected" (which loads every row and its cascade) with chunked trash/restore
+# actions that run one UPDATE per ADMIN_ACTION_CHUNK_SIZE rows in its own transaction.
+class SoftDeleteAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    actions = ['move_to_trash', 'restore_from_trash']
+    # Whether bulk trash/restore must recount tag facets (bulk UPDATEs bypass the signals).
+    recount_tags = False
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def delete_model(self, request, obj):
+        # Same as the API: into the trash, hard-deleted later by api.task.purge_deleted_items.
+        obj.soft_delete()
+
+    def bulk_update(self, queryset, changes, recount_tags=False):
+        """Apply ``changes`` to ``queryset`` chunk by chunk; returns the number of rows updated."""
+        updated = 0
+        for chunk in pk_chunks(queryset):
+            with transaction.atomic(using=router.db_for_write(self.model)):
+                affected = tags.tagged_audience(self.model, chunk) if recount_tags else ()
+                updated += self.model.all_objects.filter(pk__in=chunk).update(**changes)
+                if affected:
+                    tags.rebuild_facets(affected)
+        return updated
+
+    @admin.action(description="Move selected %(verbose_name_plural)s to the trash")
+    def move_to_trash(self, request, queryset):
+        count = self.bulk_update(
+            queryset.filter(deleted_at__isnull=True), {'deleted_at': timezone.now()}, self.recount_tags
+        )
+        self.message_user(request, f"Moved {count} {self.model._meta.verbose_name_plural} to the trash.")
+
+    @admin.action(description="Restore selected %(verbose_name_plural)s from the trash")
+    def restore_from_trash(self, request, queryset):
+        count = self.bulk_update(queryset.filter(deleted_at__isnull=False), {'deleted_at': None}, self.recount_tags)
+        self.message_user(request, f"Restored {count} {self.model._meta.verbose_name_plural}.")
+
+
+class BodyAdminForm(forms.ModelForm):
+    """Starts the body field (see BodyAdmin) from the instance's side-table row."""
+    body_field = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.initial.setdefault(self.body_field, getattr(self.instance, self.body_field))
+
+
+# The `BodyAdmin` class adds the HTML body a model keeps in its side table (`body_field`,
+# e.g. Note.content) to the add/change form. Changelists never load it, the change view
+# reads the one row it shows, and a changed body is saved through the model so revisions
+# and storage usage are kept as for API edits.
+class BodyAdmin(SoftDeleteAdmin):
+    body_field = None
+
+    def get_form(self, request, obj=None, change=False, **kwargs):
+        # Built per call so TinyMCE is only imported when a form is actually used.
+        kwargs['form'] = type(f'{self.model.__name__}AdminForm', (BodyAdminForm,), {
+            'body_field': self.body_field,
+            self.body_field: HTMLField(blank=True).formfield(),
+        })
+        return super().get_form(request, obj, change, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        if self.body_field in form.changed_data:
+            setattr(obj, self.body_field, form.cleaned_data[self.body_field])
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(Category)
+class CategoryAdmin(SoftDeleteAdmin):
+    list_display = ['id', 'name', 'user', 'created_at', 'deleted_at']
+    list_select_related = ['user']
+    list_filter = [TrashFilter]
+    search_fields = ['=user__username', '^name']
+    autocomplete_fields = ['user']
+    ordering = ['-pk']
+
+
+@admin.register(Note)
+class NoteAdmin(BodyAdmin):
+    body_field = 'content'
+    list_display = ['id', 'title', 'user', 'category', 'is_shared', 'revision', 'updated_at', 'deleted_at']
+    list_select_related = ['user', 'category']
+    list_filter = [TrashFilter]
+    search_fields = ['=user__username', '=user__email', '^title']
+    autocomplete_fields = ['user', 'category', 'shared_with']
+    readonly_fields = ['revision', 'created_at', 'updated_at', 'deleted_at']
+    ordering = ['-pk']
+    recount_tags = True
+
+
+@admin.register(Task)
+class TaskAdmin(BodyAdmin):
+    body_field = 'description'
+    list_display = ['id', 'title', 'user', 'due_date', 'is_completed', 'completed_at', 'deleted_at']
+    list_select_related = ['user']
+    list_filter = [TrashFilter, 'is_completed', 'due_date']
+    search_fields = ['=user__username', '=user__email', '^title']
+    autocomplete_fields = ['user', 'shared_with']
+    readonly_fields = ['completed_at', 'recurrence_end', 'created_at', 'updated_at', 'deleted_at']
+    ordering = ['-pk']
+    actions = SoftDeleteAdmin.actions + ['mark_completed']
+    recount_tags = True
+
+    @admin.action(description="Mark selected tasks as completed")
+    def mark_completed(self, request, queryset):
+        count = self.bulk_update(
+            queryset.filter(is_completed=False), {'is_completed': True, 'completed_at': timezone.now()}
+        )
+        self.message_user(request, f"Marked {count} tasks as completed.")
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from django.core import checks
+
+        from . import events, sharding, tags, typeahead
+        from .db.metrics import connect_signals
+        connect_signals()
+        events.connect_signals()
+        tags.connect_signals()
+        sharding.connect_signals()
+        checks.register(sharding.check_directory_cache)
+        typeahead.connect_signals()
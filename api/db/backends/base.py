@@ -0,0 +1,41 @@
+import time
+
+from ..metrics import connection_metrics
+
+
+class MeteredConnectionMixin:
+    """
+    Database wrapper mixin for persistent connections. It times every physical
+    connect (the handshake a request waits on), records connection age at close,
+    and recycles a connection after the ``CONN_MAX_USES`` checkouts configured
+    in its DATABASES entry.
+    """
+    connected_at = None
+    uses = 0
+
+    def connect(self):
+        started = time.monotonic()
+        super().connect()
+        self.connected_at = time.monotonic()
+        self.uses = 0
+        connection_metrics.record_connect(self.alias, self.connected_at - started)
+
+    def close(self):
+        if self.connection is not None and self.connected_at is not None:
+            connection_metrics.record_close(self.alias, time.monotonic() - self.connected_at)
+            self.connected_at = None
+        super().close()
+
+    def checkout(self):
+        """
+        Called at the start of each request or Celery task. Counts a reuse when the
+        persistent connection survived from the previous unit of work.
+        """
+        if self.connection is None:
+            return
+        max_uses = self.settings_dict.get('CONN_MAX_USES')
+        if max_uses and self.uses >= max_uses and not self.in_atomic_block:
+            self.close()
+            return
+        self.uses += 1
+        connection_metrics.record_reuse(self.alias)
@@ -0,0 +1,7 @@
+from django.db.backends.mysql import base
+
+from ..base import MeteredConnectionMixin
+
+
+class DatabaseWrapper(MeteredConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,87 @@
+import threading
+from collections import defaultdict
+
+from celery.signals import task_postrun, task_prerun
+from django.core.signals import request_started
+from django.db import close_old_connections, connections
+
+
+# The `ConnectionMetrics` class keeps per-process, per-alias counters for database
+# connections: how many were opened, reused and closed, how long callers waited on
+# the connect handshake, and how old connections were when they were retired.
+class ConnectionMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = defaultdict(lambda: {
+                'opened': 0,
+                'reused': 0,
+                'closed': 0,
+                'connect_seconds_total': 0.0,
+                'connect_seconds_max': 0.0,
+                'age_seconds_total': 0.0,
+                'age_seconds_max': 0.0,
+            })
+
+    def record_connect(self, alias, seconds):
+        with self._lock:
+            counters = self._counters[alias]
+            counters['opened'] += 1
+            counters['connect_seconds_total'] += seconds
+            counters['connect_seconds_max'] = max(counters['connect_seconds_max'], seconds)
+
+    def record_reuse(self, alias):
+        with self._lock:
+            self._counters[alias]['reused'] += 1
+
+    def record_close(self, alias, age):
+        with self._lock:
+            counters = self._counters[alias]
+            counters['closed'] += 1
+            counters['age_seconds_total'] += age
+            counters['age_seconds_max'] = max(counters['age_seconds_max'], age)
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for alias, counters in self._counters.items():
+                counters = dict(counters)
+                checkouts = counters['opened'] + counters['reused']
+                counters['reuse_ratio'] = counters['reused'] / checkouts if checkouts else 0.0
+                counters['connect_seconds_avg'] = (
+                    counters['connect_seconds_total'] / counters['opened'] if counters['opened'] else 0.0
+                )
+                counters['age_seconds_avg'] = (
+                    counters['age_seconds_total'] / counters['closed'] if counters['closed'] else 0.0
+                )
+                result[alias] = counters
+            return result
+
+
+connection_metrics = ConnectionMetrics()
+
+
+def checkout_connections(**kwargs):
+    """Start of a request or task: count reuses and enforce CONN_MAX_USES."""
+    for connection in connections.all(initialized_only=True):
+        if hasattr(connection, 'checkout'):
+            connection.checkout()
+
+
+def release_connections(task=None, **kwargs):
+    """
+    End of a Celery task: apply CONN_MAX_AGE and health checks exactly like
+    Django does at the end of a request, instead of closing unconditionally.
+    """
+    if task is not None and getattr(task.request, 'is_eager', False):
+        return
+    close_old_connections()
+
+
+def connect_signals():
+    request_started.connect(checkout_connections, dispatch_uid='api.db.checkout_connections')
+    task_prerun.connect(checkout_connections, dispatch_uid='api.db.checkout_connections')
+    task_postrun.connect(release_connections, dispatch_uid='api.db.release_connections')
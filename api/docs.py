@@ -0,0 +1,55 @@
+"""
+Lazy API documentation hooks.
+
+Views describe their OpenAPI overrides with ``@document(factory)``, which only
+stores the factory on the view method. drf_yasg is imported when the schema is
+generated (see api.schema_generator), never when the views are imported, so
+web and Celery processes that never build the schema do not load it.
+"""
+
+
+def document(factory):
+    """
+    Attach a factory returning ``swagger_auto_schema`` keyword arguments to a
+    view method. The factory runs only during schema generation.
+    """
+    def decorator(view_method):
+        view_method._remino_docs = factory
+        return view_method
+    return decorator
+
+
+def resolve(view_method):
+    """Return the drf_yasg overrides for ``view_method``, or None if undocumented."""
+    factory = getattr(view_method, '_remino_docs', None)
+    if factory is None:
+        return None
+    from drf_yasg.utils import swagger_auto_schema
+
+    def placeholder():
+        pass
+    return swagger_auto_schema(**factory())(placeholder)._swagger_auto_schema
+
+
+def register_docs():
+    from drf_yasg import openapi
+    from .serializers import UserRegisterSerializer
+    return {
+        'request_body': UserRegisterSerializer,
+        'responses': {
+            201: openapi.Response('User registered successfully', UserRegisterSerializer),
+            400: 'Bad Request'
+        },
+    }
+
+
+def login_docs():
+    from drf_yasg import openapi
+    from .serializers import LoginSerializer
+    return {
+        'request_body': LoginSerializer,
+        'responses': {
+            200: openapi.Response('Login successful', LoginSerializer),
+            401: 'Unauthorized'
+        },
+    }
@@ -0,0 +1,272 @@
+import asyncio
+import functools
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+TICKET_SALT = 'api.events.stream-ticket'
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+# The `InMemoryBroker` fans events out to the streams open in this process. It is the
+# broker for tests and single-process deployments; publish() may be called from any
+# thread (sync views, signal handlers), subscribers live on the ASGI event loop.
+class InMemoryBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def subscribe(self, channel):
+        """Subscribe to ``channel``; must be called from the event loop that will read it."""
+        subscription = Subscription(self, channel, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.offer, message)
+
+
+# The `RedisBroker` publishes through Redis so a change made on any web or Celery
+# process reaches streams held open by every ASGI process. Each process keeps one
+# pattern subscription and fans messages out locally like the in-memory broker.
+class RedisBroker(InMemoryBroker):
+    prefix = 'remino:events:'
+
+    def __init__(self, url, queue_size=100):
+        super().__init__(queue_size)
+        self.url = url
+        self._reader = None
+
+    @cached_property
+    def client(self):
+        import redis
+        return redis.Redis.from_url(self.url)
+
+    def publish(self, channel, message):
+        self.client.publish(self.prefix + channel, json.dumps(message))
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        if self._reader is None or self._reader.done() or self._reader.get_loop() is not subscription.loop:
+            self._reader = subscription.loop.create_task(self._read())
+        return subscription
+
+    async def _read(self):
+        import redis.asyncio as aioredis
+        from redis.exceptions import RedisError
+
+        while True:
+            client = aioredis.Redis.from_url(self.url)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(self.prefix + '*')
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        channel = message['channel'].decode()[len(self.prefix):]
+                        self._deliver(channel, json.loads(message['data']))
+            except RedisError:
+                logger.warning("Lost the Redis event subscription; reconnecting.", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+
+class Subscription:
+    def __init__(self, broker, channel, loop, queue_size):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A stalled client loses events rather than growing memory; it resyncs on reconnect.
+            logger.warning("Dropping event for slow subscriber on %s.", self.channel)
+
+    async def get(self, timeout):
+        """Return the next message, or None if nothing arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    options = dict(getattr(settings, 'EVENT_BROKER_OPTIONS', {}))
+    return import_string(settings.EVENT_BROKER)(**options)
+
+
+def issue_ticket(user):
+    """A short-lived signed token that lets ``user`` open the stream (EventSource cannot send headers)."""
+    return signing.dumps(user.pk, salt=TICKET_SALT)
+
+
+def read_ticket(ticket):
+    """Return the user id in ``ticket``, or None if it is invalid or expired."""
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=settings.EVENT_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+
+
+def format_event(message):
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+async def stream(user_id):
+    """
+    Server-sent events for one user: change events as they are published, a comment
+    line every EVENT_STREAM_KEEPALIVE seconds so proxies keep the connection open,
+    and a clean end after EVENT_STREAM_MAX_SECONDS so clients reconnect with a
+    fresh ticket.
+    """
+    subscription = get_broker().subscribe(user_channel(user_id))
+    deadline = time.monotonic() + settings.EVENT_STREAM_MAX_SECONDS
+    try:
+        yield f"retry: {settings.EVENT_STREAM_RETRY_MS}\n\n"
+        while time.monotonic() < deadline:
+            message = await subscription.get(timeout=settings.EVENT_STREAM_KEEPALIVE)
+            yield format_event(message) if message is not None else ": keepalive\n\n"
+    finally:
+        subscription.close()
+
+
+def share_ids(instance):
+    """
+    Ids of the users ``instance`` is shared with. Read from the prefetched
+    ``shared_with`` when the caller loaded it, else from the set shares_changed()
+    keeps on the instance; only an instance loaded without either costs a query.
+    """
+    if '_share_ids' not in instance.__dict__:
+        prefetched = getattr(instance, '_prefetched_objects_cache', {}).get('shared_with')
+        if prefetched is not None:
+            instance._share_ids = {user.pk for user in prefetched}
+        else:
+            instance._share_ids = set(instance.shared_with.values_list('id', flat=True))
+    return instance._share_ids
+
+
+def publish_change(kind, instance, action, audience=None, **extra):
+    """
+    Tell ``audience`` that the object changed, once committed. The audience
+    defaults to the owner and, except for new objects, everyone it is shared with.
+    """
+    if audience is None:
+        audience = {instance.user_id}
+        if action != 'created':
+            audience |= share_ids(instance)
+    if not audience:
+        return
+    message = {
+        'type': kind,
+        'id': instance.pk,
+        'action': action,
+        'updated_at': instance.updated_at.isoformat(),
+        **extra,
+    }
+
+    def send():
+        broker = get_broker()
+        for user_id in audience:
+            try:
+                broker.publish(user_channel(user_id), message)
+            except Exception:
+                logger.exception("Could not publish %s %s event.", kind, instance.pk)
+
+    transaction.on_commit(send, using=instance._state.db)
+
+
+def _action(instance, created):
+    if created:
+        return 'created'
+    return 'deleted' if instance.deleted_at is not None else 'updated'
+
+
+def note_saved(sender, instance, created, **kwargs):
+    if created:
+        instance._share_ids = set()
+    publish_change('note', instance, _action(instance, created), revision=instance.revision)
+
+
+def task_saved(sender, instance, created, **kwargs):
+    if created:
+        instance._share_ids = set()
+    publish_change('task', instance, _action(instance, created))
+
+
+def occurrence_saved(sender, instance, **kwargs):
+    publish_change('task', instance.task, 'updated', updated_at=instance.updated_at.isoformat())
+
+
+def shares_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Users gaining access get 'shared', users losing it 'unshared': the object's own
+    # save events only reach whoever can see it afterwards.
+    if reverse:
+        return
+    known = instance.__dict__.get('_share_ids')
+    if action == 'pre_clear':
+        # The prefetched shares are still there at this point.
+        instance._cleared_shares = set(share_ids(instance))
+        return
+    if action == 'post_add':
+        changed, change = pk_set, 'shared'
+        if known is not None:
+            known |= pk_set
+    elif action == 'post_remove':
+        changed, change = pk_set, 'unshared'
+        if known is not None:
+            known -= pk_set
+    elif action == 'post_clear':
+        changed, change = instance.__dict__.pop('_cleared_shares', set()), 'unshared'
+        instance._share_ids = set()
+    else:
+        return
+    if instance.deleted_at is None:
+        publish_change(instance._meta.model_name, instance, change, audience=changed - {instance.user_id})
+
+
+def connect_signals():
+    from .models import Note, Task, TaskOccurrence
+
+    post_save.connect(note_saved, sender=Note, dispatch_uid='api.events.note_saved')
+    post_save.connect(task_saved, sender=Task, dispatch_uid='api.events.task_saved')
+    post_save.connect(occurrence_saved, sender=TaskOccurrence, dispatch_uid='api.events.occurrence_saved')
+    for model in (Note, Task):
+        name = model._meta.model_name
+        m2m_changed.connect(shares_changed, sender=model.shared_with.through, dispatch_uid=f'api.events.{name}_shares')
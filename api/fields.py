@@ -0,0 +1,84 @@
+import zlib
+
+from django.db import models
+
+
+class HTMLField(models.TextField):
+    """
+    A large text field for HTML content that uses the TinyMCE widget in forms,
+    like tinymce's own HTMLField. TinyMCE and the admin widgets are imported only
+    when a form field is built, so processes that never render forms (API
+    workers, Celery) do not load them.
+    """
+
+    def formfield(self, **kwargs):
+        from django.contrib.admin import widgets as admin_widgets
+        from tinymce import widgets as tinymce_widgets
+
+        defaults = {"widget": tinymce_widgets.TinyMCE}
+        defaults.update(kwargs)
+        if defaults["widget"] == admin_widgets.AdminTextareaWidget:
+            defaults["widget"] = tinymce_widgets.AdminTinyMCE
+        return super().formfield(**defaults)
+
+
+class CompressedHTMLField(HTMLField):
+    """
+    An HTMLField stored as a binary column and zlib-compressed at rest once the
+    encoded body reaches ``compress_min_length`` bytes. Every stored value starts
+    with a one-byte codec marker, so short bodies are kept as-is and old rows stay
+    readable if the codec or threshold changes. The column cannot be searched with
+    SQL text lookups.
+    """
+
+    RAW = b"r"
+    ZLIB = b"z"
+
+    def __init__(self, *args, compress_min_length=512, compress_level=6, **kwargs):
+        self.compress_min_length = compress_min_length
+        self.compress_level = compress_level
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.compress_min_length != 512:
+            kwargs["compress_min_length"] = self.compress_min_length
+        if self.compress_level != 6:
+            kwargs["compress_level"] = self.compress_level
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    def encode(self, value):
+        data = value.encode("utf-8")
+        if len(data) >= self.compress_min_length:
+            compressed = zlib.compress(data, self.compress_level)
+            if len(compressed) < len(data):
+                return self.ZLIB + compressed
+        return self.RAW + data
+
+    def decode(self, value):
+        value = bytes(value)
+        marker, data = value[:1], value[1:]
+        if marker == self.ZLIB:
+            data = zlib.decompress(data)
+        elif marker != self.RAW:
+            raise ValueError(f"Unknown codec marker {marker!r} in {self.name}.")
+        return data.decode("utf-8")
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.decode(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            return self.decode(value)
+        return super().to_python(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return value
+        return connection.Database.Binary(self.encode(value))
@@ -0,0 +1,142 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils.html import strip_tags
+
+# Cached VEVENT blocks are keyed by (task, updated_at), so they never go stale;
+# the timeouts only bound how long unused entries linger in the cache.
+EVENT_CACHE_TIMEOUT = 60 * 60 * 24
+FEED_CACHE_TIMEOUT = 60 * 60
+# How far back one-off tasks stay in the feed.
+FEED_HISTORY = timedelta(days=90)
+
+
+def escape_text(value):
+    """Escape a TEXT value as required by RFC 5545 section 3.3.11."""
+    return (
+        value.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Fold a content line to 75 octets, continuing with a single space."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Never split a multi-byte UTF-8 sequence.
+        while size < len(encoded) and encoded[size] & 0xC0 == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode('utf-8'))
+        encoded = encoded[size:]
+    return '\r\n '.join(parts)
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_event(task, overrides):
+    """
+    Render the VEVENT block(s) for one task. Recurring tasks are emitted once with
+    their RRULE; cancelled occurrences become EXDATEs and other stored exceptions
+    become RECURRENCE-ID overrides, so the client does the expansion.
+    """
+    uid = f"task-{task.pk}@remino"
+    url = f"{settings.SITE_URL}{reverse('api:task-detail', kwargs={'pk': task.pk})}"
+    description = strip_tags(task.description).strip()
+
+    def event(start, summary, extra=()):
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:{uid}',
+            f'DTSTAMP:{format_datetime(task.updated_at)}',
+            f'DTSTART:{format_datetime(start)}',
+            f'SUMMARY:{escape_text(summary)}',
+            f'URL:{url}',
+        ]
+        if description:
+            lines.append(f'DESCRIPTION:{escape_text(description)}')
+        lines.extend(extra)
+        lines.append('END:VEVENT')
+        return lines
+
+    title = f"[Done] {task.title}" if task.is_completed else task.title
+    lines = []
+    if not task.is_recurring:
+        lines.extend(event(task.due_date, title))
+    else:
+        extra = [f'RRULE:{task.recurrence_rule.upper().removeprefix("RRULE:")}']
+        extra.extend(
+            f'EXDATE:{format_datetime(override.original_date)}'
+            for override in overrides if override.is_cancelled
+        )
+        lines.extend(event(task.due_date, title, extra))
+        for override in overrides:
+            if override.is_cancelled:
+                continue
+            summary = f"[Done] {task.title}" if override.is_completed else title
+            lines.extend(event(
+                override.due_date or override.original_date,
+                summary,
+                [f'RECURRENCE-ID:{format_datetime(override.original_date)}'],
+            ))
+    return '\r\n'.join(fold(line) for line in lines)
+
+
+def feed_etag(user, aggregate):
+    """
+    Strong validator for a user's feed, derived from one aggregate query over
+    the visible tasks (count, newest update and id checksum).
+    """
+    raw = f"{user.pk}:{aggregate['count']}:{aggregate['last_modified']}:{aggregate['checksum']}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def render_feed(user, querysets, etag):
+    """
+    Build the VCALENDAR document for the tasks in ``querysets`` (one per shard).
+    Whole feeds are cached by ETag and individual events by (task, updated_at): a
+    poll after an edit only loads and re-renders the tasks that actually changed.
+    """
+    feed_key = f"ical:feed:{user.pk}:{etag}"
+    body = cache.get(feed_key)
+    if body is not None:
+        return body
+
+    versions = sorted(
+        version for tasks in querysets for version in tasks.values_list('pk', 'updated_at')
+    )
+    keys = {pk: f"ical:event:{pk}:{updated_at.timestamp()}" for pk, updated_at in versions}
+    events = cache.get_many(keys.values())
+
+    missing = [pk for pk, key in keys.items() if key not in events]
+    if missing:
+        rendered = {}
+        for tasks in querysets:
+            loaded = tasks.filter(pk__in=missing).select_related('body').prefetch_related('occurrence_overrides')
+            for task in loaded:
+                rendered[keys[task.pk]] = render_event(task, list(task.occurrence_overrides.all()))
+        cache.set_many(rendered, EVENT_CACHE_TIMEOUT)
+        events.update(rendered)
+
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Remino//Tasks//EN',
+        'CALSCALE:GREGORIAN',
+        fold(f'X-WR-CALNAME:{escape_text(f"Remino tasks ({user.username})")}'),
+    ]
+    lines.extend(events[keys[pk]] for pk, updated_at in versions if keys[pk] in events)
+    body = '\r\n'.join(lines + ['END:VCALENDAR']) + '\r\n'
+    cache.set(feed_key, body, FEED_CACHE_TIMEOUT)
+    return body
@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+from api.db.metrics import connection_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of opening a database connection by replaying "
+        "simulated requests with CONN_MAX_AGE=0 and with persistent connections."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--max-age', type=int, default=60,
+                            help="CONN_MAX_AGE used for the persistent run.")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        count = options['requests']
+
+        per_request = {}
+        for label, max_age in (('per-request connect', 0), ('persistent', options['max_age'])):
+            elapsed, snapshot = self._run(alias, count, max_age)
+            per_request[label] = elapsed / count
+            self.stdout.write(
+                f"{label:>20}: {elapsed / count * 1000:.3f} ms/request, "
+                f"{snapshot['opened']} connects "
+                f"(avg {snapshot['connect_seconds_avg'] * 1000:.3f} ms), "
+                f"{snapshot['reused']} reuses, reuse ratio {snapshot['reuse_ratio']:.2%}"
+            )
+
+        saved = per_request['per-request connect'] - per_request['persistent']
+        self.stdout.write(self.style.SUCCESS(
+            f"Connection reuse saves {saved * 1000:.3f} ms per request on '{alias}'."
+        ))
+
+    def _run(self, alias, count, max_age):
+        connection = connections[alias]
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        connection.close()
+        connection.settings_dict['CONN_MAX_AGE'] = max_age
+        connection_metrics.reset()
+        try:
+            started = time.perf_counter()
+            for _ in range(count):
+                request_started.send(sender=self.__class__)
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                request_finished.send(sender=self.__class__)
+            elapsed = time.perf_counter() - started
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+        return elapsed, connection_metrics.snapshot().get(alias, {
+            'opened': 0, 'reused': 0, 'reuse_ratio': 0.0, 'connect_seconds_avg': 0.0,
+        })
@@ -0,0 +1,102 @@
+import random
+import string
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.db.models.functions import Length
+
+from api.models import Note, NoteBody, Task, TaskBody
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how much the compressed NoteBody/TaskBody side tables save: stored vs "
+        "raw body bytes, table sizes (MySQL), and the cost of a list scan that reads "
+        "only the main rows vs one that also loads every body."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help="Create this many throwaway notes first (rolled back afterwards).")
+        parser.add_argument('--size', type=int, default=200,
+                            help="Approximate size in KB of each synthetic note body.")
+        parser.add_argument('--page-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        if not options['synthetic']:
+            self._report(options['page_size'])
+            return
+        try:
+            with transaction.atomic():
+                self._create_synthetic(options['synthetic'], options['size'])
+                self._report(options['page_size'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Synthetic rows rolled back.")
+
+    def _create_synthetic(self, count, size_kb):
+        user, _ = User.objects.get_or_create(username='bench-html-storage')
+        words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(400)]
+        for index in range(count):
+            paragraphs = []
+            length = 0
+            while length < size_kb * 1024:
+                paragraph = f"<p>{' '.join(random.choices(words, k=60))}</p>"
+                paragraphs.append(paragraph)
+                length += len(paragraph)
+            Note.objects.create(user=user, title=f"Bench note {index}", content=''.join(paragraphs))
+
+    def _report(self, page_size):
+        for label, body_model in (('notes', NoteBody), ('tasks', TaskBody)):
+            rows = body_model.objects.count()
+            if not rows:
+                self.stdout.write(f"{label}: no bodies stored")
+                continue
+            stored = body_model.objects.aggregate(total=Sum(Length('text')))['total'] or 0
+            raw = sum(
+                len(text.encode('utf-8'))
+                for text in body_model.objects.values_list('text', flat=True).iterator(chunk_size=500)
+            )
+            self.stdout.write(
+                f"{label}: {rows} bodies, raw {raw / 1024:.1f} KB, stored {stored / 1024:.1f} KB "
+                f"({1 - stored / raw if raw else 0:.1%} saved)"
+            )
+
+        if connection.vendor == 'mysql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT table_name, data_length, index_length FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_name IN "
+                    "('api_note', 'api_notebody', 'api_task', 'api_taskbody')"
+                )
+                for table, data_length, index_length in cursor.fetchall():
+                    self.stdout.write(
+                        f"{table:>14}: data {data_length / 1024:.1f} KB, index {index_length / 1024:.1f} KB"
+                    )
+
+        for label, model in (('notes', Note), ('tasks', Task)):
+            ids = list(model.objects.order_by('-pk').values_list('pk', flat=True)[:page_size])
+            if not ids:
+                continue
+            main_only = self._time(lambda: list(model.objects.filter(pk__in=ids)))
+            with_body = self._time(lambda: list(model.objects.filter(pk__in=ids).select_related('body')))
+            self.stdout.write(
+                f"{label} list page ({len(ids)} rows): main rows {main_only * 1000:.2f} ms, "
+                f"with bodies {with_body * 1000:.2f} ms"
+            )
+
+    def _time(self, query, repeat=5):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            query()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -0,0 +1,106 @@
+import gzip
+import random
+import string
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Note, Task
+from api.renderers import ORJSONRenderer, orjson
+from api.serializers import NoteListSerializer, NoteSerializer, TaskListSerializer, TaskSerializer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's JSONRenderer with ORJSONRenderer on typical note and task pages "
+        "(list and detail), and report bytes on the wire uncompressed, gzipped and "
+        "brotli-compressed. Rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=settings.REST_FRAMEWORK['PAGE_SIZE'])
+        parser.add_argument('--size', type=int, default=20,
+                            help="Approximate size in KB of each note/task HTML body.")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING("orjson is not installed; ORJSONRenderer falls back to json."))
+        try:
+            with transaction.atomic():
+                pages = self._build_pages(options['page_size'], options['size'])
+                for label, data in pages:
+                    self._report(label, data, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _build_pages(self, page_size, size_kb):
+        user, _ = User.objects.get_or_create(username='bench-json-rendering')
+        words = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 9))) for _ in range(400)]
+
+        def html():
+            paragraphs, length = [], 0
+            while length < size_kb * 1024:
+                paragraph = f"<p>{' '.join(random.choices(words, k=40))}</p>"
+                paragraphs.append(paragraph)
+                length += len(paragraph)
+            return ''.join(paragraphs)
+
+        due = timezone.now() + timedelta(days=1)
+        notes = [Note.objects.create(user=user, title=f"Note {i}", content=html()) for i in range(page_size)]
+        tasks = [
+            Task.objects.create(user=user, title=f"Task {i}", description=html(), due_date=due)
+            for i in range(page_size)
+        ]
+
+        def page(serializer_class, instances):
+            return {'count': len(instances), 'next': None, 'previous': None,
+                    'results': serializer_class(instances, many=True).data}
+
+        return [
+            ('note list page', page(NoteListSerializer, notes)),
+            ('note detail', NoteSerializer(notes[0]).data),
+            ('note page with bodies', page(NoteSerializer, notes)),
+            ('task list page', page(TaskListSerializer, tasks)),
+            ('task page with bodies', page(TaskSerializer, tasks)),
+        ]
+
+    def _report(self, label, data, repeat):
+        timings = {}
+        for name, renderer in (('json', JSONRenderer()), ('orjson', ORJSONRenderer())):
+            body = renderer.render(data, 'application/json')
+            started = time.perf_counter()
+            for _ in range(repeat):
+                body = renderer.render(data, 'application/json')
+            timings[name] = (time.perf_counter() - started) / repeat
+
+        sizes = [f"raw {len(body) / 1024:.1f} KB"]
+        started = time.perf_counter()
+        gzipped = gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+        sizes.append(f"gzip {len(gzipped) / 1024:.1f} KB ({(time.perf_counter() - started) * 1000:.2f} ms)")
+        if brotli is not None:
+            started = time.perf_counter()
+            compressed = brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            sizes.append(f"br {len(compressed) / 1024:.1f} KB ({(time.perf_counter() - started) * 1000:.2f} ms)")
+
+        self.stdout.write(
+            f"{label:>22}: encode json {timings['json'] * 1000:.3f} ms, "
+            f"orjson {timings['orjson'] * 1000:.3f} ms "
+            f"({timings['json'] / timings['orjson']:.1f}x); " + ', '.join(sizes)
+        )
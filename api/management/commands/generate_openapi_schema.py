@@ -0,0 +1,41 @@
+import difflib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema import artifact_path, generate_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerate the versioned OpenAPI artifact served at /swagger.json and show "
+        "how it differs from the current one. Run this at deploy time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schema-version', dest='schema_version', default=settings.OPENAPI_SCHEMA_VERSION)
+        parser.add_argument('--check', action='store_true',
+                            help="Only compare; exit with an error if the artifact is stale.")
+
+    def handle(self, *args, **options):
+        version = options['schema_version']
+        path = artifact_path(version)
+        new = generate_schema(version)
+        old = path.read_bytes() if path.exists() else b''
+
+        if new == old:
+            self.stdout.write(self.style.SUCCESS(f"{path} is up to date."))
+            return
+
+        diff = difflib.unified_diff(
+            old.decode().splitlines(), new.decode().splitlines(),
+            fromfile=f"{path.name} (current)", tofile=f"{path.name} (generated)", lineterm='',
+        )
+        self.stdout.write('\n'.join(diff))
+
+        if options['check']:
+            raise CommandError(f"{path} is stale; run manage.py generate_openapi_schema.")
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(new)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {path}."))
@@ -0,0 +1,70 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What each process role imports before it can serve its first unit of work.
+ROLE_MODULES = {
+    'web': ['productivity_pro.wsgi', 'django.urls:get_resolver().url_patterns'],
+    'worker': ['productivity_pro.celery', 'api.task'],
+}
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Report per-module import cost for a cold start of a web or Celery worker "
+        "process, measured with python -X importtime in a fresh interpreter."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', choices=sorted(ROLE_MODULES), default='web')
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--by-package', action='store_true',
+                            help="Aggregate self time per top-level package.")
+
+    def handle(self, *args, **options):
+        role = options['role']
+        statements = ['import django', 'django.setup()']
+        for target in ROLE_MODULES[role]:
+            module, _, expression = target.partition(':')
+            statements.append(f'import {module}')
+            if expression:
+                statements.append(f'{module}.{expression}')
+
+        env = {**os.environ, 'REMINO_PROCESS_ROLE': role}
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', '; '.join(statements)],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                modules.append((name, int(self_us), int(cumulative_us), len(indent) == 1))
+
+        total_ms = sum(self_us for _, self_us, _, _ in modules) / 1000
+        self.stdout.write(f"{role}: {len(modules)} modules imported in {total_ms:.1f} ms")
+
+        if options['by_package']:
+            packages = defaultdict(int)
+            for name, self_us, _, _ in modules:
+                packages[name.split('.')[0]] += self_us
+            rows = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+            for package, self_us in rows[:options['limit']]:
+                self.stdout.write(f"{self_us / 1000:>10.1f} ms  {package}")
+            return
+
+        self.stdout.write(f"{'cumulative':>12} {'self':>10}  module")
+        rows = sorted(modules, key=lambda module: module[2], reverse=True)
+        for name, self_us, cumulative_us, top_level in rows[:options['limit']]:
+            marker = '' if top_level else '  '
+            self.stdout.write(f"{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>7.1f} ms  {marker}{name}")
@@ -0,0 +1,197 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import sharding
+from api.models import (
+    ArchivedTask, Category, Note, NoteBody, NoteRevision, NoteTag, SharedAccess, StorageUsage,
+    Tag, TagFacet, Task, TaskBody, TaskOccurrence, TaskTag, UserShard,
+)
+
+# A user's rows in dependency order, with the lookup selecting them. Rows that other
+# rows point at keep their (globally unique) ids; the rest get fresh ids on the target.
+USER_ROWS = [
+    (StorageUsage, 'user_id', True),
+    (Category, 'user_id', True),
+    (Tag, 'user_id', True),
+    (TagFacet, 'tag__user_id', False),
+    (Note, 'user_id', True),
+    (NoteBody, 'note__user_id', True),
+    (NoteTag, 'note__user_id', False),
+    (Note.shared_with.through, 'note__user_id', False),
+    (NoteRevision, 'note__user_id', False),
+    (Task, 'user_id', True),
+    (TaskBody, 'task__user_id', True),
+    (TaskTag, 'task__user_id', False),
+    (Task.shared_with.through, 'task__user_id', False),
+    (TaskOccurrence, 'task__user_id', False),
+    (ArchivedTask, 'user_id', True),
+    (ArchivedTask.shared_with.through, 'archivedtask__user_id', False),
+]
+
+# Deleting these from the source cascades to every other row in USER_ROWS.
+USER_ROOTS = [Note, Task, ArchivedTask, Tag, Category, StorageUsage]
+
+SHARED_ROWS = [(Note, 'note'), (Task, 'task'), (ArchivedTask, 'archivedtask')]
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how users and rows are spread over the shards, or move one user's "
+        "categories, tags, notes and tasks to another shard. Run with --sync-users once "
+        "when enabling sharding: it copies users to every shard and pins existing users "
+        "to `default`, where their rows already are. --cleanup deletes the rows a move "
+        "interrupted after switching shards left on the old one; rerunning the move does "
+        "the same for that user."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Id of the user to move.")
+        parser.add_argument('--to', help="Alias of the shard to move the user to.")
+        parser.add_argument('--top', type=int, default=10, help="Heaviest users to list per shard.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sync-users', action='store_true',
+                            help="Copy every user row to every shard and place unplaced users on `default`.")
+        parser.add_argument('--rebuild-access-index', action='store_true',
+                            help="Recreate the SharedAccess index from the share tables of every shard.")
+        parser.add_argument('--cleanup', action='store_true',
+                            help="Delete rows left on shards their owners are no longer placed on.")
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharded():
+            raise CommandError("Only one shard is configured (settings.SHARDS).")
+        if options['sync_users']:
+            self._sync_users(options['batch_size'])
+        if options['rebuild_access_index']:
+            self._rebuild_access_index(options['batch_size'])
+        if options['cleanup']:
+            self._cleanup()
+        if options['user'] is not None:
+            if options['to'] not in sharding.shard_aliases():
+                raise CommandError(f"--to must be one of {', '.join(sharding.shard_aliases())}.")
+            self._move(options['user'], options['to'], options['batch_size'])
+        self._report(options['top'])
+
+    def _report(self, top):
+        for alias in sharding.shard_aliases():
+            users = UserShard.objects.filter(alias=alias).count()
+            notes = Note._base_manager.using(alias).count()
+            tasks = Task._base_manager.using(alias).count()
+            self.stdout.write(f"{alias}: {users} users, {notes} notes, {tasks} tasks")
+            heaviest = StorageUsage.objects.using(alias).select_related('user').order_by('-content_bytes')[:top]
+            for usage in heaviest:
+                self.stdout.write(f"  {usage.user.username} (#{usage.user_id}): {usage.total_bytes} bytes")
+
+    def _sync_users(self, batch_size):
+        placed = set(UserShard.objects.values_list('user_id', flat=True))
+        users = User.objects.order_by('pk')
+        for user in users.iterator(chunk_size=batch_size):
+            sharding.mirror_user(User, user, raw=False, using='default')
+        UserShard.objects.bulk_create(
+            [UserShard(user_id=pk, alias='default') for pk in users.values_list('pk', flat=True) if pk not in placed],
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        for pk in users.values_list('pk', flat=True):
+            sharding.forget_placement(pk)
+        self.stdout.write(f"Synced {users.count()} users to {len(sharding.shard_aliases()) - 1} shards.")
+
+    def _rebuild_access_index(self, batch_size):
+        with transaction.atomic():
+            SharedAccess.objects.all().delete()
+            for alias in sharding.shard_aliases():
+                for model, kind in SHARED_ROWS:
+                    shares = model.shared_with.through.objects.using(alias).values_list(
+                        'user_id', f'{kind}_id', f'{kind}__user_id'
+                    )
+                    SharedAccess.objects.bulk_create(
+                        [
+                            SharedAccess(user_id=user_id, kind=kind, object_id=object_id, owner_id=owner_id, alias=alias)
+                            for user_id, object_id, owner_id in shares.iterator(chunk_size=batch_size)
+                            if user_id != owner_id
+                        ],
+                        batch_size=batch_size, ignore_conflicts=True,
+                    )
+        self.stdout.write(f"Rebuilt the access index: {SharedAccess.objects.count()} entries.")
+
+    def _move(self, user_id, target, batch_size):
+        source = sharding.shard_for_user(user_id, cached=False)
+        if source == target:
+            # A move interrupted after the switch leaves rows on the old shard.
+            for alias in sharding.shard_aliases():
+                if alias != target:
+                    self._delete_rows(user_id, alias)
+            UserShard.objects.filter(user_id=user_id).update(migrating=False)
+            sharding.forget_placement(user_id)
+            self.stdout.write(f"User #{user_id} is already on {target}.")
+            return
+        UserShard.objects.filter(user_id=user_id).update(migrating=True)
+        sharding.forget_placement(user_id)
+        # Writers check the flag before writing; let those that read it just before it
+        # was set finish.
+        time.sleep(settings.SHARD_MIGRATION_GRACE_SECONDS)
+        try:
+            # Rows an earlier, interrupted move to this shard copied.
+            self._delete_rows(user_id, target)
+            copied = {}
+            with transaction.atomic(using=target):
+                for model, lookup, keep_pk in USER_ROWS:
+                    copied[model] = self._copy(model, lookup, user_id, source, target, keep_pk, batch_size)
+            # Anything written to the source since is missing from the copy: keep the source.
+            if copied != self._count_rows(user_id, source):
+                self._delete_rows(user_id, target)
+                raise CommandError(f"User #{user_id}'s rows changed while being copied; nothing was moved.")
+            with transaction.atomic():
+                UserShard.objects.filter(user_id=user_id).update(alias=target)
+                SharedAccess.objects.filter(owner_id=user_id).update(alias=target)
+            # Still flagged, so nothing writes to the source while it is emptied. If this
+            # is interrupted, --cleanup (or running the move again) finishes it.
+            self._delete_rows(user_id, source)
+        finally:
+            UserShard.objects.filter(user_id=user_id).update(migrating=False)
+            sharding.forget_placement(user_id)
+        self.stdout.write(f"Moved user #{user_id} from {source} to {target}.")
+
+    def _cleanup(self):
+        deleted = 0
+        for alias in sharding.shard_aliases():
+            owners = set()
+            for model in USER_ROOTS:
+                owners.update(model._base_manager.using(alias).values_list('user_id', flat=True).distinct())
+            # Users being moved are left to the move itself.
+            misplaced = UserShard.objects.filter(user_id__in=owners, migrating=False).exclude(alias=alias)
+            for user_id in misplaced.values_list('user_id', flat=True):
+                self._delete_rows(user_id, alias)
+                deleted += 1
+        self.stdout.write(f"Removed leftover rows of {deleted} users.")
+
+    def _count_rows(self, user_id, alias):
+        return {
+            model: model._base_manager.using(alias).filter(**{lookup: user_id}).count()
+            for model, lookup, _ in USER_ROWS
+        }
+
+    def _delete_rows(self, user_id, alias):
+        # Only rows are removed; media files are shared by all shards.
+        with transaction.atomic(using=alias):
+            for model in USER_ROOTS:
+                model._base_manager.using(alias).filter(user_id=user_id).delete()
+
+    def _copy(self, model, lookup, user_id, source, target, keep_pk, batch_size):
+        """Copy ``model`` rows matching ``lookup`` as stored (raw inserts skip auto_now and signals)."""
+        fields = [field for field in model._meta.concrete_fields if keep_pk or not field.primary_key]
+        rows = model._base_manager.using(source).filter(**{lookup: user_id}).order_by('pk')
+        batch = []
+        copied = 0
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) == batch_size:
+                model._base_manager._insert(batch, fields=fields, using=target, raw=True)
+                copied += len(batch)
+                batch = []
+        if batch:
+            model._base_manager._insert(batch, fields=fields, using=target, raw=True)
+            copied += len(batch)
+        return copied
@@ -0,0 +1,148 @@
+import gzip
+import re
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered.
+    brotli = None
+
+# JSON, YAML, iCalendar, CSS and JS. HTML is left alone: the admin and browsable API
+# pages embed CSRF tokens, which compression would expose to BREACH-style attacks.
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(application/(json|[\w.+-]+\+json|javascript|yaml|x-yaml|xml)|text/(calendar|css|javascript|plain|yaml))\b'
+)
+
+
+class AdmissionControlMiddleware:
+    """
+    Caps the number of API requests a worker process handles at once. When the
+    cap is reached, new requests are shed immediately with a 429 and Retry-After
+    instead of queueing behind a saturated database. Works under WSGI and ASGI;
+    streamed responses release their slot once the view has returned.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        limit = getattr(settings, 'ADMISSION_MAX_INFLIGHT_REQUESTS', None)
+        self.slots = threading.BoundedSemaphore(limit) if limit else None
+        self.prefix = getattr(settings, 'ADMISSION_PATH_PREFIX', '/api/')
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.slots is None or not request.path.startswith(self.prefix):
+            return self.get_response(request)
+
+        if not self.slots.acquire(blocking=False):
+            return self.busy_response()
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
+
+    async def __acall__(self, request):
+        if self.slots is None or not request.path.startswith(self.prefix):
+            return await self.get_response(request)
+
+        if not self.slots.acquire(blocking=False):
+            return self.busy_response()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.slots.release()
+
+    def busy_response(self):
+        response = JsonResponse(
+            {"detail": "Server is busy, please retry shortly."}, status=429
+        )
+        response['Retry-After'] = str(getattr(settings, 'ADMISSION_RETRY_AFTER', 1))
+        return response
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses responses with brotli (when installed) or gzip, whichever the client
+    prefers in Accept-Encoding, once the body reaches COMPRESSION_MIN_SIZE bytes.
+    Responses that already carry a Content-Encoding (the schema and iCalendar views
+    serve pre-compressed bodies) and streamed responses are passed through, as are
+    the views in COMPRESSION_EXCLUDED_VIEWS, whose bodies carry credentials.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+        self.excluded_views = frozenset(getattr(settings, 'COMPRESSION_EXCLUDED_VIEWS', ()))
+
+    def process_response(self, request, response):
+        match = getattr(request, 'resolver_match', None)
+        if (
+            (match is not None and match.view_name in self.excluded_views)
+            or response.streaming
+            or response.has_header('Content-Encoding')
+            or not COMPRESSIBLE_TYPES.match(response.get('Content-Type', ''))
+            or len(response.content) < self.min_size
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        else:
+            compressed = gzip.compress(response.content, compresslevel=self.gzip_level, mtime=0)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The representation changed, so a strong validator must not be reused.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = f'W/{etag}'
+        return response
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick 'br' or 'gzip' from an Accept-Encoding header, honouring q-values and
+    preferring brotli on ties. Returns None if neither is acceptable.
+    """
+    offered = ('br', 'gzip') if brotli is not None else ('gzip',)
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.strip().lower()] = q
+
+    default = qualities.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = qualities.get(coding, default)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_remove_task_category"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="task",
+            name="recurrence_end",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="recurrence_rule",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name="TaskOccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("original_date", models.DateTimeField()),
+                ("due_date", models.DateTimeField(blank=True, null=True)),
+                ("is_completed", models.BooleanField(default=False)),
+                ("is_cancelled", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="occurrence_overrides",
+                        to="api.task",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["original_date"],
+                "unique_together": {("task", "original_date")},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:34
+
+import api.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_calendar_feed"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="note",
+            name="content",
+            field=api.fields.HTMLField(),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="description",
+            field=api.fields.HTMLField(),
+        ),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:40
+
+import api.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Rows copied per query; each chunk is committed on its own (the migration is not
+# atomic) so large tables are converted without one huge transaction.
+CHUNK_SIZE = 1000
+
+BODIES = [
+    ("Note", "NoteBody", "content", "note"),
+    ("Task", "TaskBody", "description", "task"),
+]
+
+
+def copy_to_side_tables(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    for model_name, body_name, source, owner in BODIES:
+        model = apps.get_model("api", model_name)
+        body_model = apps.get_model("api", body_name)
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.using(alias)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", source)[:CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            body_model.objects.using(alias).bulk_create(
+                body_model(**{f"{owner}_id": pk, "text": text}) for pk, text in rows
+            )
+            last_pk = rows[-1][0]
+
+
+def copy_from_side_tables(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    for model_name, body_name, source, owner in BODIES:
+        model = apps.get_model("api", model_name)
+        body_model = apps.get_model("api", body_name)
+        last_pk = 0
+        while True:
+            bodies = list(
+                body_model.objects.using(alias)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")[:CHUNK_SIZE]
+            )
+            if not bodies:
+                break
+            for body in bodies:
+                model.objects.using(alias).filter(pk=body.pk).update(
+                    **{source: body.text}
+                )
+            last_pk = bodies[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("api", "0007_soft_delete"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NoteBody",
+            fields=[
+                ("text", api.fields.CompressedHTMLField()),
+                (
+                    "note",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="body",
+                        serialize=False,
+                        to="api.note",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="TaskBody",
+            fields=[
+                ("text", api.fields.CompressedHTMLField()),
+                (
+                    "task",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="body",
+                        serialize=False,
+                        to="api.task",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.RunPython(copy_to_side_tables, copy_from_side_tables),
+        # Give the old columns a default so the migration can be reversed on
+        # tables that already have rows.
+        migrations.AlterField(
+            model_name="note",
+            name="content",
+            field=api.fields.HTMLField(default=""),
+        ),
+        migrations.AlterField(
+            model_name="task",
+            name="description",
+            field=api.fields.HTMLField(default=""),
+        ),
+        migrations.RemoveField(
+            model_name="note",
+            name="content",
+        ),
+        migrations.RemoveField(
+            model_name="task",
+            name="description",
+        ),
+    ]
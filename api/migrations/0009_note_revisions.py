@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:46
+
+import api.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_html_body_side_tables"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="revision",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="NoteRevision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField()),
+                ("is_snapshot", models.BooleanField(default=False)),
+                ("data", api.fields.CompressedHTMLField()),
+                ("length", models.PositiveIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "note",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="revisions",
+                        to="api.note",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-number"],
+                "unique_together": {("note", "number")},
+            },
+        ),
+    ]
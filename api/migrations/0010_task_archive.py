@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:53
+
+import api.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_completed_at(apps, schema_editor):
+    # Best available estimate for tasks completed before completed_at existed.
+    Task = apps.get_model("api", "Task")
+    Task.objects.using(schema_editor.connection.alias).filter(
+        is_completed=True, completed_at__isnull=True
+    ).update(completed_at=models.F("updated_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_note_revisions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTask",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("title", models.CharField(max_length=255)),
+                ("description", api.fields.CompressedHTMLField(blank=True)),
+                ("due_date", models.DateTimeField()),
+                ("completed_at", models.DateTimeField()),
+                ("recurrence_rule", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-completed_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="task",
+            name="completed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["is_completed", "completed_at"],
+                name="api_task_is_comp_734899_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedtask",
+            name="shared_with",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="shared_archived_tasks",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="archivedtask",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="archived_tasks",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedtask",
+            index=models.Index(
+                fields=["user", "completed_at"], name="api_archive_user_id_83fa4c_idx"
+            ),
+        ),
+    ]
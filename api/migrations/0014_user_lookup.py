@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Users indexed per query while backfilling.
+CHUNK_SIZE = 1000
+
+
+def fill_lookup(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    User = apps.get_model("auth", "User")
+    UserLookup = apps.get_model("api", "UserLookup")
+    last_pk = 0
+    while True:
+        rows = list(
+            User.objects.using(alias)
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "email", "username")[:CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        UserLookup.objects.using(alias).bulk_create(
+            UserLookup(
+                user_id=pk,
+                email=(email or "").strip().casefold(),
+                username=(username or "").strip().casefold(),
+            )
+            for pk, email, username in rows
+        )
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0013_sharding"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserLookup",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="lookup",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("email", models.CharField(db_index=True, max_length=254)),
+                ("username", models.CharField(db_index=True, max_length=150)),
+            ],
+        ),
+        migrations.RunPython(fill_lookup, migrations.RunPython.noop),
+    ]
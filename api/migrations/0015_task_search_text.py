@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:21
+
+from html import unescape
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# Rows converted per query; each chunk is committed on its own (the migration is not
+# atomic) so large tables are filled without one huge transaction.
+CHUNK_SIZE = 1000
+
+SOURCES = [
+    ("TaskBody", "text"),
+    ("ArchivedTask", "description"),
+]
+
+
+def plain_text(html):
+    # A copy of api.models.plain_text as it was when this migration was written.
+    return " ".join(unescape(strip_tags(html)).split())
+
+
+def fill_search_text(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    for model_name, source in SOURCES:
+        model = apps.get_model("api", model_name)
+        last_pk = 0
+        while True:
+            rows = list(
+                model.objects.using(alias)
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", source)[:CHUNK_SIZE]
+            )
+            if not rows:
+                break
+            for row in rows:
+                row.search_text = plain_text(getattr(row, source))
+            model.objects.using(alias).bulk_update(rows, ["search_text"])
+            last_pk = rows[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("api", "0014_user_lookup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedtask",
+            name="search_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="taskbody",
+            name="search_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,188 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import permissions, status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+from . import sharding
+from .routers import is_sticky, mark_write, replica_reads
+
+
+# The `ReplicaReadMixin` class lets list/detail views serve safe-method requests from a
+# read replica. A user who wrote within REPLICA_STICKY_SECONDS keeps reading from the
+# primary so they always see their own changes.
+class ReplicaReadMixin:
+    _replica_context = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS and not is_sticky(request.user):
+            self._replica_context = replica_reads()
+            self._replica_context.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._replica_context is not None:
+            self._replica_context.__exit__(None, None, None)
+            self._replica_context = None
+        elif request.method not in permissions.SAFE_METHODS and request.user.is_authenticated:
+            if response.status_code < 400:
+                mark_write(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ShardMigrating(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Your data is being moved to another server; try again in a moment."
+    default_code = 'shard_migrating'
+
+
+# The `ShardMixin` class routes a view's queries to the shard holding the caller's data
+# (see api.sharding). Views of one note or task set ``shard_kind``: when the object in
+# the URL is shared with the caller from another shard, it is served from that shard.
+class ShardMixin:
+    shard_kind = None
+    _shard_context = None
+
+    def get_shard(self):
+        """
+        The shard to serve the request from. Writes check the owner of the rows they
+        touch against the directory itself (see sharding.check_writable), so a move
+        in progress or a placement cached before it cannot let them through.
+        """
+        user = self.request.user
+        if not user.is_authenticated:
+            return 'default'
+        writing = self.request.method not in permissions.SAFE_METHODS
+        if self.shard_kind and 'pk' in self.kwargs:
+            shared = sharding.shared_object(user.pk, self.shard_kind, self.kwargs['pk'])
+            if shared is not None:
+                shard, owner_id = shared
+                if writing:
+                    sharding.check_writable(owner_id)
+                return shard
+        if writing:
+            return sharding.check_writable(user.pk)
+        return sharding.shard_for_user(user.pk)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        try:
+            shard = self.get_shard()
+        except sharding.UserMigrating:
+            raise ShardMigrating()
+        self._shard_context = sharding.use_shard(shard)
+        self._shard_context.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._shard_context is not None:
+            self._shard_context.__exit__(None, None, None)
+            self._shard_context = None
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# The `ShardedListMixin` class adds the objects shared with the caller from other shards
+# to a list view: their ids come from the SharedAccess index, each shard is queried by
+# primary key through the view's queryset and filters, and the results are merged for
+# pagination.
+class ShardedListMixin(ShardMixin):
+    def get_remote_queryset(self, ids):
+        """
+        The view's queryset narrowed to the shared objects ``ids``, for another shard.
+        It keeps the view's visibility filter, so an index entry for a share that has
+        since been revoked matches nothing.
+        """
+        return self.get_queryset().filter(pk__in=ids)
+
+    def list(self, request, *args, **kwargs):
+        remote = sharding.remote_shares(request.user.pk, self.shard_kind, sharding.current_shard())
+        if not remote:
+            return super().list(request, *args, **kwargs)
+        querysets = [self.filter_queryset(self.get_queryset())]
+        for alias, ids in remote.items():
+            querysets.append(self.filter_queryset(self.get_remote_queryset(ids).using(alias)))
+        results = sharding.ShardedResults(querysets)
+        page = self.paginate_queryset(results)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(results, many=True).data)
+
+
+class IdempotencyKeyInvalid(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = "Idempotency-Key must be 1 to 255 characters."
+    default_code = 'idempotency_key_invalid'
+
+
+class IdempotencyKeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed; retry shortly."
+    default_code = 'idempotency_key_in_use'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used with a different request body."
+    default_code = 'idempotency_key_reused'
+
+
+def request_fingerprint(request):
+    """Digest of the parsed request body; uploaded files count by name and size."""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = {
+            key: [(value.name, value.size) if hasattr(value, 'read') else value for value in values]
+            for key, values in data.lists()
+        }
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+# The `IdempotentCreateMixin` class lets clients retry a create safely by sending an
+# ``Idempotency-Key`` header. The first successful response is stored (per user, path
+# and key) in the `idempotency` cache for IDEMPOTENCY_KEY_TTL; a retry gets that
+# response back without running the serializer, the insert or the share emails again.
+# A short cache.add() lock turns concurrent duplicates into 409s instead of inserts.
+class IdempotentCreateMixin:
+    idempotency_header = 'Idempotency-Key'
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(self.idempotency_header)
+        if key is None:
+            return super().create(request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            raise IdempotencyKeyInvalid()
+
+        store = caches['idempotency']
+        scope = hashlib.sha256(f"{request.path}\n{key}".encode()).hexdigest()
+        response_key = f"response:{request.user.pk}:{scope}"
+        lock_key = f"lock:{request.user.pk}:{scope}"
+        fingerprint = request_fingerprint(request)
+
+        stored = store.get(response_key)
+        if stored is None:
+            if not store.add(lock_key, fingerprint, settings.IDEMPOTENCY_LOCK_SECONDS):
+                raise IdempotencyKeyInUse()
+            try:
+                # The first request may have finished between the read above and the lock.
+                stored = store.get(response_key)
+                if stored is None:
+                    response = super().create(request, *args, **kwargs)
+                    if status.is_success(response.status_code):
+                        store.set(response_key, {
+                            'fingerprint': fingerprint,
+                            'status': response.status_code,
+                            'data': response.data,
+                            'headers': {name: value for name, value in response.items()},
+                        })
+                    return response
+            finally:
+                store.delete(lock_key)
+
+        if stored['fingerprint'] != fingerprint:
+            raise IdempotencyKeyReused()
+        response = Response(stored['data'], status=stored['status'], headers=stored['headers'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
@@ -1,8 +1,108 @@
-from django.db import models
+import functools
+import secrets
+from html import unescape
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, router, transaction
+from django.utils import timezone
+from django.utils.html import strip_tags
 from django.contrib.auth.models import User
-from tinymce.models import HTMLField
+from .fields import CompressedHTMLField
+from . import quota, recurrence, revisions
 
-class Category(models.Model):
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        return self.update(deleted_at=timezone.now())
+
+    def restore(self):
+        return self.update(deleted_at=None)
+
+    def deleted(self):
+        return self.filter(deleted_at__isnull=False)
+
+    def visible_to(self, user):
+        """Rows owned by or shared with ``user`` (for models with a ``shared_with`` relation)."""
+        # A subquery on the share table instead of a join, so no DISTINCT (over the
+        # whole row, select_related bodies included) is needed.
+        through = self.model.shared_with.through
+        shared = through.objects.filter(user=user).values(f'{self.model._meta.model_name}_id')
+        return self.filter(models.Q(user=user) | models.Q(pk__in=shared))
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Default manager that hides soft-deleted rows."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+# The `SoftDeleteModel` class marks rows as deleted instead of removing them, so a delete
+# is one indexed UPDATE. `objects` hides deleted rows everywhere (including reverse relations);
+# `all_objects` sees them for the trash and the background purge (api.task.purge_*).
+class SoftDeleteModel(models.Model):
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+
+    def restore(self):
+        self.deleted_at = None
+        self.save(update_fields=['deleted_at'])
+
+
+def body_property(name):
+    """
+    Expose the HTML kept in the owner's ``body`` side-table row as the attribute
+    ``name``. The row is only fetched on first access (list endpoints never touch
+    it; detail endpoints join it with select_related('body')), and an assigned
+    value is written back by save_body().
+    """
+    def getter(self):
+        if name not in self.__dict__:
+            try:
+                self.__dict__[name] = self.body.text
+            except ObjectDoesNotExist:
+                self.__dict__[name] = ''
+        return self.__dict__[name]
+
+    def setter(self, value):
+        if '_body_changed' not in self.__dict__:
+            # Keep the stored value so save() can tell what changed (note revisions).
+            self.__dict__['_body_previous'] = getter(self) if self.pk else None
+        self.__dict__[name] = value
+        self.__dict__['_body_changed'] = name
+
+    return property(getter, setter)
+
+
+def save_body(instance):
+    previous = instance.__dict__.pop('_body_previous', None)
+    name = instance.__dict__.pop('_body_changed', None)
+    if name is None:
+        return
+    text = instance.__dict__[name]
+    relation = instance._meta.get_field('body')
+    values = relation.related_model.values_for(text)
+    relation.related_model.objects.update_or_create(**{relation.field.name: instance}, defaults=values)
+    StorageUsage.add(instance.user_id, content=values['size'] - len((previous or '').encode('utf-8')))
+
+
+def plain_text(html):
+    """``html`` without tags, with entities decoded and whitespace collapsed."""
+    return ' '.join(unescape(strip_tags(html)).split())
+
+
+class Category(SoftDeleteModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -15,31 +115,488 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Note(models.Model):
+# The `StorageUsage` model keeps running totals of what each user stores: the HTML bodies
+# of their notes and tasks (UTF-8 bytes) and note attachments. Saves and purges adjust it
+# with F() updates; api.task.reconcile_storage_usage repairs drift.
+class StorageUsage(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    content_bytes = models.BigIntegerField(default=0)
+    file_bytes = models.BigIntegerField(default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user}: {self.total_bytes} bytes"
+
+    @property
+    def total_bytes(self):
+        return self.content_bytes + self.file_bytes
+
+    @classmethod
+    def add(cls, user_id, content=0, files=0):
+        """Add the given byte deltas to ``user_id``'s counters, creating the row on first use."""
+        if not content and not files:
+            return
+        changes = {
+            'content_bytes': models.F('content_bytes') + content,
+            'file_bytes': models.F('file_bytes') + files,
+        }
+        if not cls.objects.filter(user_id=user_id).update(**changes):
+            cls.objects.get_or_create(user_id=user_id)
+            cls.objects.filter(user_id=user_id).update(**changes)
+
+
+# The `Tag` model is a user-defined label for notes and tasks. NoteTag and TaskTag map tags
+# to objects; their (tag, object) unique key doubles as the inverted index for tag filters.
+class Tag(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
+    name = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'name')
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+# The `TagFacet` model holds, per viewer, how many of the notes and tasks they can see
+# (own and shared, outside the trash) carry each tag. api.tags keeps it up to date.
+class TagFacet(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tag_facets')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='facets')
+    notes_count = models.IntegerField(default=0)
+    tasks_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'tag')
+
+    def __str__(self):
+        return f"{self.tag} for {self.user}"
+
+
+class Note(SoftDeleteModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notes')
     title = models.CharField(max_length=255)
-    content = HTMLField()
+    content = body_property('content')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='notes')
     image = models.ImageField(upload_to='notes/images/', null=True, blank=True)
     file = models.FileField(upload_to='notes/files/', null=True, blank=True)
     is_shared = models.BooleanField(default=False)
     shared_with = models.ManyToManyField(User, related_name='shared_notes', blank=True)
+    tags = models.ManyToManyField(Tag, through='NoteTag', related_name='notes', blank=True)
+    # Number of the latest NoteRevision; clients send it back as base_revision with patches.
+    revision = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)  
 
+    ATTACHMENT_FIELDS = ('image', 'file')
+
     def __str__(self):
         return self.title
-    
-class Task(models.Model):
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored attachments so save() can account for replaced files.
+        instance._stored_attachments = {
+            name: getattr(instance, name).name or ''
+            for name in cls.ATTACHMENT_FIELDS if name in instance.__dict__
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous = self.__dict__.get('_body_previous')
+        changed = '_body_changed' in self.__dict__ and previous != self.content
+        stored = getattr(self, '_stored_attachments', {})
+        replaced = []
+        file_delta = 0
+        for name in self.ATTACHMENT_FIELDS:
+            if name not in self.__dict__:
+                continue
+            attachment = getattr(self, name)
+            old_name = stored.get(name, '')
+            if (attachment.name or '') == old_name:
+                continue
+            file_delta += quota.attachment_size(attachment)
+            if old_name:
+                file_delta -= quota.file_size(attachment.storage, old_name)
+                replaced.append((attachment.storage, old_name))
+        using = kwargs.get('using') or router.db_for_write(Note, instance=self)
+        with transaction.atomic(using=using):
+            if changed:
+                # Claim the next revision number with a conditional UPDATE: a concurrent
+                # save that got there first leaves no row at our revision to update.
+                if not self._state.adding and not Note._base_manager.using(using).filter(
+                    pk=self.pk, revision=self.revision
+                ).update(revision=models.F('revision') + 1):
+                    raise revisions.RevisionConflict(f"Note {self.pk} changed after revision {self.revision}.")
+                self.revision += 1
+            super().save(*args, **kwargs)
+            save_body(self)
+            if changed:
+                NoteRevision.record(self, previous)
+            StorageUsage.add(self.user_id, files=file_delta)
+            for storage, name in replaced:
+                transaction.on_commit(functools.partial(storage.delete, name), using=using)
+        self._stored_attachments = {
+            name: getattr(self, name).name or '' for name in self.ATTACHMENT_FIELDS if name in self.__dict__
+        }
+
+class Task(SoftDeleteModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tasks')
     title = models.CharField(max_length=255)
-    description = HTMLField()
+    description = body_property('description')
     due_date = models.DateTimeField()
     is_completed = models.BooleanField(default=False)
+    # When is_completed was last set; drives archiving (api.task.archive_completed_tasks).
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # RFC 5545 RRULE (e.g. "FREQ=WEEKLY;BYDAY=MO"); due_date is the first occurrence.
+    recurrence_rule = models.CharField(max_length=255, blank=True)
+    # Last occurrence of a bounded series, kept so the reminder scan can filter in SQL.
+    recurrence_end = models.DateTimeField(null=True, blank=True)
     shared_with = models.ManyToManyField(User, related_name='shared_tasks', blank=True)
+    tags = models.ManyToManyField(Tag, through='TaskTag', related_name='tasks', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True) 
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'due_date']),
+            models.Index(fields=['due_date']),
+            models.Index(fields=['is_completed', 'completed_at']),
+        ]
+
     def __str__(self):
         return self.title
-    
\ No newline at end of file
+
+    # Fields recurrence_end is derived from.
+    SCHEDULE_FIELDS = ('recurrence_rule', 'due_date')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored schedule so save() only re-walks the series when it changes.
+        instance._stored_schedule = {
+            name: instance.__dict__[name] for name in cls.SCHEDULE_FIELDS if name in instance.__dict__
+        }
+        return instance
+
+    @property
+    def is_recurring(self):
+        return bool(self.recurrence_rule)
+
+    def _schedule_changed(self, update_fields):
+        if update_fields is not None:
+            return bool(set(self.SCHEDULE_FIELDS) & set(update_fields))
+        stored = getattr(self, '_stored_schedule', None)
+        if stored is None:
+            return True
+        return any(
+            name in self.__dict__ and (name not in stored or stored[name] != self.__dict__[name])
+            for name in self.SCHEDULE_FIELDS
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if self._schedule_changed(update_fields):
+            # Rules are validated (caps included) by TaskSerializer; here only the
+            # syntax is, so tasks stored before the caps can still be saved.
+            if self.is_recurring:
+                self.recurrence_end = recurrence.series_end(self.recurrence_rule, self.due_date, strict=False)
+            else:
+                self.recurrence_end = None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'recurrence_end'}
+        if not self.is_completed:
+            self.completed_at = None
+        elif self.completed_at is None:
+            self.completed_at = timezone.now()
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Task, instance=self)):
+            super().save(*args, **kwargs)
+            save_body(self)
+        self._stored_schedule = {name: self.__dict__[name] for name in self.SCHEDULE_FIELDS if name in self.__dict__}
+
+    def occurrences(self, start, end, overrides=None):
+        """
+        Expand the occurrences of this task that fall between ``start`` and ``end``.
+        Stored overrides (completions, cancellations, reschedules) are merged in;
+        everything else is returned as unsaved TaskOccurrence instances.
+        """
+        if overrides is None:
+            overrides = self.occurrence_overrides.filter(
+                models.Q(original_date__range=(start, end)) |
+                models.Q(due_date__range=(start, end))
+            )
+        by_date = {override.original_date: override for override in overrides}
+
+        if self.is_recurring:
+            dates = recurrence.expand_dates(self.recurrence_rule, self.due_date, start, end)
+        else:
+            dates = [self.due_date] if start <= self.due_date <= end else []
+
+        occurrences = []
+        for date in dates:
+            occurrence = by_date.pop(date, None) or TaskOccurrence(
+                task=self, original_date=date, is_completed=self.is_completed
+            )
+            occurrences.append(occurrence)
+        # Occurrences rescheduled into the window from outside it.
+        occurrences.extend(by_date.values())
+
+        result = []
+        for occurrence in occurrences:
+            if occurrence.due_date is None:
+                occurrence.due_date = occurrence.original_date
+            if start <= occurrence.due_date <= end:
+                result.append(occurrence)
+        return sorted(result, key=lambda occurrence: occurrence.due_date)
+
+    def next_occurrence(self, after, before, overrides=None):
+        """
+        Return the first pending (not completed, not cancelled) occurrence
+        between ``after`` and ``before``, or None.
+        """
+        if self.is_completed:
+            return None
+        for occurrence in self.occurrences(after, before, overrides=overrides):
+            if not occurrence.is_completed and not occurrence.is_cancelled:
+                return occurrence
+        return None
+
+
+class NoteTag(models.Model):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    note = models.ForeignKey(Note, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('tag', 'note')
+
+
+class TaskTag(models.Model):
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('tag', 'task')
+
+
+# The `ArchivedTask` model is cold storage for tasks completed more than
+# TASK_ARCHIVE_AFTER_DAYS ago. api.task.archive_completed_tasks moves them here (keeping
+# their id) so api_task and its indexes only hold the active set.
+class ArchivedTaskQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        # A subquery on the share table instead of a join, so no DISTINCT over the
+        # description blob is needed.
+        shared = ArchivedTask.shared_with.through.objects.filter(user=user).values('archivedtask_id')
+        return self.filter(models.Q(user=user) | models.Q(pk__in=shared))
+
+
+class ArchivedTask(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_tasks')
+    title = models.CharField(max_length=255)
+    description = CompressedHTMLField(blank=True)
+    # Copied from TaskBody.search_text so archived tasks can be searched too.
+    search_text = models.TextField(blank=True, default='')
+    due_date = models.DateTimeField()
+    completed_at = models.DateTimeField()
+    recurrence_rule = models.CharField(max_length=255, blank=True)
+    shared_with = models.ManyToManyField(User, related_name='shared_archived_tasks', blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ArchivedTaskQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['user', 'completed_at']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+# The `NoteBody` and `TaskBody` side tables hold the (often very large) HTML bodies, so
+# the hot api_note / api_task rows stay small for list scans and the buffer pool.
+class HTMLBody(models.Model):
+    text = CompressedHTMLField()
+    # UTF-8 size of ``text`` for storage accounting; null on rows written before it existed.
+    size = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def values_for(cls, text):
+        """Column values for a row holding ``text`` (save_body() writes them)."""
+        return {'text': text, 'size': len(text.encode('utf-8'))}
+
+
+class NoteBody(HTMLBody):
+    note = models.OneToOneField(Note, on_delete=models.CASCADE, primary_key=True, related_name='body')
+
+
+class TaskBody(HTMLBody):
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True, related_name='body')
+    # The description as plain text, uncompressed so ?search= can match it in SQL.
+    search_text = models.TextField(blank=True, default='')
+
+    @classmethod
+    def values_for(cls, text):
+        return {**super().values_for(text), 'search_text': plain_text(text)}
+
+
+# The `NoteRevision` model keeps the edit history of a note. Most revisions store a
+# compressed delta against the previous one; every revisions.SNAPSHOT_INTERVAL-th
+# revision (and any edit whose delta is not much smaller than the note) stores the
+# full content, so rebuilding a revision replays a short chain.
+class NoteRevision(models.Model):
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    is_snapshot = models.BooleanField(default=False)
+    # Full HTML for snapshots, revisions.encode()d delta otherwise.
+    data = CompressedHTMLField()
+    length = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('note', 'number')
+        ordering = ['-number']
+
+    def __str__(self):
+        return f"{self.note} r{self.number}"
+
+    @classmethod
+    def record(cls, note, previous):
+        """Store ``note.content`` as revision ``note.revision``, diffed against ``previous``."""
+        content = note.content
+        revision = cls(note=note, number=note.revision, length=len(content))
+        if previous is not None and (revision.number - 1) % revisions.SNAPSHOT_INTERVAL:
+            delta = revisions.encode(revisions.diff(previous, content))
+            if len(delta) < len(content) // 2:
+                revision.data = delta
+        if not revision.data:
+            revision.is_snapshot = True
+            revision.data = content
+        revision.save()
+        return revision
+
+    def get_content(self):
+        """Rebuild the note content as of this revision from the nearest snapshot."""
+        if self.is_snapshot:
+            return self.data
+        chain = list(
+            NoteRevision.objects.filter(note_id=self.note_id, number__lte=self.number).filter(
+                number__gte=models.Subquery(
+                    NoteRevision.objects.filter(
+                        note_id=self.note_id, is_snapshot=True, number__lte=self.number
+                    ).order_by('-number').values('number')[:1]
+                )
+            ).order_by('number')
+        )
+        content = chain[0].data
+        for revision in chain[1:]:
+            content = revisions.apply(content, revisions.decode(revision.data))
+        return content
+
+
+# The `TaskOccurrence` model stores only the exceptions of a recurring task: occurrences
+# that were completed, cancelled or moved. Plain occurrences are never written to the table.
+class TaskOccurrence(models.Model):
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='occurrence_overrides')
+    original_date = models.DateTimeField()
+    due_date = models.DateTimeField(null=True, blank=True)
+    is_completed = models.BooleanField(default=False)
+    is_cancelled = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('task', 'original_date')
+        ordering = ['original_date']
+
+    def __str__(self):
+        return f"{self.task} @ {self.original_date:%Y-%m-%d %H:%M}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Bump the parent so calendar validators (ETags, cached events) change too.
+        Task.objects.filter(pk=self.task_id).update(updated_at=timezone.now())
+
+
+# The `CalendarFeedToken` model holds the secret that authenticates a user's iCalendar
+# feed URL, since calendar clients cannot send our Authorization header.
+class CalendarFeedToken(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_feed_token')
+    token = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Calendar feed for {self.user}"
+
+    def rotate(self):
+        self.token = secrets.token_urlsafe(32)
+        self.save()
+
+    @classmethod
+    def for_user(cls, user):
+        feed_token, created = cls.objects.get_or_create(
+            user=user, defaults={'token': secrets.token_urlsafe(32)}
+        )
+        return feed_token
+    
+
+# The models below live only in the `default` database, whatever the number of shards
+# (see api.sharding). `UserShard` is the directory of which shard holds a user's
+# categories, tags, notes and tasks.
+class UserShard(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=64)
+    # Set by rebalance_shards while the user's rows are being copied; writes are refused.
+    migrating = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user} on {self.alias}"
+
+
+# The `SharedAccess` model is the access index for sharing across shards: one row per
+# (user, object shared with them), recording the shard the object lives on, so a user's
+# lists can fetch shared notes and tasks from their owners' shards by primary key.
+class SharedAccess(models.Model):
+    KIND_CHOICES = [('note', 'Note'), ('task', 'Task'), ('archivedtask', 'Archived task')]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shared_access')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    owner_id = models.IntegerField(db_index=True)
+    alias = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('user', 'kind', 'object_id')
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} for {self.user}"
+
+
+# The `IdSequence` model hands out primary keys in blocks for sharded models, so
+# ids stay unique across shards and rows can move between them unchanged.
+class IdSequence(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+# The `UserLookup` model is the prefix index behind the share-recipient typeahead: the
+# casefolded email and username of every user, each with its own index, so
+# ``startswith`` lookups are index range scans (see api.typeahead). Lives in `default`.
+class UserLookup(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='lookup')
+    email = models.CharField(max_length=254, db_index=True)
+    username = models.CharField(max_length=150, db_index=True)
+
+    def __str__(self):
+        return self.email or self.username
@@ -1,14 +1,22 @@
 from rest_framework import permissions
 
+
+def is_shared_with(obj, user):
+    """Membership test on ``obj.shared_with``: the prefetched list if loaded, else one indexed EXISTS."""
+    if 'shared_with' in getattr(obj, '_prefetched_objects_cache', {}):
+        return any(shared.pk == user.pk for shared in obj.shared_with.all())
+    return obj.shared_with.filter(pk=user.pk).exists()
+
+
 # The `IsOwnerOrSharedWith` class defines a custom permission in Django REST framework that checks if
 # the requesting user is the owner of an object or if the object is shared with the user.
 class IsOwnerOrSharedWith(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-    # SAFE_METHODS are GET, HEAD, OPTIONS
-        if request.method in permissions.SAFE_METHODS:
-            return obj.user == request.user or request.user in obj.shared_with.all()
-        # Write permissions are only allowed to the owner
-        return obj.user == request.user
+        # Compare ids: obj.user would load the owner row just to compare it.
+        if obj.user_id == request.user.pk:
+            return True
+        # SAFE_METHODS are GET, HEAD, OPTIONS; write permissions are only allowed to the owner
+        return request.method in permissions.SAFE_METHODS and is_shared_with(obj, request.user)
 
 class IsOwnerCategory(permissions.BasePermission):
     """
@@ -16,4 +24,4 @@ class IsOwnerCategory(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
\ No newline at end of file
+        return obj.user_id == request.user.pk
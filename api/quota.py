@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def file_size(storage, name):
+    """Size of a stored file, or 0 if it has gone missing."""
+    try:
+        return storage.size(name)
+    except OSError:
+        return 0
+
+
+def attachment_size(attachment):
+    """Size of a FieldFile, whether it is a pending upload or already stored."""
+    if not attachment:
+        return 0
+    if not attachment._committed:
+        return attachment.size
+    return file_size(attachment.storage, attachment.name)
+
+
+def exceeds_quota(user_id, extra_bytes):
+    """
+    Whether storing ``extra_bytes`` more would take ``user_id`` over STORAGE_QUOTA_BYTES.
+    One primary-key read of the maintained counters; nothing is summed.
+    """
+    from .models import StorageUsage
+
+    limit = settings.STORAGE_QUOTA_BYTES
+    if limit is None or extra_bytes <= 0:
+        return False
+    counters = StorageUsage.objects.filter(user_id=user_id).values_list('content_bytes', 'file_bytes').first()
+    return sum(counters or ()) + extra_bytes > limit
+
+
+def measure(user_id):
+    """
+    Recompute ``user_id``'s usage from the stored rows and files; returns
+    (content_bytes, file_bytes). Body rows without a recorded size are sized
+    (and updated) on the way.
+    """
+    from .models import Note, NoteBody, Task, TaskBody
+
+    content = 0
+    for body_model, owner in ((NoteBody, 'note'), (TaskBody, 'task')):
+        bodies = body_model.objects.filter(**{f'{owner}__user_id': user_id})
+        unsized = list(bodies.filter(size__isnull=True))
+        for body in unsized:
+            body.size = len(body.text.encode('utf-8'))
+        body_model.objects.bulk_update(unsized, ['size'], batch_size=500)
+        content += bodies.aggregate(total=Sum('size'))['total'] or 0
+
+    files = 0
+    attachments = Note._base_manager.filter(user_id=user_id).values_list(*Note.ATTACHMENT_FIELDS)
+    for names in attachments.iterator(chunk_size=500):
+        for field_name, name in zip(Note.ATTACHMENT_FIELDS, names):
+            if name:
+                files += file_size(Note._meta.get_field(field_name).storage, name)
+    return content, files
+
+
+def reconcile(user_id):
+    """Overwrite ``user_id``'s counters with measured values; returns the drift that was corrected."""
+    from .models import StorageUsage
+
+    with transaction.atomic(using=router.db_for_write(StorageUsage)):
+        StorageUsage.objects.get_or_create(user_id=user_id)
+        usage = StorageUsage.objects.select_for_update().get(user_id=user_id)
+        content, files = measure(user_id)
+        drift = (content + files) - usage.total_bytes
+        usage.content_bytes, usage.file_bytes = content, files
+        usage.reconciled_at = timezone.now()
+        usage.save()
+    return drift
@@ -0,0 +1,136 @@
+from datetime import timedelta
+from itertools import islice
+
+from dateutil import parser
+from dateutil.rrule import rrule, rrulestr
+
+# Hard caps so a single request can never expand an unbounded series.
+MAX_WINDOW = timedelta(days=366)
+MAX_OCCURRENCES = 500
+
+# Caps on the rules themselves, so the end of any series can be found by walking at
+# most one occurrence a day for MAX_SPAN (Task.save does this when the schedule changes).
+MAX_COUNT = 1000
+MAX_SPAN = timedelta(days=366 * 100)
+SUB_DAILY = {'SECONDLY', 'MINUTELY', 'HOURLY'}
+
+# Day filters not accepted with these frequencies (most are not defined for them by
+# RFC 5545). Combined, they can match no day at all, and dateutil then walks every
+# day up to the year 9999 looking for one. Monthly and yearly rules are walked a
+# period at a time, so one that never matches is found out in well under a second.
+NOT_APPLICABLE = {
+    'DAILY': {'BYMONTHDAY', 'BYYEARDAY', 'BYWEEKNO', 'BYSETPOS', 'BYEASTER'},
+    'WEEKLY': {'BYMONTHDAY', 'BYYEARDAY', 'BYWEEKNO', 'BYSETPOS', 'BYEASTER'},
+    'MONTHLY': {'BYYEARDAY', 'BYWEEKNO'},
+}
+
+
+def _normalize(rule):
+    rule = rule.strip()
+    if rule.upper().startswith('RRULE:'):
+        rule = rule[len('RRULE:'):]
+    return rule
+
+
+def _parts(rule):
+    """The NAME=VALUE parts of a normalized rule, with upper-cased names."""
+    return {
+        name.strip().upper(): value.strip()
+        for name, _, value in (part.partition('=') for part in rule.split(';') if part.strip())
+    }
+
+
+def _parse(rule, dtstart):
+    try:
+        parsed = rrulestr(rule, dtstart=dtstart)
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Invalid recurrence rule: {exc}")
+    if not isinstance(parsed, rrule):
+        raise ValueError("Only a single RRULE is supported; store exceptions as occurrences.")
+    return parsed
+
+
+def parse_rule(rule, dtstart):
+    """
+    Parse an RFC 5545 RRULE string anchored at ``dtstart``.
+    Raises ValueError if the rule is malformed or exceeds the caps above.
+    """
+    rule = _normalize(rule)
+    parsed = _parse(rule, dtstart)
+    parts = _parts(rule)
+    freq = parts.get('FREQ', '').upper()
+    if freq in SUB_DAILY:
+        raise ValueError("Tasks may repeat at most once a day (FREQ=DAILY or coarser).")
+    for name in sorted(NOT_APPLICABLE.get(freq, set()) & set(parts)):
+        raise ValueError(f"{name} cannot be used with FREQ={freq}.")
+    if freq in ('DAILY', 'WEEKLY') and any(char.isdigit() for char in parts.get('BYDAY', '')):
+        raise ValueError(f"BYDAY cannot have ordinals with FREQ={freq}.")
+    if freq == 'DAILY' and 'BYDAY' in parts and int(parts.get('INTERVAL', 1)) % 7 == 0:
+        raise ValueError("Use FREQ=WEEKLY to repeat on weekdays every few weeks.")
+    for name in ('BYHOUR', 'BYMINUTE', 'BYSECOND'):
+        if ',' in parts.get(name, ''):
+            raise ValueError(f"{name} may only hold a single value.")
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise ValueError("COUNT and UNTIL may not both be set.")
+    if int(parts.get('COUNT', 0)) > MAX_COUNT:
+        raise ValueError(f"COUNT may not exceed {MAX_COUNT}.")
+    if 'UNTIL' in parts and parser.parse(parts['UNTIL']) > dtstart + MAX_SPAN:
+        raise ValueError(f"UNTIL may be at most {MAX_SPAN.days // 366} years after the first occurrence.")
+    return parsed
+
+
+def series_end(rule, dtstart, strict=True):
+    """
+    Return the last occurrence of a bounded series (UNTIL or COUNT), or None if
+    the series repeats forever. Raises ValueError if the rule never occurs, or if
+    a COUNT series runs past MAX_SPAN.
+
+    The series is walked without its COUNT and cut off at MAX_SPAN: at most
+    MAX_COUNT occurrences, or one a day for MAX_SPAN, instead of the whole series.
+
+    With ``strict=False`` only the syntax is checked, as in expand_dates(): rules
+    stored before the caps existed get the last occurrence within MAX_SPAN (or None
+    if there is none) instead of an error.
+    """
+    rule = _normalize(rule)
+    parsed = parse_rule(rule, dtstart) if strict else _parse(rule, dtstart)
+    parts = _parts(rule)
+    horizon = dtstart + MAX_SPAN
+    if 'UNTIL' in parts:
+        horizon = min(horizon, parser.parse(parts['UNTIL']))
+    bounded = parsed.replace(count=None, until=horizon)
+
+    if 'COUNT' not in parts and 'UNTIL' not in parts:
+        if strict and next(iter(bounded), None) is None:
+            raise ValueError("This rule produces no occurrences.")
+        return None
+
+    count = int(parts.get('COUNT', 0))
+    seen = 0
+    last = None
+    for last in islice(bounded, count or None):
+        seen += 1
+    if not strict:
+        return last
+    if last is None:
+        raise ValueError("This rule produces no occurrences.")
+    if count and seen < count:
+        raise ValueError(f"A COUNT series must end within {MAX_SPAN.days // 366} years of the first occurrence.")
+    return last
+
+
+def expand_dates(rule, dtstart, start, end, limit=MAX_OCCURRENCES):
+    """
+    Return the occurrence dates of ``rule`` between ``start`` and ``end``
+    (inclusive), without ever materialising the rest of the series.
+    """
+    if end - start > MAX_WINDOW:
+        raise ValueError(f"Requested window may not exceed {MAX_WINDOW.days} days.")
+    dates = []
+    # Only the syntax is checked here: the window and limit bound the walk, and rules
+    # stored before the caps existed must still expand.
+    for occurrence in _parse(_normalize(rule), dtstart).xafter(start, inc=True):
+        if occurrence > end or len(dates) >= limit:
+            break
+        dates.append(occurrence)
+    return dates
@@ -0,0 +1,100 @@
+import difflib
+import json
+import re
+
+# Every SNAPSHOT_INTERVAL-th revision stores the full content, so restoring any
+# revision replays at most SNAPSHOT_INTERVAL - 1 deltas.
+SNAPSHOT_INTERVAL = 20
+
+# Tags, words and whitespace runs: diffing HTML at this granularity is far cheaper
+# than per character and still yields small deltas for typical edits.
+TOKEN = re.compile(r'<[^>]*>|[^<\s]+|\s+|<')
+
+# Above this many changed tokens the middle is replaced wholesale instead of being
+# diffed (SequenceMatcher is quadratic); such a delta is stored as a snapshot anyway.
+MAX_DIFF_TOKENS = 5000
+
+
+class RevisionConflict(Exception):
+    """Raised when another save recorded a new revision since the note was read."""
+
+
+def diff(old, new):
+    """
+    Return a delta turning ``old`` into ``new`` as a list of operations:
+    a positive int copies that many characters from ``old``, a negative int
+    skips that many, and a string is inserted as-is.
+    """
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+
+    ops = [prefix] if prefix else []
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    old_tokens = TOKEN.findall(old_middle)
+    new_tokens = TOKEN.findall(new_middle)
+    if len(old_tokens) > MAX_DIFF_TOKENS or len(new_tokens) > MAX_DIFF_TOKENS:
+        old_tokens, new_tokens = [old_middle], [new_middle]
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(sum(map(len, old_tokens[i1:i2])))
+            continue
+        if i2 > i1:
+            ops.append(-sum(map(len, old_tokens[i1:i2])))
+        if j2 > j1:
+            ops.append(''.join(new_tokens[j1:j2]))
+    if suffix:
+        ops.append(suffix)
+    return ops
+
+
+def apply(base, ops):
+    """Apply a delta produced by diff() to ``base``."""
+    parts = []
+    position = 0
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.append(base[position:position + op])
+            position += op
+        else:
+            position -= op
+    return ''.join(parts)
+
+
+def encode(ops):
+    return json.dumps(ops, separators=(',', ':'), ensure_ascii=False)
+
+
+def decode(data):
+    return json.loads(data)
+
+
+def apply_splices(text, splices):
+    """
+    Apply client edits to ``text``. Each splice is a dict with ``offset``,
+    ``delete`` and ``insert``; offsets are code points into the original ``text``
+    and splices must be sorted and must not overlap.
+    Raises ValueError if they are out of range or out of order.
+    """
+    parts = []
+    position = 0
+    for splice in splices:
+        offset = splice['offset']
+        end = offset + splice.get('delete', 0)
+        if offset < position:
+            raise ValueError("Splices must be sorted by offset and must not overlap.")
+        if end > len(text):
+            raise ValueError(f"Splice at offset {offset} runs past the end of the content.")
+        parts.append(text[position:offset])
+        parts.append(splice.get('insert', ''))
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
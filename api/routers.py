@@ -0,0 +1,95 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Whether reads in the current request/task may be served by a replica.
+# Off by default: only code that opts in (see `replica_reads`) leaves the primary.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_aliases():
+    """Database aliases treated as read replicas of ``default``."""
+    return list(getattr(settings, 'REPLICAS', []))
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route reads inside the block to a replica (when one is configured)."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _sticky_key(user):
+    return f"db:sticky:{user.pk}"
+
+
+def mark_write(user):
+    """Pin ``user``'s reads to the primary for the stickiness window after a write."""
+    cache.set(_sticky_key(user), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return bool(cache.get(_sticky_key(user)))
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to the primary and, when enabled for the current context,
+    reads to a randomly chosen replica. Related lookups follow the database
+    their instance was loaded from so a request never mixes snapshots.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if _replica_reads.get():
+            aliases = replica_aliases()
+            if aliases:
+                return random.choice(aliases)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replicas hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication.
+        return db not in replica_aliases()
+
+
+class ShardRouter:
+    """
+    Sends the api app's user-owned models to the shard selected for the current
+    request or job (api.sharding.use_shard). Anything reached through a sharded
+    instance, users included (they are mirrored to every shard), follows the
+    database it was loaded from. Defers to PrimaryReplicaRouter for the default
+    shard and for global models (users, tokens, the shard directory).
+    """
+
+    def _shard(self, model, hints):
+        from . import sharding
+
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db and sharding.is_sharded_model(type(instance)):
+            alias = instance._state.db
+        elif sharding.is_sharded_model(model):
+            alias = sharding.current_shard()
+        else:
+            return None
+        return None if alias == 'default' or alias in replica_aliases() else alias
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints)
@@ -0,0 +1,48 @@
+import functools
+import gzip
+import hashlib
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.http import quote_etag
+
+logger = logging.getLogger(__name__)
+
+
+def artifact_path(version):
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f"openapi-{version}.json"
+
+
+def generate_schema(version):
+    """Introspect every view and serializer and return the schema as JSON bytes."""
+    from drf_yasg.codecs import OpenAPICodecJson
+    from .schema_generator import API_INFO, DocumentedSchemaGenerator
+
+    generator = DocumentedSchemaGenerator(API_INFO, version=version)
+    schema = generator.get_schema(request=None, public=True)
+    return OpenAPICodecJson(validators=[], pretty=True).encode(schema)
+
+
+class SchemaArtifact:
+    """A rendered schema with its validators and a pre-compressed copy."""
+
+    def __init__(self, body):
+        self.body = body
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = quote_etag(digest)
+        self.gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        self.gzip_etag = quote_etag(f"{digest}-gzip")
+
+
+@functools.lru_cache(maxsize=None)
+def load_artifact(version):
+    """
+    Load the schema written at deploy time by ``manage.py generate_openapi_schema``.
+    If it is missing, fall back to generating it once for the life of the process.
+    """
+    path = artifact_path(version)
+    if path.exists():
+        return SchemaArtifact(path.read_bytes())
+    logger.warning("OpenAPI artifact %s not found; generating it in-process.", path)
+    return SchemaArtifact(generate_schema(version))
@@ -0,0 +1,26 @@
+import copy
+
+from drf_yasg import openapi
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+from . import docs
+
+API_INFO = openapi.Info(
+    title="Remino API",
+    default_version='v1',
+    description="API documentation for Remino",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email=""),
+    license=openapi.License(name="BSD License"),
+)
+
+
+class DocumentedSchemaGenerator(OpenAPISchemaGenerator):
+    """Schema generator that also picks up the lazy ``@document`` overrides of api.docs."""
+
+    def get_overrides(self, view, method):
+        action = getattr(view, 'action', method.lower())
+        overrides = docs.resolve(getattr(view, action, None))
+        if overrides is None:
+            return super().get_overrides(view, method)
+        return copy.deepcopy(overrides)
@@ -1,14 +1,21 @@
-from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from rest_framework import serializers
-from rest_framework.authtoken.models import Token
 from django.contrib.auth.password_validation import validate_password
 from django.core.validators import EmailValidator
-from .models import *
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import router, transaction
 from django.urls import reverse
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.authtoken.models import Token
+from .models import ArchivedTask, Category, Note, NoteRevision, StorageUsage, Tag, TagFacet, Task, TaskOccurrence
+from . import quota, recurrence, revisions
+from .task import send_share_notification
+
+
+def queue_share_email(recipient, subject, message):
+    """Send share mail from the transactional queue once the share is committed."""
+    transaction.on_commit(lambda: send_share_notification.delay(recipient, subject, message))
 
 class ReminoUserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -93,18 +100,41 @@ class LoginSerializer(serializers.Serializer):
    
 class CategorySerializer(serializers.ModelSerializer):
     user = ReminoUserSerializer(read_only=True)
-    notes_count = serializers.IntegerField(source='notes.count', read_only=True)
+    # Annotated by the category views; counted only for a freshly created category.
+    notes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
         fields = ['id', 'user', 'name', 'description', 'notes_count', 'created_at']
         read_only_fields = ['id', 'user', 'notes_count', 'created_at']
 
+    def get_notes_count(self, obj):
+        if hasattr(obj, 'notes_count'):
+            return obj.notes_count
+        return obj.notes.count()
+
+    def validate_name(self, value):
+        # Deleted categories keep their name until purged: a new one with that name
+        # brings the deleted one back (see create()), a rename onto it is refused.
+        duplicates = Category.all_objects.filter(user=self.context['request'].user, name=value)
+        if self.instance is not None:
+            if duplicates.exclude(pk=self.instance.pk).exists():
+                raise serializers.ValidationError("You already have a category with this name.")
+        elif duplicates.filter(deleted_at__isnull=True).exists():
+            raise serializers.ValidationError("You already have a category with this name.")
+        return value
+
     def create(self, validated_data):
         request = self.context.get('request')
         if not request or not hasattr(request, 'user'):
             raise serializers.ValidationError({"user": "User must be provided."})
         user = request.user
+        deleted = Category.all_objects.deleted().filter(user=user, name=validated_data.get('name')).first()
+        if deleted is not None:
+            deleted.description = validated_data.get('description', '')
+            deleted.deleted_at = None
+            deleted.save(update_fields=['description', 'deleted_at'])
+            return deleted
         return Category.objects.create(user=user, **validated_data)
 
     def update(self, instance, validated_data):
@@ -113,6 +143,92 @@ class CategorySerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate_name(self, value):
+        user = self.context['request'].user
+        duplicates = Tag.objects.filter(user=user, name=value)
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError("You already have a tag with this name.")
+        return value
+
+
+# The `TagFacetSerializer` reports how many visible notes and tasks carry a tag;
+# the counts come from the TagFacet rows rather than a per-request aggregate.
+class TagFacetSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='tag_id', read_only=True)
+    name = serializers.CharField(source='tag.name', read_only=True)
+    owner = serializers.CharField(source='tag.user.username', read_only=True)
+
+    class Meta:
+        model = TagFacet
+        fields = ['id', 'name', 'owner', 'notes_count', 'tasks_count']
+
+
+class StorageUsageSerializer(serializers.ModelSerializer):
+    quota_bytes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StorageUsage
+        fields = ['content_bytes', 'file_bytes', 'total_bytes', 'quota_bytes', 'reconciled_at']
+
+    def get_quota_bytes(self, obj):
+        return settings.STORAGE_QUOTA_BYTES
+
+
+class UserSuggestionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    email = serializers.EmailField()
+    username = serializers.CharField()
+    shared_before = serializers.BooleanField()
+
+
+def check_storage_quota(serializer, attrs, body_field, attachments=()):
+    """Reject a write that would take the owner over STORAGE_QUOTA_BYTES."""
+    instance = serializer.instance
+    extra = sum(attrs[name].size for name in attachments if attrs.get(name))
+    if instance is not None:
+        # A new upload (or clearing the field) frees the file it replaces.
+        extra -= sum(quota.attachment_size(getattr(instance, name)) for name in attachments if name in attrs)
+    if body_field in attrs:
+        extra += len(attrs[body_field].encode('utf-8'))
+        if instance is not None:
+            extra -= len(getattr(instance, body_field).encode('utf-8'))
+    owner_id = instance.user_id if instance is not None else serializer.context['request'].user.pk
+    if quota.exceeds_quota(owner_id, extra):
+        raise serializers.ValidationError({
+            "storage": f"This would exceed the {settings.STORAGE_QUOTA_BYTES // (1024 * 1024)} MB storage quota."
+        })
+
+
+def validate_owned_tags(serializer, tags):
+    """Tags on a note or task must belong to its owner, including when a shared user edits it."""
+    owner = serializer.instance.user if serializer.instance is not None else serializer.context['request'].user
+    foreign = [tag.pk for tag in tags if tag.user_id != owner.pk]
+    if foreign:
+        raise serializers.ValidationError(f"Unknown tags: {', '.join(map(str, foreign))}")
+    return tags
+
+
+class ContentSpliceSerializer(serializers.Serializer):
+    """One edit of a content patch: replace ``delete`` characters at ``offset`` with ``insert``."""
+    offset = serializers.IntegerField(min_value=0)
+    delete = serializers.IntegerField(min_value=0, default=0)
+    insert = serializers.CharField(allow_blank=True, trim_whitespace=False, default='')
+
+
+class NoteRevisionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The note has changed since the revision you edited; fetch it and re-apply your changes."
+    default_code = 'revision_conflict'
+
+
 # The `NoteSerializer` class in Python is used to serialize and deserialize Note objects, handling
 # fields related to user, sharing, and creation/update operations.
 class NoteSerializer(serializers.ModelSerializer):
@@ -123,15 +239,44 @@ class NoteSerializer(serializers.ModelSerializer):
         required=False
     )
     shared_users = ReminoUserSerializer(source='shared_with', many=True, read_only=True)
+    # Stored in the NoteBody side table (see Note.content).
+    content = serializers.CharField(style={'base_template': 'textarea.html'})
+    # Autosave can PATCH a list of splices against revision ``base_revision``
+    # instead of re-sending the whole body.
+    content_patch = ContentSpliceSerializer(many=True, write_only=True, required=False)
+    base_revision = serializers.IntegerField(write_only=True, required=False)
+    tags = serializers.PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all(), required=False)
 
     class Meta:
         model = Note
         fields = [
-            'id', 'user', 'title', 'content', 'category',
-            'image', 'file', 'is_shared', 'shared_with',
+            'id', 'user', 'title', 'content', 'content_patch', 'base_revision',
+            'revision', 'category', 'tags', 'image', 'file', 'is_shared', 'shared_with',
             'shared_users', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'user', 'shared_users', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'revision', 'shared_users', 'created_at', 'updated_at']
+
+    def validate_tags(self, value):
+        return validate_owned_tags(self, value)
+
+    def validate(self, attrs):
+        if 'content_patch' in attrs:
+            if self.instance is None:
+                raise serializers.ValidationError({"content_patch": "Patches can only be applied to an existing note."})
+            if 'content' in attrs:
+                raise serializers.ValidationError({"content_patch": "Send either content or content_patch, not both."})
+            base_revision = attrs.get('base_revision')
+            if base_revision is not None and base_revision != self.instance.revision:
+                raise NoteRevisionConflict(
+                    f"The note is at revision {self.instance.revision}; fetch it and re-apply the patch."
+                )
+            # Spliced here so the quota check below sees the resulting content.
+            try:
+                attrs['content'] = revisions.apply_splices(self.instance.content, attrs['content_patch'])
+            except ValueError as exc:
+                raise serializers.ValidationError({"content_patch": str(exc)})
+        check_storage_quota(self, attrs, 'content', Note.ATTACHMENT_FIELDS)
+        return attrs
 
     def create(self, validated_data):
         shared_with_emails = validated_data.pop('shared_with', [])
@@ -141,12 +286,16 @@ class NoteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 "shared_with": f"The following emails are not registered users: {', '.join(invalid_emails)}"
             })
+        validated_data.pop('base_revision', None)
+        tags = validated_data.pop('tags', None)
         note = Note.objects.create(**validated_data, user=self.context['request'].user)
         
         if users.exists():
             note.shared_with.set(users)
             note.is_shared = True
             note.save()
+        if tags:
+            note.tags.set(tags)
             
           # Construct the absolute URL to the note
         request = self.context.get('request')
@@ -159,17 +308,27 @@ class NoteSerializer(serializers.ModelSerializer):
             
         
         for user in users:
-            send_mail(
+            queue_share_email(
+                user.email,
                 subject=f"{self.context['request'].user.username} from REMINO shared a note with you",
                 message=f"You have been granted access to the note titled '{note.title}'. You can view the note here: {note_url}",
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                fail_silently=False,
             )
         return note
 
     def update(self, instance, validated_data):
+        # One transaction, so a revision conflict on save also undoes the sharing and tag changes.
+        with transaction.atomic(using=router.db_for_write(Note, instance=instance)):
+            try:
+                return self._update(instance, validated_data)
+            except revisions.RevisionConflict:
+                raise NoteRevisionConflict()
+
+    def _update(self, instance, validated_data):
         shared_with_emails = validated_data.pop('shared_with', None)
+        # validate() has already turned content_patch into content.
+        validated_data.pop('content_patch', None)
+        validated_data.pop('base_revision', None)
+        tags = validated_data.pop('tags', None)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -199,17 +358,17 @@ class NoteSerializer(serializers.ModelSerializer):
 
                 # Optionally, send notification emails to new shared users
                 for user in users:
-                    send_mail(
+                    queue_share_email(
+                        user.email,
                         subject=f"{self.context['request'].user.username} shared a note with you",
                         message=f"You have been granted access to the note titled '{instance.title}'.",
-                        from_email=settings.EMAIL_HOST_USER,
-                        recipient_list=[user.email],
-                        fail_silently=False,
                     )
             else:
                 instance.shared_with.clear()
                 instance.is_shared = False
 
+        if tags is not None:
+            instance.tags.set(tags)
         instance.save()
         return instance
 
@@ -223,14 +382,35 @@ class TaskSerializer(serializers.ModelSerializer):
         required=False
     )
     shared_users = ReminoUserSerializer(source='shared_with', many=True, read_only=True)
+    # Stored in the TaskBody side table (see Task.description).
+    description = serializers.CharField(style={'base_template': 'textarea.html'})
+    tags = serializers.PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all(), required=False)
 
     class Meta:
         model = Task
         fields = [
-            'id', 'user', 'title', 'description', 'due_date', 'is_completed', 'shared_with',
+            'id', 'user', 'title', 'description', 'due_date', 'is_completed', 'completed_at',
+            'recurrence_rule', 'recurrence_end', 'tags', 'shared_with',
             'shared_users', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'user', 'shared_users', 'created_at', 'updated_at']
+        read_only_fields = [
+            'id', 'user', 'completed_at', 'recurrence_end', 'shared_users', 'created_at', 'updated_at'
+        ]
+
+    def validate_tags(self, value):
+        return validate_owned_tags(self, value)
+
+    def validate(self, attrs):
+        rule = attrs.get('recurrence_rule', getattr(self.instance, 'recurrence_rule', ''))
+        due_date = attrs.get('due_date', getattr(self.instance, 'due_date', None))
+        # Only a changed schedule is checked, so tasks stored before the caps stay editable.
+        if rule and due_date and ('recurrence_rule' in attrs or 'due_date' in attrs):
+            try:
+                recurrence.series_end(rule, due_date)
+            except ValueError as exc:
+                raise serializers.ValidationError({"recurrence_rule": str(exc)})
+        check_storage_quota(self, attrs, 'description')
+        return attrs
 
     def create(self, validated_data):
         shared_with_emails = validated_data.pop('shared_with', [])
@@ -240,6 +420,7 @@ class TaskSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 "shared_with": f"The following emails are not registered users: {', '.join(invalid_emails)}"
             })
+        tags = validated_data.pop('tags', None)
         # Create the task and associate it with the authenticated user
         task = Task.objects.create(**validated_data, user=self.context['request'].user)
 
@@ -247,6 +428,8 @@ class TaskSerializer(serializers.ModelSerializer):
             task.shared_with.set(users)
             task.is_shared = True
             task.save()
+        if tags:
+            task.tags.set(tags)
 
         # Construct the absolute URL to the task detail view
         request = self.context.get('request')
@@ -259,20 +442,19 @@ class TaskSerializer(serializers.ModelSerializer):
 
         # Send notification emails with the task link
         for user in users:
-            send_mail(
+            queue_share_email(
+                user.email,
                 subject=f"{self.context['request'].user.username} from REMINO shared a task with you",
                 message=(
                     f"You have been granted access to the task titled '{task.title}'.\n\n"
                     f"You can view the task here: {task_url}"
                 ),
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[user.email],
-                fail_silently=False,
             )
         return task
 
     def update(self, instance, validated_data):
         shared_with_emails = validated_data.pop('shared_with', None)
+        tags = validated_data.pop('tags', None)
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -302,23 +484,120 @@ class TaskSerializer(serializers.ModelSerializer):
 
                 # Optionally, send notification emails to new shared users
                 for user in users:
-                    send_mail(
+                    queue_share_email(
+                        user.email,
                         subject=f"{self.context['request'].user.username} shared a task with you",
                         message=(
                             f"You have been granted access to the task titled '{instance.title}'.\n\n"
                             f"You can view the task here: {task_url}"
                         ),
-                        from_email=settings.EMAIL_HOST_USER,
-                        recipient_list=[user.email],
-                        fail_silently=False,
                     )
             else:
                 instance.shared_with.clear()
                 instance.is_shared = False
                 instance.save()
 
+        if tags is not None:
+            instance.tags.set(tags)
         instance.save()
         return instance
+
+
+# List endpoints leave out the HTML body so listing never reads the side tables;
+# clients fetch the detail endpoint for it.
+class NoteListSerializer(NoteSerializer):
+    class Meta(NoteSerializer.Meta):
+        fields = [field for field in NoteSerializer.Meta.fields if field != 'content']
+
+
+class TaskListSerializer(TaskSerializer):
+    class Meta(TaskSerializer.Meta):
+        fields = [field for field in TaskSerializer.Meta.fields if field != 'description']
+
+
+class TrashedNoteSerializer(NoteListSerializer):
+    class Meta(NoteListSerializer.Meta):
+        fields = NoteListSerializer.Meta.fields + ['deleted_at']
+        read_only_fields = NoteListSerializer.Meta.read_only_fields + ['deleted_at']
+
+
+class TrashedTaskSerializer(TaskListSerializer):
+    class Meta(TaskListSerializer.Meta):
+        fields = TaskListSerializer.Meta.fields + ['deleted_at']
+        read_only_fields = TaskListSerializer.Meta.read_only_fields + ['deleted_at']
+
+
+class ArchivedTaskSerializer(serializers.ModelSerializer):
+    user = ReminoUserSerializer(read_only=True)
+    shared_users = ReminoUserSerializer(source='shared_with', many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedTask
+        fields = [
+            'id', 'user', 'title', 'due_date', 'completed_at', 'recurrence_rule',
+            'shared_users', 'created_at', 'updated_at', 'archived_at'
+        ]
+        read_only_fields = fields
+
+
+class ArchivedTaskDetailSerializer(ArchivedTaskSerializer):
+    description = serializers.CharField(read_only=True)
+
+    class Meta(ArchivedTaskSerializer.Meta):
+        fields = ArchivedTaskSerializer.Meta.fields + ['description']
+        read_only_fields = fields
+
+
+class NoteRevisionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NoteRevision
+        fields = ['number', 'is_snapshot', 'length', 'created_at']
+        read_only_fields = fields
+
+
+class NoteRevisionDetailSerializer(NoteRevisionSerializer):
+    content = serializers.CharField(source='get_content', read_only=True)
+
+    class Meta(NoteRevisionSerializer.Meta):
+        fields = NoteRevisionSerializer.Meta.fields + ['content']
+        read_only_fields = fields
+
+
+# The `TaskOccurrenceSerializer` renders expanded occurrences of a task and records
+# per-occurrence exceptions (completed, cancelled or rescheduled occurrences).
+class TaskOccurrenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TaskOccurrence
+        fields = ['task', 'original_date', 'due_date', 'is_completed', 'is_cancelled']
+        read_only_fields = ['task']
+        # The (task, original_date) pair is upserted by the view, not rejected.
+        validators = []
+
+    def validate_original_date(self, value):
+        task = self.context['task']
+        if task.is_recurring:
+            dates = recurrence.expand_dates(task.recurrence_rule, task.due_date, value, value)
+        else:
+            dates = [task.due_date]
+        if value not in dates:
+            raise serializers.ValidationError("This date is not an occurrence of the task.")
+        return value
+
+    def create(self, validated_data):
+        task = self.context['task']
+        original_date = validated_data.pop('original_date')
+        occurrence, created = TaskOccurrence.objects.update_or_create(
+            task=task, original_date=original_date, defaults=validated_data
+        )
+        return occurrence
+
+
+class CalendarEntrySerializer(TaskOccurrenceSerializer):
+    title = serializers.CharField(source='task.title', read_only=True)
+    is_recurring = serializers.BooleanField(source='task.is_recurring', read_only=True)
+
+    class Meta(TaskOccurrenceSerializer.Meta):
+        fields = ['task', 'title', 'is_recurring', 'original_date', 'due_date', 'is_completed', 'is_cancelled']
     
     
     
@@ -0,0 +1,325 @@
+import copy
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+
+# Shard holding the sharded rows the current request or job works on. ShardMixin
+# sets it for API views, use_shard()/each_shard() for jobs; unset means `default`.
+_current_shard = ContextVar('current_shard', default=None)
+
+# api models that stay in `default`; every other api model is stored on its owner's shard.
+GLOBAL_MODELS = {'usershard', 'sharedaccess', 'idsequence', 'calendarfeedtoken', 'userlookup'}
+
+# Models whose ids come from IdSequence once there are several shards: the rows other
+# rows point at, which must keep their ids when a user moves to another shard.
+GLOBAL_ID_MODELS = ('Category', 'Tag', 'Note', 'Task')
+
+# Models with a shared_with relation, mirrored into the SharedAccess index.
+SHARED_MODELS = ('Note', 'Task')
+
+
+def shard_aliases():
+    return list(getattr(settings, 'SHARDS', ['default']))
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def is_sharded_model(model):
+    return model._meta.app_label == 'api' and model._meta.model_name not in GLOBAL_MODELS
+
+
+def current_shard():
+    return _current_shard.get() or 'default'
+
+
+@contextmanager
+def use_shard(alias):
+    """Route sharded models to ``alias`` inside the block."""
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+def each_shard():
+    """Iterate over the shard aliases with each one selected in turn (for background jobs)."""
+    for alias in shard_aliases():
+        with use_shard(alias):
+            yield alias
+
+
+class UserMigrating(Exception):
+    """A user's rows are being moved to another shard; writes to them must wait."""
+
+
+def _placement_key(user_id):
+    return f"shard:user:{user_id}"
+
+
+def placement(user_id, cached=True):
+    """
+    Return (alias, migrating) for ``user_id``. A user is placed on first use by user
+    id modulo the number of shards and the choice is recorded in UserShard, so adding
+    shards never moves existing users; only rebalance_shards does. Reads may use the
+    cached answer; writers pass ``cached=False`` (see check_writable), because a
+    process only drops its own cache entry when a user moves.
+    """
+    if not is_sharded():
+        return 'default', False
+    key = _placement_key(user_id)
+    if cached:
+        value = cache.get(key)
+        if value is not None:
+            return tuple(value)
+    from .models import UserShard
+
+    aliases = shard_aliases()
+    entry, _ = UserShard.objects.using('default').get_or_create(
+        user_id=user_id, defaults={'alias': aliases[user_id % len(aliases)]}
+    )
+    value = (entry.alias, entry.migrating)
+    # A move is short; caching its state would block the user for the whole TTL.
+    if entry.migrating:
+        cache.delete(key)
+    else:
+        cache.set(key, value, settings.SHARD_DIRECTORY_CACHE_SECONDS)
+    return value
+
+
+def shard_for_user(user_id, cached=True):
+    return placement(user_id, cached)[0]
+
+
+def check_writable(user_id):
+    """
+    Return the shard holding ``user_id``'s rows, read from UserShard rather than the
+    cache, or raise UserMigrating while rebalance_shards is moving them. Call it with
+    the owner of the rows about to be written, which is not always the caller.
+    """
+    alias, migrating = placement(user_id, cached=False)
+    if migrating:
+        raise UserMigrating(user_id)
+    return alias
+
+
+def forget_placement(user_id):
+    cache.delete(_placement_key(user_id))
+
+
+def check_directory_cache(app_configs=None, **kwargs):
+    """System check: with several shards, placements must be cached where every process sees a move."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if is_sharded() and backend.endswith('LocMemCache'):
+        return [checks.Warning(
+            "Shard placements are cached per process (LocMemCache), so after a move other "
+            "processes read the old shard for up to SHARD_DIRECTORY_CACHE_SECONDS.",
+            hint="Configure a shared default cache (REDIS_CACHE_URL) when SHARDS lists several aliases.",
+            id='api.W001',
+        )]
+    return []
+
+
+def _exclude_owners(queryset, owner, migrating):
+    if not is_sharded():
+        return queryset
+    from .models import UserShard
+
+    alias = current_shard()
+    owners = set(queryset.values_list(owner, flat=True).distinct())
+    elsewhere = ~Q(alias=alias) | Q(migrating=True) if migrating else ~Q(alias=alias)
+    excluded = UserShard.objects.using('default').filter(elsewhere, user_id__in=owners)
+    return queryset.exclude(**{f'{owner}__in': list(excluded.values_list('user_id', flat=True))})
+
+
+def placed_rows(queryset, owner='user_id'):
+    """
+    ``queryset`` (on the current shard) without rows whose owner UserShard places on
+    another shard: copies an interrupted move left behind for `--cleanup`.
+    """
+    return _exclude_owners(queryset, owner, migrating=False)
+
+
+def writable_rows(queryset, owner='user_id'):
+    """placed_rows() that also leaves out owners being moved, for jobs that write."""
+    return _exclude_owners(queryset, owner, migrating=True)
+
+
+_id_blocks = {}
+_id_lock = threading.Lock()
+
+
+def next_id(model):
+    """A primary key for a new ``model`` row that is unique across all shards."""
+    name = model._meta.label_lower
+    with _id_lock:
+        block = _id_blocks.get(name)
+        if block is None or block[0] >= block[1]:
+            block = _id_blocks[name] = _reserve_ids(model)
+        value = block[0]
+        block[0] += 1
+    return value
+
+
+def _reserve_ids(model):
+    """Reserve the next SHARD_ID_BLOCK_SIZE ids of ``model``; returns [first, end)."""
+    from .models import IdSequence
+
+    name = model._meta.label_lower
+    size = settings.SHARD_ID_BLOCK_SIZE
+    sequences = IdSequence.objects.using('default')
+    with transaction.atomic(using='default'):
+        if not sequences.filter(name=name).exists():
+            # Start above every id already issued by the shards' own counters.
+            start = 1 + max(
+                model._base_manager.using(alias).aggregate(top=Max('pk'))['top'] or 0
+                for alias in shard_aliases()
+            )
+            sequences.get_or_create(name=name, defaults={'next_value': start})
+        first = sequences.select_for_update().get(name=name).next_value
+        sequences.filter(name=name).update(next_value=F('next_value') + size)
+    return [first, first + size]
+
+
+def assign_id(sender, instance, raw, **kwargs):
+    if instance.pk is None and not raw and is_sharded():
+        instance.pk = next_id(sender)
+
+
+def remote_shares(user_id, kind, home):
+    """{alias: [ids]} of the ``kind`` objects shared with ``user_id`` that live on shards other than ``home``."""
+    if not is_sharded():
+        return {}
+    from .models import SharedAccess
+
+    shares = {}
+    rows = SharedAccess.objects.using('default').filter(user_id=user_id, kind=kind).exclude(alias=home)
+    for alias, object_id in rows.values_list('alias', 'object_id'):
+        shares.setdefault(alias, []).append(object_id)
+    return shares
+
+
+def shared_object(user_id, kind, object_id):
+    """(shard, owner id) of the ``kind`` object ``object_id`` if it is shared with ``user_id``, else None."""
+    if not is_sharded():
+        return None
+    from .models import SharedAccess
+
+    return SharedAccess.objects.using('default').filter(
+        user_id=user_id, kind=kind, object_id=object_id
+    ).values_list('alias', 'owner_id').first()
+
+
+def forget_access(kind, ids):
+    """Drop index entries for hard-deleted objects."""
+    if is_sharded():
+        from .models import SharedAccess
+
+        SharedAccess.objects.using('default').filter(kind=kind, object_id__in=ids).delete()
+
+
+def rekind_access(kind, new_kind, ids):
+    """Re-point index entries when objects move to another model (tasks being archived)."""
+    if is_sharded():
+        from .models import SharedAccess
+
+        SharedAccess.objects.using('default').filter(kind=kind, object_id__in=ids).update(kind=new_kind)
+
+
+def shares_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse or not is_sharded():
+        return
+    from .models import SharedAccess
+
+    entries = SharedAccess.objects.using('default')
+    kind = instance._meta.model_name
+    if action in ('pre_remove', 'pre_clear'):
+        existing = set(instance.shared_with.values_list('id', flat=True))
+        instance._unshared_access = existing & pk_set if action == 'pre_remove' else existing
+    elif action == 'post_add':
+        entries.bulk_create([
+            SharedAccess(user_id=user_id, kind=kind, object_id=instance.pk,
+                         owner_id=instance.user_id, alias=instance._state.db)
+            for user_id in pk_set - {instance.user_id}
+        ], ignore_conflicts=True)
+    elif action in ('post_remove', 'post_clear'):
+        users = instance.__dict__.pop('_unshared_access', set())
+        entries.filter(user_id__in=users, kind=kind, object_id=instance.pk).delete()
+
+
+def mirror_user(sender, instance, raw, using, **kwargs):
+    # auth_user rows are copied into every shard so foreign keys, share tables and
+    # select_related('user') keep working there; `default` stays the source of truth.
+    if raw or using != 'default' or not is_sharded():
+        return
+    for alias in shard_aliases():
+        if alias != 'default':
+            copy.copy(instance).save_base(using=alias, raw=True)
+
+
+def unmirror_user(sender, instance, using, **kwargs):
+    if using != 'default' or not is_sharded():
+        return
+    forget_placement(instance.pk)
+    for alias in shard_aliases():
+        if alias != 'default':
+            User._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def connect_signals():
+    from django.apps import apps
+
+    for name in GLOBAL_ID_MODELS:
+        pre_save.connect(assign_id, sender=apps.get_model('api', name), dispatch_uid=f'api.sharding.{name}_id')
+    for name in SHARED_MODELS:
+        model = apps.get_model('api', name)
+        m2m_changed.connect(shares_changed, sender=model.shared_with.through, dispatch_uid=f'api.sharding.{name}_shares')
+    post_save.connect(mirror_user, sender=User, dispatch_uid='api.sharding.mirror_user')
+    post_delete.connect(unmirror_user, sender=User, dispatch_uid='api.sharding.unmirror_user')
+
+
+def _sort_key(value):
+    return (value is not None, value)
+
+
+class ShardedResults:
+    """
+    Ordered, read-only merge of querysets from several shards, paginated like a
+    queryset: count() adds the per-shard counts and a slice fetches the first
+    ``stop`` rows of each shard and merges them on the querysets' ordering.
+    """
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self.ordering = list(querysets[0].query.order_by) or ['pk']
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        rows = []
+        for queryset in self.querysets:
+            rows.extend(queryset if index.stop is None else queryset[:index.stop])
+        for field in reversed(self.ordering):
+            name = field.lstrip('-')
+            rows.sort(key=lambda row: _sort_key(getattr(row, name)), reverse=field.startswith('-'))
+        return rows[index]
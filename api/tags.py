@@ -0,0 +1,147 @@
+from django.db import router, transaction
+from django.db.models import Count, F, Q
+from django.db.models.signals import m2m_changed, post_save
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+# TagFacet column holding the count for each tagged model.
+FACET_FIELDS = {'note': 'notes_count', 'task': 'tasks_count'}
+
+
+def _through(instance):
+    return type(instance).tags.through
+
+
+def _kind(instance):
+    return instance._meta.model_name
+
+
+def tag_ids(instance):
+    return set(
+        _through(instance).objects.filter(**{_kind(instance): instance}).values_list('tag_id', flat=True)
+    )
+
+
+def audience(instance):
+    """The users who see ``instance`` in their lists: the owner and everyone it is shared with."""
+    return {instance.user_id, *instance.shared_with.values_list('id', flat=True)}
+
+
+def adjust(kind, user_ids, tag_ids, delta):
+    """Add ``delta`` to the ``kind`` count of every (user, tag) facet, creating missing rows."""
+    from .models import TagFacet
+
+    if not user_ids or not tag_ids or not delta:
+        return
+    field = FACET_FIELDS[kind]
+    TagFacet.objects.bulk_create(
+        [TagFacet(user_id=user_id, tag_id=tag_id) for user_id in user_ids for tag_id in tag_ids],
+        ignore_conflicts=True,
+    )
+    TagFacet.objects.filter(user_id__in=user_ids, tag_id__in=tag_ids).update(**{field: F(field) + delta})
+
+
+def tagged_audience(model, ids):
+    """Users whose facets include any of the ``model`` rows in ``ids``; for bulk paths that bypass signals."""
+    kind = model._meta.model_name
+    tagged = model.tags.through.objects.filter(**{f'{kind}_id__in': ids}).values(f'{kind}_id')
+    owners = model._base_manager.filter(pk__in=tagged).values_list('user_id', flat=True)
+    shares = model.shared_with.through.objects.filter(**{f'{kind}_id__in': tagged}).values_list('user_id', flat=True)
+    return set(owners) | set(shares)
+
+
+def rebuild_facets(user_ids):
+    """Recount the facets of ``user_ids`` from scratch (reconciliation after bulk changes)."""
+    from .models import Note, NoteTag, TagFacet, Task, TaskTag
+
+    user_ids = list(user_ids)
+    with transaction.atomic(using=router.db_for_write(TagFacet)):
+        TagFacet.objects.filter(user_id__in=user_ids).delete()
+        for user_id in user_ids:
+            counts = {}
+            for kind, model, through in (('note', Note, NoteTag), ('task', Task, TaskTag)):
+                visible = model.objects.filter(Q(user_id=user_id) | Q(shared_with=user_id)).values('pk')
+                rows = (
+                    through.objects.filter(**{f'{kind}__in': visible})
+                    .values('tag_id')
+                    .annotate(total=Count(kind, distinct=True))
+                )
+                for row in rows:
+                    counts.setdefault(row['tag_id'], {})[FACET_FIELDS[kind]] = row['total']
+            TagFacet.objects.bulk_create(
+                [TagFacet(user_id=user_id, tag_id=tag_id, **fields) for tag_id, fields in counts.items()]
+            )
+
+
+def tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Only the forward side (note.tags / task.tags) is used; tag deletion cascades
+    # to its facet rows directly.
+    if reverse or instance.deleted_at is not None:
+        return
+    if action in ('pre_remove', 'pre_clear'):
+        existing = tag_ids(instance)
+        instance._removed_tags = existing & pk_set if action == 'pre_remove' else existing
+    elif action == 'post_add':
+        adjust(_kind(instance), audience(instance), pk_set, 1)
+    elif action in ('post_remove', 'post_clear'):
+        adjust(_kind(instance), audience(instance), instance.__dict__.pop('_removed_tags', set()), -1)
+
+
+def shares_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse or instance.deleted_at is not None:
+        return
+    if action in ('pre_remove', 'pre_clear'):
+        existing = set(instance.shared_with.values_list('id', flat=True))
+        instance._removed_shares = existing & pk_set if action == 'pre_remove' else existing
+    elif action == 'post_add':
+        adjust(_kind(instance), pk_set - {instance.user_id}, tag_ids(instance), 1)
+    elif action in ('post_remove', 'post_clear'):
+        users = instance.__dict__.pop('_removed_shares', set()) - {instance.user_id}
+        adjust(_kind(instance), users, tag_ids(instance), -1)
+
+
+def trash_changed(sender, instance, created, update_fields, **kwargs):
+    # soft_delete() and restore() save exactly this field; anything else leaves
+    # membership of the visible set unchanged.
+    if created or update_fields != frozenset({'deleted_at'}):
+        return
+    delta = -1 if instance.deleted_at is not None else 1
+    adjust(_kind(instance), audience(instance), tag_ids(instance), delta)
+
+
+def connect_signals():
+    from .models import Note, Task
+
+    for model in (Note, Task):
+        name = model._meta.model_name
+        m2m_changed.connect(tags_changed, sender=model.tags.through, dispatch_uid=f'api.tags.{name}_tags')
+        m2m_changed.connect(shares_changed, sender=model.shared_with.through, dispatch_uid=f'api.tags.{name}_shares')
+        post_save.connect(trash_changed, sender=model, dispatch_uid=f'api.tags.{name}_trash')
+
+
+class TagFilterBackend(BaseFilterBackend):
+    """
+    ``?tags=1,2`` keeps notes/tasks carrying every listed tag, ``&tag_match=any``
+    those carrying at least one. Each tag becomes a semi-join on the (tag, object)
+    key of the mapping table, so the database never scans untagged rows.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        raw = request.query_params.get('tags')
+        if not raw:
+            return queryset
+        try:
+            ids = {int(value) for value in raw.split(',') if value.strip()}
+        except ValueError:
+            raise ValidationError({"tags": "Expected a comma-separated list of tag ids."})
+        match = request.query_params.get('tag_match', 'all')
+        if match not in ('all', 'any'):
+            raise ValidationError({"tag_match": "Expected 'all' or 'any'."})
+
+        kind = queryset.model._meta.model_name
+        mapping = queryset.model.tags.through.objects.values(f'{kind}_id')
+        if match == 'any':
+            return queryset.filter(pk__in=mapping.filter(tag_id__in=ids))
+        for tag_id in ids:
+            queryset = queryset.filter(pk__in=mapping.filter(tag_id=tag_id))
+        return queryset
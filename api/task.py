@@ -1,43 +1,297 @@
+from datetime import timedelta
+from smtplib import SMTPException
+
 from celery import shared_task
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import *
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.db.models import Prefetch, Q, Sum
+from .models import ArchivedTask, Category, Note, StorageUsage, Task, TaskBody, TaskOccurrence
+from .routers import replica_reads
+from . import quota, sharding, tags
 from django.urls import reverse
 
-@shared_task
+# Queues, priorities and routing are configured in settings (CELERY_TASK_ROUTES):
+# share mail is transactional, reminders are bulk, and the scan is maintenance work.
+# Rate limits apply per worker, so size them as provider quota / mail workers.
+
+@shared_task(ignore_result=True)
 def send_task_reminders():
     """
-    Send reminders for tasks that are due within the next day and are not completed.
+    Queue reminders for tasks that are due within the next day and are not completed.
+    Recurring tasks are never materialised: their next occurrence is computed on demand.
     """
+    for shard in sharding.each_shard():
+        with replica_reads():
+            _send_task_reminders(shard)
+
+
+def _send_task_reminders(shard):
     now = timezone.now()
     reminder_time = now + timezone.timedelta(days=1)
-    tasks = Task.objects.filter(
+    # Copies a move left behind would send the same reminders again.
+    tasks = sharding.placed_rows(Task.objects.filter(
         due_date__lte=reminder_time,
         due_date__gte=now,
-        is_completed=False
+        is_completed=False,
+        recurrence_rule=''
+    )).select_related('user')
+
+    for task in tasks:
+        send_task_reminder.delay(task.pk, task.due_date.isoformat(), shard)
+
+    overrides = TaskOccurrence.objects.filter(
+        Q(original_date__range=(now, reminder_time)) |
+        Q(due_date__range=(now, reminder_time))
+    )
+    recurring_tasks = sharding.placed_rows(Task.objects.filter(
+        Q(recurrence_end__isnull=True) | Q(recurrence_end__gte=now),
+        due_date__lte=reminder_time,
+        is_completed=False,
+    ).exclude(recurrence_rule='')).prefetch_related(
+        Prefetch('occurrence_overrides', queryset=overrides)
+    )
+
+    for task in recurring_tasks:
+        occurrence = task.next_occurrence(now, reminder_time, overrides=task.occurrence_overrides.all())
+        if occurrence is not None:
+            send_task_reminder.delay(task.pk, occurrence.due_date.isoformat(), shard)
+
+
+@shared_task(
+    ignore_result=True,
+    rate_limit=settings.MAIL_RATE_LIMITS['bulk'],
+    autoretry_for=(SMTPException,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_task_reminder(task_id, due_date, shard='default'):
+    """
+    Send one reminder email. The task is re-read (on ``shard``) so reminders for
+    tasks completed or deleted since the scan are dropped.
+    """
+    with sharding.use_shard(shard):
+        task = Task.objects.filter(pk=task_id, is_completed=False).select_related('user').first()
+    if task is not None:
+        send_reminder_email(task, parse_datetime(due_date))
+
+
+@shared_task(
+    ignore_result=True,
+    rate_limit=settings.MAIL_RATE_LIMITS['transactional'],
+    autoretry_for=(SMTPException,),
+    retry_backoff=True,
+    max_retries=5,
+)
+def send_share_notification(recipient, subject, message):
+    """Tell a user that a note or task was shared with them."""
+    send_mail(
+        subject=subject,
+        message=message,
+        from_email=settings.EMAIL_HOST_USER,
+        recipient_list=[recipient],
+        fail_silently=False,
     )
+
+
+def send_reminder_email(task, due_date):
+    user = task.user
+    # Construct the absolute URL to the task detail view
+    task_detail_path = reverse('api:task-detail', kwargs={'pk': task.pk})
+    task_url = f"{settings.SITE_URL}{task_detail_path}"
     
-    for task in tasks:
-        user = task.user
-        # Construct the absolute URL to the task detail view
-        task_detail_path = reverse('api:task-detail', kwargs={'pk': task.pk})
-        task_url = f"{settings.SITE_URL}{task_detail_path}"
-        
-        # Prepare the email content
-        subject = f"Reminder: Task '{task.title}' is due soon"
-        message = (
-            f"Dear {user.username},\n\n"
-            f"This is a reminder that your task '{task.title}' is due on {task.due_date.strftime('%Y-%m-%d %H:%M')}.\n\n"
-            f"You can view the task here: {task_url}\n\n"
-            "Best regards,\nREMINO Team"
-        )
-        
-        # Send the email
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
+    # Prepare the email content
+    subject = f"Reminder: Task '{task.title}' is due soon"
+    message = (
+        f"Dear {user.username},\n\n"
+        f"This is a reminder that your task '{task.title}' is due on {due_date.strftime('%Y-%m-%d %H:%M')}.\n\n"
+        f"You can view the task here: {task_url}\n\n"
+        "Best regards,\nREMINO Team"
+    )
+    
+    # Send the email
+    send_mail(
+        subject=subject,
+        message=message,
+        from_email=settings.EMAIL_HOST_USER,
+        recipient_list=[user.email],
+        fail_silently=False,
+    )
+
+
+@shared_task(
+    ignore_result=True,
+    autoretry_for=(sharding.UserMigrating,),
+    retry_backoff=60,
+    max_retries=10,
+)
+def purge_user(user_id):
+    """
+    Hard-delete a deactivated account in bounded chunks: notes (with their media
+    files), tasks and categories first, then the user row itself. Retried later
+    while rebalance_shards is moving the account.
+    """
+    with sharding.use_shard(sharding.check_writable(user_id)):
+        # The account's notes and tasks were trashed with bulk UPDATEs, so the tag facets
+        # of the people they were shared with are recounted once they are gone.
+        shared_with = (
+            tags.tagged_audience(Note, Note._base_manager.filter(user_id=user_id).values('pk')) |
+            tags.tagged_audience(Task, Task._base_manager.filter(user_id=user_id).values('pk'))
+        ) - {user_id}
+        for model in (Note, Task, ArchivedTask, Category):
+            while purge_chunk(model._base_manager.filter(user_id=user_id)):
+                pass
+        User.objects.filter(pk=user_id, is_active=False).delete()
+        tags.rebuild_facets(shared_with)
+
+
+@shared_task(ignore_result=True)
+def purge_deleted_items():
+    """
+    Hard-delete notes and tasks that have been in the trash longer than
+    TRASH_RETENTION_DAYS, then deleted categories that no note points at any more.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.TRASH_RETENTION_DAYS)
+    for _ in sharding.each_shard():
+        # Users being moved are purged on the next run.
+        for model in (Note, Task):
+            rows = sharding.writable_rows(model.all_objects.filter(deleted_at__lt=cutoff))
+            while purge_chunk(rows):
+                pass
+        rows = sharding.writable_rows(Category.all_objects.filter(deleted_at__lt=cutoff, notes__isnull=True))
+        while purge_chunk(rows):
+            pass
+
+
+def purge_chunk(queryset):
+    """
+    Hard-delete up to PURGE_CHUNK_SIZE rows of ``queryset`` in their own transaction
+    and return how many were deleted. Media files are removed only once the rows
+    referencing them are gone.
+    """
+    model = queryset.model
+    ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:settings.PURGE_CHUNK_SIZE])
+    if not ids:
+        return 0
+
+    files = []
+    freed = {}
+    if model is Note:
+        for field_name in Note.ATTACHMENT_FIELDS:
+            storage = Note._meta.get_field(field_name).storage
+            rows = Note.all_objects.filter(pk__in=ids).exclude(**{field_name: ''}).exclude(
+                **{f'{field_name}__isnull': True}
+            ).values_list('user_id', field_name)
+            for user_id, name in rows:
+                files.append((storage, name))
+                freed.setdefault(user_id, [0, 0])[1] += quota.file_size(storage, name)
+    if model in (Note, Task):
+        owner = model._meta.model_name
+        body_model = model._meta.get_field('body').related_model
+        sizes = body_model.objects.filter(**{f'{owner}_id__in': ids}).values(f'{owner}__user_id').annotate(
+            total=Sum('size')
+        ).values_list(f'{owner}__user_id', 'total')
+        for user_id, total in sizes:
+            freed.setdefault(user_id, [0, 0])[0] += total or 0
+
+    with transaction.atomic(using=router.db_for_write(model)):
+        model._base_manager.filter(pk__in=ids).delete()
+        for user_id, (content, file_bytes) in freed.items():
+            StorageUsage.add(user_id, content=-content, files=-file_bytes)
+    if model in (Note, Task, ArchivedTask):
+        sharding.forget_access(model._meta.model_name, ids)
+    for storage, name in files:
+        storage.delete(name)
+    return len(ids)
+
+
+@shared_task(ignore_result=True)
+def archive_completed_tasks():
+    """Move tasks completed more than TASK_ARCHIVE_AFTER_DAYS ago into the ArchivedTask table."""
+    cutoff = timezone.now() - timedelta(days=settings.TASK_ARCHIVE_AFTER_DAYS)
+    for _ in sharding.each_shard():
+        # Users being moved are archived on the next run.
+        rows = sharding.writable_rows(Task.objects.filter(is_completed=True, completed_at__lt=cutoff))
+        while archive_chunk(rows):
+            pass
+
+
+def archive_chunk(queryset):
+    """
+    Copy up to ARCHIVE_CHUNK_SIZE tasks of ``queryset`` (with their description and
+    shares) into ArchivedTask and delete the originals, all in one transaction.
+    Returns how many tasks were archived.
+    """
+    with transaction.atomic(using=router.db_for_write(Task)):
+        tasks = list(queryset.order_by('pk').select_for_update()[:settings.ARCHIVE_CHUNK_SIZE])
+        if not tasks:
+            return 0
+        ids = [task.pk for task in tasks]
+        bodies = {
+            task_id: (text, search_text) for task_id, text, search_text in
+            TaskBody.objects.filter(task_id__in=ids).values_list('task_id', 'text', 'search_text')
+        }
+        # Archived descriptions no longer count towards the owner's storage quota.
+        freed = {}
+        for task in tasks:
+            description, _ = bodies.get(task.pk, ('', ''))
+            freed[task.user_id] = freed.get(task.user_id, 0) + len(description.encode('utf-8'))
+        shares = Task.shared_with.through.objects.filter(task_id__in=ids).values_list('task_id', 'user_id')
+
+        ArchivedTask.objects.bulk_create([
+            ArchivedTask(
+                id=task.pk,
+                user_id=task.user_id,
+                title=task.title,
+                description=bodies.get(task.pk, ('', ''))[0],
+                search_text=bodies.get(task.pk, ('', ''))[1],
+                due_date=task.due_date,
+                completed_at=task.completed_at,
+                recurrence_rule=task.recurrence_rule,
+                created_at=task.created_at,
+                updated_at=task.updated_at,
+            )
+            for task in tasks
+        ])
+        ArchivedTask.shared_with.through.objects.bulk_create([
+            ArchivedTask.shared_with.through(archivedtask_id=task_id, user_id=user_id)
+            for task_id, user_id in shares
+        ])
+        affected = tags.tagged_audience(Task, ids)
+        Task._base_manager.filter(pk__in=ids).delete()
+        tags.rebuild_facets(affected)
+        for user_id, size in freed.items():
+            StorageUsage.add(user_id, content=-size)
+        sharding.rekind_access('task', 'archivedtask', ids)
+    return len(ids)
+
+
+@shared_task(ignore_result=True)
+def reconcile_storage_usage():
+    """
+    Recompute every user's StorageUsage counters from the stored rows and files,
+    STORAGE_RECONCILE_CHUNK_SIZE users at a time, repairing drift left by crashes,
+    bulk updates or files changed outside the API.
+    """
+    last_pk = 0
+    while last_pk is not None:
+        last_pk = reconcile_chunk(last_pk)
+
+
+def reconcile_chunk(after_pk):
+    """Reconcile the next chunk of users after ``after_pk``; returns the last pk, or None when done."""
+    ids = list(
+        User.objects.filter(pk__gt=after_pk).order_by('pk').values_list('pk', flat=True)
+        [:settings.STORAGE_RECONCILE_CHUNK_SIZE]
+    )
+    for user_id in ids:
+        try:
+            shard = sharding.check_writable(user_id)
+        except sharding.UserMigrating:
+            continue
+        with sharding.use_shard(shard):
+            quota.reconcile(user_id)
+    return ids[-1] if ids else None
@@ -1,3 +1,1544 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from productivity_pro.celery import app
+
+from . import events, recurrence, revisions, sharding, typeahead
+from .db.metrics import connection_metrics
+from .management.commands.rebalance_shards import Command as RebalanceCommand
+from .middleware import AdmissionControlMiddleware
+from .renderers import ORJSONRenderer
+from .routers import mark_write, replica_reads
+from .schema import load_artifact
+from .tags import rebuild_facets
+from .task import archive_completed_tasks, purge_deleted_items, purge_user, reconcile_storage_usage
+from .throttling import TAKE_TOKEN, TokenBucketThrottle, bucket_script
+from .models import (
+    ArchivedTask, CalendarFeedToken, Category, Note, NoteBody, NoteRevision, SharedAccess, StorageUsage, Tag, TagFacet,
+    Task, TaskOccurrence, UserLookup, UserShard,
+)
+from .urls import urlpatterns
+
+# Rounds of seeded data: each round adds this many more of every kind of object, so
+# the last round runs every endpoint against several times the data of the first.
+SIZES = (3, 9, 27)
+
+# Default time budget per request; generous because CI machines are noisy. The query
+# budgets below are the real guard: they must hold at every size.
+DEFAULT_MAX_MS = 500
+
+# (route name, method) -> (URL kwargs, query string or body, expected status, max
+# queries[, max ms]). URL kwargs and bodies are callables taking the round (see
+# QueryBudgetTests.seed); DELETEs remove an object seeded for their round, and PATCHes
+# grow the body every round so the storage quota is checked each time.
+ROUTES = {
+    ('register', 'post'): (None, lambda r: {
+        'username': f'new{r.number}', 'email': f'new{r.number}@example.com',
+        'password': 'Sturdy-pass-123', 'password2': 'Sturdy-pass-123',
+    }, 201, 5),
+    ('login', 'post'): (None, lambda r: {'username': r.member.username, 'password': 'pw'}, 200, 6),
+    ('logout', 'post'): (None, None, 200, 1),
+    ('account-delete', 'delete'): (None, None, 204, 5),
+    ('storage-usage', 'get'): (None, None, 200, 1),
+    ('user-lookup', 'get'): (None, lambda r: {'q': 'par'}, 200, 5),
+    ('note-list-create', 'get'): (None, None, 200, 4),
+    ('note-list-create', 'post'): (None, lambda r: {
+        'title': f'new{r.number}', 'content': '<p>new</p>', 'tags': [r.tag.pk], 'shared_with': [r.partner.email],
+    }, 201, 23),
+    ('note-detail', 'get'): (lambda r: {'pk': r.note.pk}, None, 200, 3),
+    ('note-detail', 'patch'): (lambda r: {'pk': r.note.pk}, lambda r: {'content': f'<p>{"e" * 20 * r.number}</p>'}, 200, 12),
+    ('note-detail', 'delete'): (lambda r: {'pk': r.doomed_note.pk}, None, 204, 6),
+    ('note-revisions', 'get'): (lambda r: {'pk': r.note.pk}, None, 200, 3),
+    ('note-revision-detail', 'get'): (lambda r: {'pk': r.note.pk, 'number': 1}, None, 200, 2),
+    ('note-revision-restore', 'post'): (lambda r: {'pk': r.revised.pk, 'number': 1}, None, 200, 11),
+    ('task-list-create', 'get'): (None, None, 200, 4),
+    ('task-list-create', 'post'): (None, lambda r: {
+        'title': f'new{r.number}', 'description': '<p>new</p>', 'due_date': '2030-01-07T09:00:00Z',
+        'tags': [r.tag.pk], 'shared_with': [r.partner.email],
+    }, 201, 22),
+    ('task-calendar', 'get'): (None, None, 200, 4),
+    ('task-archive', 'get'): (None, None, 200, 3),
+    ('task-archive-detail', 'get'): (lambda r: {'pk': r.archived.pk}, None, 200, 2),
+    ('task-detail', 'get'): (lambda r: {'pk': r.task.pk}, None, 200, 3),
+    ('task-detail', 'patch'): (lambda r: {'pk': r.task.pk}, lambda r: {'description': f'<p>{"e" * 20 * r.number}</p>'}, 200, 10),
+    ('task-detail', 'delete'): (lambda r: {'pk': r.doomed_task.pk}, None, 204, 6),
+    ('task-occurrences', 'get'): (lambda r: {'pk': r.task.pk}, None, 200, 2),
+    ('calendar-feed-token', 'get'): (None, None, 200, 1),
+    ('calendar-feed', 'get'): (lambda r: {'token': r.feed_token}, None, 200, 5),
+    ('change-stream-ticket', 'post'): (None, None, 200, 0),
+    ('change-stream', 'get'): (None, lambda r: {'ticket': r.ticket}, 200, 1),
+    ('trash-notes', 'get'): (None, None, 200, 4),
+    ('trash-note-restore', 'post'): (lambda r: {'pk': r.trashed_note.pk}, None, 200, 9),
+    ('trash-tasks', 'get'): (None, None, 200, 4),
+    ('trash-task-restore', 'post'): (lambda r: {'pk': r.trashed_task.pk}, None, 200, 9),
+    ('category-list-create', 'get'): (None, None, 200, 2),
+    ('category-list-create', 'post'): (None, lambda r: {'name': f'new{r.number}'}, 201, 4),
+    ('category-detail', 'get'): (lambda r: {'pk': r.category.pk}, None, 200, 1),
+    ('category-detail', 'patch'): (lambda r: {'pk': r.category.pk}, lambda r: {'name': f'renamed{r.number}'}, 200, 3),
+    ('category-detail', 'delete'): (lambda r: {'pk': r.doomed_category.pk}, None, 204, 3),
+    ('tag-list-create', 'get'): (None, None, 200, 2),
+    ('tag-list-create', 'post'): (None, lambda r: {'name': f'new{r.number}'}, 201, 2),
+    ('tag-facets', 'get'): (None, None, 200, 1),
+    ('tag-detail', 'get'): (lambda r: {'pk': r.tag.pk}, None, 200, 1),
+    ('tag-detail', 'patch'): (lambda r: {'pk': r.tag.pk}, lambda r: {'name': f'renamed{r.number}'}, 200, 3),
+    ('tag-detail', 'delete'): (lambda r: {'pk': r.doomed_tag.pk}, None, 204, 5),
+}
+
+# Routes whose request runs as a throwaway user of the round instead of the owner.
+ROUND_USERS = {'logout': 'member', 'account-delete': 'victim'}
+
+
+def explain(sql):
+    """The query plan of ``sql`` as text lines, or None on backends without support."""
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif connection.vendor == 'mysql':
+        prefix = 'EXPLAIN '
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def is_full_scan(plan, tables):
+    """Whether ``plan`` reads a whole table (scans of subqueries and indexes don't count)."""
+    if connection.vendor == 'sqlite':
+        return any(
+            row['detail'].startswith('SCAN ') and ' USING ' not in row['detail']
+            and row['detail'].split()[1] in tables
+            for row in plan
+        )
+    return any(row.get('type') == 'ALL' for row in plan)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryBudgetTests(TestCase):
+    """
+    Runs every route in api/urls.py against seeded data of growing size (SIZES) and
+    checks that each one issues the same number of queries at every size, stays
+    within its query and time budget, and reports the plan of any query that scans
+    a whole table.
+    """
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.partner = User.objects.create_user('partner', 'partner@example.com', 'pw')
+        self.rounds = []
+
+    def seed(self, number, size):
+        now = timezone.now()
+        owner, partner = self.owner, self.partner
+        categories = [Category.objects.create(user=owner, name=f'c{number}-{i}') for i in range(size)]
+        tags = [Tag.objects.create(user=owner, name=f't{number}-{i}') for i in range(size)]
+        notes, tasks = [], []
+        for i in range(size):
+            note = Note.objects.create(
+                user=owner, title=f'n{number}-{i}', content='<p>first</p>', category=categories[i]
+            )
+            note.content = '<p>second</p>'
+            note.save()
+            note.tags.set(tags[:2])
+            note.shared_with.add(partner)
+            notes.append(note)
+            Note.objects.create(user=partner, title=f'p{number}-{i}', content='<p>x</p>').shared_with.add(owner)
+
+            task = Task.objects.create(
+                user=owner, title=f'k{number}-{i}', description='<p>d</p>', due_date=now + timedelta(days=1),
+                recurrence_rule='FREQ=DAILY' if i % 2 else '',
+            )
+            task.tags.set(tags[:2])
+            task.shared_with.add(partner)
+            if task.recurrence_rule:
+                TaskOccurrence.objects.create(task=task, original_date=task.due_date, is_completed=True)
+            tasks.append(task)
+
+            archived = ArchivedTask.objects.create(
+                id=10 ** 6 * number + i, user=owner, title=f'a{number}-{i}', due_date=now, completed_at=now,
+                created_at=now, updated_at=now,
+            )
+            archived.shared_with.add(partner)
+
+        trashed_note = Note.objects.create(user=owner, title=f'x{number}', content='<p>x</p>')
+        trashed_note.soft_delete()
+        trashed_task = Task.objects.create(user=owner, title=f'x{number}', description='<p>x</p>', due_date=now)
+        trashed_task.soft_delete()
+
+        member = User.objects.create_user(f'member{number}', f'member{number}@example.com', 'pw')
+        Token.objects.create(user=member)
+        victim = User.objects.create_user(f'victim{number}', f'victim{number}@example.com', 'pw')
+        for i in range(size):
+            Note.objects.create(user=victim, title=f'v{i}', content='<p>v</p>')
+            Task.objects.create(user=victim, title=f'v{i}', description='<p>v</p>', due_date=now)
+
+        first = self.rounds[0] if self.rounds else None
+        return SimpleNamespace(
+            number=number,
+            partner=partner,
+            note=first.note if first else notes[0],
+            revised=notes[0],
+            task=first.task if first else tasks[1],
+            category=first.category if first else categories[0],
+            tag=first.tag if first else tags[0],
+            archived=first.archived if first else archived,
+            trashed_note=trashed_note,
+            trashed_task=trashed_task,
+            member=member,
+            victim=victim,
+            feed_token=CalendarFeedToken.for_user(owner).token,
+            ticket=events.issue_ticket(owner),
+            doomed_note=Note.objects.create(user=owner, title=f'd{number}', content='<p>d</p>'),
+            doomed_task=Task.objects.create(user=owner, title=f'd{number}', description='<p>d</p>', due_date=now),
+            doomed_category=Category.objects.create(user=owner, name=f'd{number}'),
+            doomed_tag=Tag.objects.create(user=owner, name=f'd{number}'),
+        )
+
+    def measure(self, round_, name, method):
+        url_kwargs, payload, expected_status, *_ = ROUTES[name, method]
+        url = reverse(f'api:{name}', kwargs=url_kwargs(round_) if url_kwargs else None)
+        data = payload(round_) if payload else None
+        # A new client per request, so no session cookie carries over between requests.
+        client = APIClient()
+        client.force_authenticate(getattr(round_, ROUND_USERS[name]) if name in ROUND_USERS else self.owner)
+        # Every request starts cold: no throttle buckets, cached feeds or typeahead prefixes.
+        for cache in caches.all():
+            cache.clear()
+        typeahead.prefix_cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data, **({'format': 'json'} if method != 'get' else {}))
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertEqual(
+            response.status_code, expected_status,
+            f"{method.upper()} {name}: {getattr(response, 'data', response.status_code)}",
+        )
+        # Savepoints come from running inside the test's transaction, not from the view.
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+        ]
+        return response, statements, elapsed
+
+    def report_full_scans(self, name, statements):
+        tables = set(connection.introspection.table_names())
+        for sql in statements:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = explain(sql)
+            if plan and is_full_scan(plan, tables):
+                print(f"\n[{name}] full scan:\n  {sql}\n  " + "\n  ".join(str(row) for row in plan))
+
+    def test_every_route_is_covered(self):
+        self.assertEqual({name for name, _ in ROUTES}, {pattern.name for pattern in urlpatterns})
+
+    def test_query_budgets(self):
+        counts = {route: [] for route in ROUTES}
+        for number, size in enumerate(SIZES, start=1):
+            round_ = self.seed(number, size)
+            self.rounds.append(round_)
+            for (name, method), (_, _, _, max_queries, *max_ms) in ROUTES.items():
+                response, statements, elapsed = self.measure(round_, name, method)
+                counts[name, method].append(len(statements))
+                label = f"{method.upper()} {name}"
+                with self.subTest(route=label, size=size):
+                    self.assertLessEqual(
+                        len(statements), max_queries,
+                        f"{label} ran {len(statements)} queries (budget {max_queries}):\n" + "\n".join(statements),
+                    )
+                    self.assertLessEqual(elapsed, (max_ms or [DEFAULT_MAX_MS])[0], f"{label} took {elapsed:.0f} ms")
+                if number == len(SIZES):
+                    self.report_full_scans(label, statements)
+
+        for (name, method), per_size in counts.items():
+            with self.subTest(route=f"{method.upper()} {name}"):
+                self.assertEqual(
+                    len(set(per_size)), 1,
+                    f"{method.upper()} {name}: query count grows with the data: {dict(zip(SIZES, per_size))}",
+                )
+
+
+class RecurrenceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, rule):
+        return self.client.post(reverse('api:task-list-create'), {
+            'title': 'Standup', 'description': 'd', 'due_date': '2030-01-07T09:00:00Z', 'recurrence_rule': rule,
+        }, format='json')
+
+    def test_occurrences_and_overrides(self):
+        response = self.create('FREQ=WEEKLY;COUNT=5')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertTrue(response.data['recurrence_end'].startswith('2030-02-04'))
+        url = reverse('api:task-occurrences', kwargs={'pk': response.data['id']})
+        window = '?start=2030-01-01T00:00:00Z&end=2030-03-01T00:00:00Z'
+
+        self.assertEqual(len(self.client.get(url + window).data), 5)
+        cancel = {'original_date': '2030-01-14T09:00:00Z', 'is_cancelled': True}
+        self.assertEqual(self.client.post(url, cancel, format='json').status_code, 201)
+        not_an_occurrence = {'original_date': '2030-01-15T09:00:00Z', 'is_cancelled': True}
+        self.assertEqual(self.client.post(url, not_an_occurrence, format='json').status_code, 400)
+        self.assertEqual(
+            [entry['is_cancelled'] for entry in self.client.get(url + window).data], [False, True, False, False, False]
+        )
+
+    def test_unbounded_and_empty_rules_are_rejected(self):
+        for rule in (
+            'FREQ=BOGUS',
+            'FREQ=SECONDLY;COUNT=2000000',
+            'FREQ=HOURLY',
+            'FREQ=DAILY;COUNT=100000',
+            'FREQ=DAILY;BYHOUR=9,10',
+            'FREQ=DAILY;UNTIL=22300101T000000Z',
+            'FREQ=YEARLY;COUNT=500',
+            'FREQ=DAILY;BYMONTH=2;BYMONTHDAY=30',
+            'FREQ=MONTHLY;BYMONTH=2;BYMONTHDAY=30',
+            'FREQ=DAILY;UNTIL=20200101T000000Z',
+        ):
+            with self.subTest(rule=rule):
+                started = time.perf_counter()
+                response = self.create(rule)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('recurrence_rule', response.data)
+                self.assertLess(time.perf_counter() - started, 2)
+        self.assertFalse(Task.objects.exists())
+
+    def test_series_end_is_only_recomputed_when_the_schedule_changes(self):
+        task = Task.objects.get(pk=self.create('FREQ=WEEKLY;COUNT=5').data['id'])
+        url = reverse('api:task-detail', kwargs={'pk': task.pk})
+        with mock.patch('api.recurrence.series_end', wraps=recurrence.series_end) as series_end:
+            self.assertEqual(self.client.patch(url, {'is_completed': True}, format='json').status_code, 200)
+            task.soft_delete()
+            task.restore()
+            series_end.assert_not_called()
+            response = self.client.patch(url, {'due_date': '2030-01-14T09:00:00Z'}, format='json')
+        self.assertTrue(response.data['recurrence_end'].startswith('2030-02-11'))
+        # Once to validate the new schedule, once to store its end.
+        self.assertEqual(series_end.call_count, 2)
+
+    def test_rules_stored_before_the_caps_still_save(self):
+        task = Task.objects.get(pk=self.create('FREQ=WEEKLY;COUNT=5').data['id'])
+        Task.objects.filter(pk=task.pk).update(recurrence_rule='FREQ=HOURLY;COUNT=100000')
+        task = Task.objects.get(pk=task.pk)
+        task.soft_delete()
+        task.restore()
+        task.recurrence_rule = 'FREQ=DAILY;COUNT=50000'
+        task.save()
+        # Cut off at MAX_SPAN instead of raising.
+        self.assertLessEqual(task.recurrence_end, task.due_date + recurrence.MAX_SPAN)
+
+
+class CalendarTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create(self, title, due_date, rule=''):
+        response = self.client.post(reverse('api:task-list-create'), {
+            'title': title, 'description': '<p>hi; there</p>', 'due_date': due_date, 'recurrence_rule': rule,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def test_window_expands_recurring_tasks(self):
+        self.create('weekly, thing', '2030-01-07T09:00:00Z', 'FREQ=WEEKLY;COUNT=5')
+        self.create('once', '2030-01-10T09:00:00Z')
+        self.create('later', '2031-01-10T09:00:00Z')
+        response = self.client.get(
+            reverse('api:task-calendar'), {'start': '2030-01-01T00:00:00Z', 'end': '2030-01-31T00:00:00Z'}
+        )
+        self.assertFalse(response.data['truncated'])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(
+            [entry['title'] for entry in response.data['results']], ['weekly, thing', 'once'] + ['weekly, thing'] * 3
+        )
+
+    def test_truncated_window_continues_from_next(self):
+        self.create('daily', '2030-01-01T09:00:00Z', 'FREQ=DAILY;COUNT=10')
+        self.create('same time', '2030-01-04T09:00:00Z')
+        url = reverse('api:task-calendar') + '?start=2030-01-01T00:00:00Z&end=2030-01-31T00:00:00Z'
+        pages = []
+        with mock.patch('api.recurrence.MAX_OCCURRENCES', 4):
+            while url:
+                response = self.client.get(url)
+                pages.append([entry['due_date'][:10] for entry in response.data['results']])
+                self.assertEqual(response.data['truncated'], response.data['next'] is not None)
+                url = response.data['next']
+        self.assertEqual(pages[0], ['2030-01-01', '2030-01-02', '2030-01-03', '2030-01-04'])
+        self.assertEqual(sum(pages, []), sorted(sum(pages, [])))
+        self.assertEqual(len(sum(pages, [])), 11)
+
+    def test_entries_at_one_instant_are_paged_through(self):
+        ids = [self.create(f'task {i}', '2030-01-04T09:00:00Z') for i in range(6)]
+        weekly = self.create('weekly', '2030-01-04T09:00:00Z', 'FREQ=WEEKLY;COUNT=3')
+        url = reverse('api:task-calendar') + '?start=2030-01-01T00:00:00Z&end=2030-01-31T00:00:00Z'
+        pages = []
+        with mock.patch('api.recurrence.MAX_OCCURRENCES', 4):
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200, response.data)
+                pages.append([entry['task'] for entry in response.data['results']])
+                url = response.data['next']
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        # Seven entries share the first instant; none is skipped or repeated.
+        self.assertEqual(sum(pages, []), ids + [weekly] * 3)
+
+    def test_ical_feed(self):
+        task_id = self.create('weekly, thing', '2030-01-07T09:00:00Z', 'FREQ=WEEKLY;COUNT=5')
+        url = self.client.get(reverse('api:calendar-feed-token')).data['url']
+        anonymous = APIClient()
+        response = anonymous.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('RRULE:FREQ=WEEKLY;COUNT=5', response.content.decode())
+        etag = response['ETag']
+        self.assertEqual(anonymous.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse('api:task-occurrences', kwargs={'pk': task_id}), {
+            'original_date': '2030-01-14T09:00:00Z', 'is_cancelled': True,
+        }, format='json')
+        response = anonymous.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('EXDATE:20300114T090000Z', response.content.decode())
+        self.assertEqual(anonymous.get(reverse('api:calendar-feed', kwargs={'token': 'nope'})).status_code, 404)
+
+
+@skipUnless('replica' in settings.DATABASES, "needs a `replica` database alias (see productivity_pro/test_settings.py)")
+@override_settings(REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_router(self):
+        self.assertEqual(router.db_for_read(Note), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Note), 'replica')
+            self.assertEqual(router.db_for_write(Note), 'default')
+            note = Note.objects.create(user=self.user, title='t', content='c')
+            self.assertEqual(note._state.db, 'default')
+        # Related lookups stay on the database the instance came from.
+        note = Note.objects.using('replica').get(pk=note.pk)
+        self.assertEqual(router.db_for_read(User, instance=note), 'replica')
+
+    def test_reads_go_to_the_replica_until_the_user_writes(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.client.get(reverse('api:note-list-create')).status_code, 200)
+        self.assertGreater(len(replica), 0)
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.post(reverse('api:note-list-create'), {'title': 't', 'content': 'c'}, format='json')
+            self.assertEqual(response.status_code, 201)
+            # Read-your-writes: the next read is served by the primary and sees the note.
+            response = self.client.get(reverse('api:note-list-create'))
+        self.assertEqual(len(replica), 0)
+        self.assertEqual(response.data['count'], 1)
+
+        # Other users are not pinned by someone else's write.
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', 'other@example.com', 'pw'))
+        with CaptureQueriesContext(connections['replica']) as replica:
+            other.get(reverse('api:note-list-create'))
+        self.assertGreater(len(replica), 0)
+
+    def test_restoring_from_the_trash_pins_reads_to_the_primary(self):
+        note = Note.objects.create(user=self.user, title='t', content='c')
+        note.soft_delete()
+        task = Task.objects.create(user=self.user, title='t', description='d', due_date=timezone.now())
+        task.soft_delete()
+        restores = [
+            ('api:trash-note-restore', note, 'api:note-list-create'),
+            ('api:trash-task-restore', task, 'api:task-list-create'),
+        ]
+        for restore, instance, listing in restores:
+            with self.subTest(restore=restore):
+                cache.clear()
+                response = self.client.post(reverse(restore, kwargs={'pk': instance.pk}))
+                self.assertEqual(response.status_code, 200)
+                with CaptureQueriesContext(connections['replica']) as replica:
+                    response = self.client.get(reverse(listing))
+                self.assertEqual(len(replica), 0)
+                self.assertEqual([item['id'] for item in response.data['results']], [instance.pk])
+
+    def test_stickiness_expires(self):
+        with override_settings(REPLICA_STICKY_SECONDS=1):
+            mark_write(self.user)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get(reverse('api:note-list-create'))
+        self.assertEqual(len(replica), 0)
+        time.sleep(1.1)
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.client.get(reverse('api:note-list-create'))
+        self.assertGreater(len(replica), 0)
+
+
+class ConnectionReuseTests(TestCase):
+    def setUp(self):
+        connection_metrics.reset()
+
+    @skipUnless(connection.vendor == 'sqlite' and hasattr(connection, 'checkout'), "needs api.db.backends.sqlite3")
+    def test_connections_are_reused_then_recycled(self):
+        # A file database: SQLite never closes the in-memory test database.
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        default = connections['default']
+        wrapper = type(default)({
+            **default.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3'), 'CONN_MAX_USES': 2,
+        }, 'default')
+        wrapper.ensure_connection()
+        wrapper.checkout()
+        wrapper.checkout()
+        # The third checkout is over CONN_MAX_USES: the connection is closed instead.
+        wrapper.checkout()
+        self.assertIsNone(wrapper.connection)
+        counters = connection_metrics.snapshot()['default']
+        self.assertEqual((counters['opened'], counters['reused'], counters['closed']), (1, 2, 1))
+        self.assertEqual(counters['reuse_ratio'], 2 / 3)
+
+    @skipUnless(hasattr(connection, 'checkout'), "needs an api.db.backends engine")
+    def test_requests_count_reuses(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('owner', 'owner@example.com', 'pw'))
+        for _ in range(3):
+            client.get(reverse('api:note-list-create'))
+        self.assertEqual(connection_metrics.snapshot()['default']['reused'], 3)
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_auth_floods_get_retry_after(self):
+        client = APIClient()
+        url = reverse('api:login')
+        codes = [client.post(url, {'username': 'x', 'password': 'y'}).status_code for _ in range(12)]
+        self.assertIn(429, codes)
+        self.assertIn('Retry-After', client.post(url, {'username': 'x', 'password': 'y'}))
+
+    def test_search_has_its_own_budget(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('owner', 'owner@example.com', 'pw'))
+        codes = [client.get(reverse('api:task-list-create'), {'search': 'x'}).status_code for _ in range(32)]
+        self.assertEqual(codes.count(429), 2)
+        self.assertEqual(client.get(reverse('api:task-list-create')).status_code, 200)
+
+    def test_concurrent_requests_never_overdraw_the_bucket(self):
+        class SlowCache:
+            """The shared cache, with reads slow enough for concurrent updates to interleave."""
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def get(self, *args):
+                value = cache.get(*args)
+                time.sleep(0.002)
+                return value
+
+        class Throttle(TokenBucketThrottle):
+            rate = '3/min'
+
+            def get_cache_key(self, request, view):
+                return 'throttle_test_bucket'
+
+        admitted = []
+        barrier = threading.Barrier(8)
+
+        def request():
+            barrier.wait()
+            admitted.append(Throttle().allow_request(None, None))
+
+        with mock.patch.object(Throttle, 'cache', SlowCache()):
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(admitted.count(True), 3)
+
+    def test_a_bucket_that_stays_locked_fails_open(self):
+        class Throttle(TokenBucketThrottle):
+            rate = '1/min'
+
+            def get_cache_key(self, request, view):
+                return 'throttle_test_bucket'
+
+        with mock.patch.object(cache, 'add', return_value=False), mock.patch('api.throttling.LOCK_RETRY_DELAY', 0):
+            self.assertEqual([Throttle().allow_request(None, None) for _ in range(3)], [True] * 3)
+
+    @override_settings(THROTTLE_REDIS_URL='redis://throttle.example:6379/0')
+    def test_redis_buckets_register_the_script_once(self):
+        class Throttle(TokenBucketThrottle):
+            rate = '3/min'
+
+            def get_cache_key(self, request, view):
+                return 'throttle_test_bucket'
+
+        bucket_script.cache_clear()
+        self.addCleanup(bucket_script.cache_clear)
+        with mock.patch('redis.Redis.from_url') as from_url:
+            script = from_url.return_value.register_script.return_value
+            script.return_value = [1, b'2.5']
+            self.assertTrue(Throttle().allow_request(None, None))
+            script.return_value = [0, b'0.5']
+            throttle = Throttle()
+            self.assertFalse(throttle.allow_request(None, None))
+
+        from_url.assert_called_once_with('redis://throttle.example:6379/0')
+        from_url.return_value.register_script.assert_called_once_with(TAKE_TOKEN)
+        self.assertEqual(script.call_count, 2)
+        self.assertEqual(script.call_args.kwargs['keys'], [cache.make_and_validate_key('throttle_test_bucket:bucket')])
+        self.assertEqual(script.call_args.kwargs['args'][:2], [3, 3 / 60])
+        self.assertEqual(throttle.wait(), 10)
+
+    @override_settings(ADMISSION_MAX_INFLIGHT_REQUESTS=1)
+    def test_requests_over_the_inflight_cap_are_shed(self):
+        responses = []
+
+        def view(request):
+            # A second request arrives while this one still holds the only slot.
+            responses.append(middleware(RequestFactory().get('/api/notes/')))
+            return responses[-1]
+
+        middleware = AdmissionControlMiddleware(view)
+        middleware(RequestFactory().get('/api/notes/'))
+        self.assertEqual((responses[0].status_code, responses[0]['Retry-After']), (429, '1'))
+        # The slot is free again once the first request has returned.
+        self.assertTrue(middleware.slots.acquire(blocking=False))
+
+
+class SchemaTests(TestCase):
+    def setUp(self):
+        load_artifact.cache_clear()
+
+    def test_schema_is_served_from_the_artifact(self):
+        response = self.client.get(reverse('schema-json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('/notes/', json.loads(response.content)['paths'])
+        compressed = self.client.get(reverse('schema-json'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        self.assertEqual(self.client.get(reverse('schema-json'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertIn(b'/swagger.json', self.client.get(reverse('schema-swagger-ui')).content)
+        self.assertEqual(self.client.get('/swagger.yaml').status_code, 200)
+
+
+class LazyImportTests(TestCase):
+    def loaded(self, role, modules):
+        """The ``modules`` a fresh ``role`` process loads importing the API and reversing a URL."""
+        script = (
+            "import sys, django; django.setup(); import api.views, api.serializers, api.task; "
+            "from django.urls import reverse; reverse('api:note-detail', kwargs={'pk': 1}); "
+            f"print(','.join(name for name in {modules!r} if name in sys.modules))"
+        )
+        env = {**os.environ, 'REMINO_PROCESS_ROLE': role}
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        return result.stdout.strip()
+
+    def test_worker_skips_web_only_packages(self):
+        self.assertEqual(self.loaded('worker', ('corsheaders', 'drf_yasg', 'rest_framework_simplejwt', 'tinymce')), '')
+
+    def test_web_defers_docs_and_jwt(self):
+        self.assertEqual(self.loaded('web', ('drf_yasg.generators', 'drf_yasg.views', 'rest_framework_simplejwt')), '')
+        self.assertEqual(self.client.get(reverse('schema-swagger-ui')).status_code, 200)
+
+
+@skipUnless(settings.CELERY_BROKER_URL.startswith('memory://'), "needs the in-memory Celery broker")
+class TaskQueueTests(TestCase):
+    def test_routes(self):
+        expected = {
+            'api.task.send_share_notification': ('mail.transactional', 0),
+            'api.task.send_task_reminder': ('mail.bulk', 6),
+            'api.task.send_task_reminders': ('maintenance', 3),
+            'api.task.purge_deleted_items': ('maintenance', 9),
+            'api.task.archive_completed_tasks': ('maintenance', 9),
+            'api.task.reconcile_storage_usage': ('maintenance', 9),
+        }
+        for name, (queue, priority) in expected.items():
+            with self.subTest(task=name):
+                self.assertIn(name, app.tasks)
+                route = app.amqp.router.route({}, name)
+                self.assertEqual((route['queue'].name, route['priority']), (queue, priority))
+
+    @skipIf(app.conf.task_always_eager, "tasks run eagerly instead of going through the broker")
+    def test_share_notification_is_queued_on_the_transactional_queue(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        User.objects.create_user('partner', 'partner@example.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(owner)
+        with app.connection_for_read() as conn:
+            queue = conn.SimpleQueue('mail.transactional', no_ack=True)
+            queue.clear()
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.post(reverse('api:note-list-create'), {
+                    'title': 't', 'content': 'c', 'shared_with': ['partner@example.com'],
+                }, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+            message = queue.get(timeout=1)
+            queue.close()
+
+        self.assertEqual(message.headers['task'], 'api.task.send_share_notification')
+        args, kwargs, _ = message.payload
+        app.tasks[message.headers['task']](*args, **kwargs)
+        self.assertEqual([sent.to for sent in mail.outbox], [['partner@example.com']])
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_trash_and_restore(self):
+        note = Note.objects.create(user=self.user, title='n', content='c')
+        self.assertEqual(self.client.delete(reverse('api:note-detail', kwargs={'pk': note.pk})).status_code, 204)
+        self.assertEqual(self.client.get(reverse('api:note-list-create')).data['count'], 0)
+        self.assertEqual(self.client.get(reverse('api:trash-notes')).data['count'], 1)
+        response = self.client.post(reverse('api:trash-note-restore', kwargs={'pk': note.pk}))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertFalse(Note.objects.get(pk=note.pk).is_deleted)
+
+    @override_settings(PURGE_CHUNK_SIZE=2)
+    def test_account_delete_purges_in_chunks(self):
+        category = Category.objects.create(user=self.user, name='x')
+        for i in range(5):
+            Note.objects.create(user=self.user, title=str(i), content='c', category=category)
+            Task.objects.create(user=self.user, title=str(i), description='d', due_date=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('api:account-delete'))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual((Note.objects.count(), Task.objects.count()), (0, 0))
+        # The job queued on commit; run it here in case tasks are not eager.
+        purge_user(self.user.pk)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual((Note.all_objects.count(), Task.all_objects.count()), (0, 0))
+
+    def test_purge_respects_retention(self):
+        expired = Note.objects.create(user=self.user, title='n', content='c')
+        Note.all_objects.filter(pk=expired.pk).update(deleted_at=timezone.now() - timedelta(days=31))
+        recent = Note.objects.create(user=self.user, title='m', content='c')
+        recent.soft_delete()
+        purge_deleted_items()
+        self.assertEqual(list(Note.all_objects.values_list('pk', flat=True)), [recent.pk])
+
+    def test_deleting_a_category_keeps_it_for_trashed_notes(self):
+        category = Category.objects.create(user=self.user, name='work')
+        note = Note.objects.create(user=self.user, title='n', content='c', category=category)
+        note.soft_delete()
+        url = reverse('api:category-detail', kwargs={'pk': category.pk})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get(reverse('api:category-list-create')).data['count'], 0)
+        self.assertEqual(Note.all_objects.get(pk=note.pk).category_id, category.pk)
+
+        self.client.post(reverse('api:trash-note-restore', kwargs={'pk': note.pk}))
+        self.assertEqual(self.client.get(reverse('api:note-detail', kwargs={'pk': note.pk})).data['category'], category.pk)
+        self.assertFalse(Category.objects.get(pk=category.pk).is_deleted)
+
+        # A deleted category is purged once no note points at it; until then its name
+        # brings it back.
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        Note.objects.filter(pk=note.pk).update(category=None)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        response = self.client.post(reverse('api:category-list-create'), {'name': 'work'}, format='json')
+        self.assertEqual((response.status_code, response.data['id']), (201, category.pk))
+        self.client.delete(url)
+        Category.all_objects.filter(pk=category.pk).update(deleted_at=timezone.now() - timedelta(days=31))
+        purge_deleted_items()
+        self.assertFalse(Category.all_objects.exists())
+
+
+class BodyStorageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_large_bodies_are_compressed_and_loaded_lazily(self):
+        content = '<p>hello world</p>' * 5000
+        response = self.client.post(reverse('api:note-list-create'), {'title': 't', 'content': content}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        pk = response.data['id']
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT text FROM {NoteBody._meta.db_table} WHERE note_id = %s', [pk])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertEqual(stored[:1], b'z')
+        self.assertLess(len(stored), len(content) / 10)
+
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(reverse('api:note-list-create')).data['results']
+        self.assertNotIn('content', results[0])
+        self.assertFalse(any('notebody' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(self.client.get(reverse('api:note-detail', kwargs={'pk': pk})).data['content'], content)
+        self.client.patch(reverse('api:note-detail', kwargs={'pk': pk}), {'content': 'short'}, format='json')
+        self.assertEqual((Note.objects.get(pk=pk).content, NoteBody.objects.count()), ('short', 1))
+        self.assertEqual(self.client.get(reverse('api:note-list-create'), {'search': 't'}).data['count'], 1)
+
+    def test_task_descriptions_stay_searchable(self):
+        for title, description in (('a', '<p>Call the <b>plumber</b> &amp; pay</p>'), ('b', '<p>nothing</p>')):
+            response = self.client.post(reverse('api:task-list-create'), {
+                'title': title, 'description': description, 'due_date': '2030-01-01T09:00:00Z',
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+
+        def search(term):
+            response = self.client.get(reverse('api:task-list-create'), {'search': term})
+            return [task['title'] for task in response.data['results']]
+
+        self.assertEqual(search('plumber & pay'), ['a'])
+        self.assertEqual(search('<b>'), [])
+        task = Task.objects.get(title='a')
+        self.client.patch(reverse('api:task-detail', kwargs={'pk': task.pk}), {'description': 'gas'}, format='json')
+        self.assertEqual((search('plumber'), search('gas')), ([], ['a']))
+
+
+class NoteRevisionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def patch(self, pk, base_revision, insert, **extra):
+        return self.client.patch(reverse('api:note-detail', kwargs={'pk': pk}), {
+            'content_patch': [{'offset': 3, 'delete': 4, 'insert': insert}], 'base_revision': base_revision, **extra,
+        }, format='json')
+
+    def test_history(self):
+        body = '<p>' + 'word ' * 2000 + '</p>'
+        response = self.client.post(reverse('api:note-list-create'), {'title': 't', 'content': body}, format='json')
+        pk = response.data['id']
+        self.assertEqual(response.data['revision'], 1)
+        versions = [body]
+        for i in range(45):
+            response = self.patch(pk, i + 1, f'edit{i}')
+            self.assertEqual(response.status_code, 200, response.data)
+            versions.append(versions[-1][:3] + f'edit{i}' + versions[-1][7:])
+            self.assertEqual(response.data['content'], versions[-1])
+        self.assertEqual(NoteRevision.objects.filter(note_id=pk).count(), 46)
+        self.assertEqual(NoteRevision.objects.filter(note_id=pk, is_snapshot=True).count(), 3)
+        for number in (1, 2, 20, 21, 33, 46):
+            url = reverse('api:note-revision-detail', kwargs={'pk': pk, 'number': number})
+            self.assertEqual(self.client.get(url).data['content'], versions[number - 1])
+
+        response = self.client.post(reverse('api:note-revision-restore', kwargs={'pk': pk, 'number': 5}))
+        self.assertEqual((response.data['content'], response.data['revision']), (versions[4], 47))
+        self.client.patch(reverse('api:note-detail', kwargs={'pk': pk}), {'title': 'new'}, format='json')
+        self.assertEqual(Note.objects.get(pk=pk).revision, 47)
+
+    def test_stale_base_revision_is_a_conflict(self):
+        note = Note.objects.create(user=self.user, title='t', content='<p>first</p>')
+        self.assertEqual(self.patch(note.pk, 1, 'one').status_code, 200)
+        response = self.patch(note.pk, 1, 'two')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Note.objects.get(pk=note.pk).content, '<p>onet</p>')
+
+    def test_concurrent_saves_conflict_instead_of_failing(self):
+        note = Note.objects.create(user=self.user, title='t', content='<p>first</p>')
+        first, second = Note.objects.get(pk=note.pk), Note.objects.get(pk=note.pk)
+        first.content = '<p>one</p>'
+        first.save()
+        second.content = '<p>two</p>'
+        with self.assertRaises(revisions.RevisionConflict):
+            second.save()
+        self.assertEqual((Note.objects.get(pk=note.pk).revision, note.revisions.count()), (2, 2))
+
+    def test_patch_racing_another_save_is_a_conflict(self):
+        note = Note.objects.create(user=self.user, title='t', content='<p>first</p>')
+        tag = Tag.objects.create(user=self.user, name='work')
+        apply_splices = revisions.apply_splices
+
+        def concurrent_save(text, splices):
+            # Another request saves the note after this one has read it.
+            other = Note.objects.get(pk=note.pk)
+            other.content = '<p>theirs</p>'
+            other.save()
+            return apply_splices(text, splices)
+
+        with mock.patch('api.revisions.apply_splices', concurrent_save):
+            response = self.patch(note.pk, 1, 'mine', tags=[tag.pk])
+        self.assertEqual(response.status_code, 409)
+        # The other save is kept; nothing from the conflicting request is.
+        note = Note.objects.get(pk=note.pk)
+        self.assertEqual((note.content, note.revision, note.revisions.count()), ('<p>theirs</p>', 2, 2))
+        self.assertFalse(note.tags.exists())
+
+
+class ResponseCompressionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('owner', 'owner@example.com', 'pw'))
+
+    def test_large_json_responses_are_gzipped(self):
+        content = '<p>hello</p>' * 1000
+        response = self.client.post(
+            reverse('api:note-list-create'), json.dumps({'title': 't', 'content': content}),
+            content_type='application/json', HTTP_ACCEPT_ENCODING='gzip',
+        )
+        self.assertEqual((response.status_code, response['Content-Encoding']), (201, 'gzip'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        pk = json.loads(gzip.decompress(response.content))['id']
+        response = self.client.get(reverse('api:note-detail', kwargs={'pk': pk}))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.json()['content'], content)
+
+    def test_small_and_html_responses_are_left_alone(self):
+        response = self.client.get(reverse('api:note-list-create'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('api:note-list-create'), {'format': 'api'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_responses_with_credentials_are_not_compressed(self):
+        User.objects.create_user('login', 'login@example.com', 'pw')
+        responses = [
+            APIClient().post(reverse('api:login'), {'username': 'login', 'password': 'pw'},
+                             format='json', HTTP_ACCEPT_ENCODING='gzip'),
+            self.client.post(reverse('api:change-stream-ticket'), HTTP_ACCEPT_ENCODING='gzip'),
+            self.client.post(reverse('api:calendar-feed-token'), HTTP_ACCEPT_ENCODING='gzip'),
+        ]
+        for response in responses:
+            with self.subTest(path=response.request['PATH_INFO']):
+                self.assertLess(response.status_code, 300)
+                self.assertFalse(response.has_header('Content-Encoding'))
+        pk = self.client.post(reverse('api:note-list-create'), {'title': 't', 'content': 'x' * 100}, format='json').data['id']
+        response = self.client.get(reverse('api:note-detail', kwargs={'pk': pk}), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_orjson_output_matches_json_renderer(self):
+        category = self.client.post(reverse('api:category-list-create'), {'name': 'Work'}, format='json').data
+        note = self.client.post(reverse('api:note-list-create'), {
+            'title': 'caf\u00e9 \u2028', 'content': '<p>x</p>', 'category': category['id'], 'tags': ['a'],
+        }, format='json').data
+        task = self.client.post(reverse('api:task-list-create'), {
+            'title': 't', 'description': '<p>d</p>', 'due_date': '2026-01-05T09:00:00Z',
+            'recurrence_rule': 'FREQ=WEEKLY;COUNT=3',
+        }, format='json').data
+        samples = [
+            self.client.get(reverse(name), query).data
+            for name, query in [
+                ('api:note-list-create', {}), ('api:task-list-create', {}), ('api:category-list-create', {}),
+                ('api:tag-list-create', {}), ('api:task-calendar', {'start': '2026-01-01', 'end': '2026-02-01'}),
+            ]
+        ] + [note, task, {'at': timezone.now(), 'amount': Decimal('1.10'), 1: 'int key'}]
+        for data in samples:
+            with self.subTest(data=data):
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parsers(self):
+        response = self.client.post(reverse('api:note-list-create'), '{bad', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+        self.assertEqual(self.client.post(reverse('api:note-list-create'), {'title': 'form', 'content': 'x'}).status_code, 201)
+
+
+class ChangeStreamTests(TestCase):
+    class Recorder:
+        def __init__(self):
+            self.sent = []
+
+        def publish(self, channel, message):
+            self.sent.append((channel, message))
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_changes_reach_the_owner_and_recipients(self):
+        recorder = self.Recorder()
+        with mock.patch.object(events, 'get_broker', return_value=recorder):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('api:note-list-create'), {
+                    'title': 't', 'content': 'x', 'shared_with': [self.other.email],
+                }, format='json')
+            self.assertIn(events.user_channel(self.other.pk), [channel for channel, _ in recorder.sent])
+            recorder.sent.clear()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(reverse('api:note-detail', kwargs={'pk': response.data['id']}))
+        self.assertEqual(
+            sorted(channel for channel, _ in recorder.sent),
+            sorted([events.user_channel(self.user.pk), events.user_channel(self.other.pk)]),
+        )
+        self.assertEqual(recorder.sent[0][1]['action'], 'deleted')
+
+    def test_revoked_users_are_told(self):
+        third = User.objects.create_user('third', 'third@example.com', 'pw')
+        recorder = self.Recorder()
+        with mock.patch.object(events, 'get_broker', return_value=recorder):
+            with self.captureOnCommitCallbacks(execute=True):
+                pk = self.client.post(reverse('api:note-list-create'), {
+                    'title': 't', 'content': 'x', 'shared_with': [self.other.email, third.email],
+                }, format='json').data['id']
+            self.assertIn((events.user_channel(third.pk), 'shared'), [(c, m['action']) for c, m in recorder.sent])
+            for shared_with, revoked in [([self.other.email], third), ([], self.other)]:
+                recorder.sent.clear()
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.patch(reverse('api:note-detail', kwargs={'pk': pk}), {'shared_with': shared_with}, format='json')
+                self.assertIn((events.user_channel(revoked.pk), 'unshared'), [(c, m['action']) for c, m in recorder.sent])
+                self.assertNotIn((events.user_channel(revoked.pk), 'updated'), [(c, m['action']) for c, m in recorder.sent])
+
+    def test_saves_reuse_the_prefetched_shares(self):
+        pk = self.client.post(reverse('api:note-list-create'), {
+            'title': 't', 'content': 'x', 'shared_with': [self.other.email],
+        }, format='json').data['id']
+        note = Note.objects.prefetch_related('shared_with').get(pk=pk)
+        recorder = self.Recorder()
+        table = Note.shared_with.through._meta.db_table
+        with mock.patch.object(events, 'get_broker', return_value=recorder):
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                note.title = 'renamed'
+                note.save()
+        self.assertEqual([q['sql'] for q in queries if table in q['sql']], [])
+        self.assertIn(events.user_channel(self.other.pk), [channel for channel, _ in recorder.sent])
+
+    def test_tickets(self):
+        ticket = self.client.post(reverse('api:change-stream-ticket')).data['ticket']
+        self.assertEqual(events.read_ticket(ticket), self.user.pk)
+        self.assertIsNone(events.read_ticket('junk'))
+        self.assertEqual(self.client.get(reverse('api:change-stream'), {'ticket': 'junk'}).status_code, 401)
+
+    async def test_stream(self):
+        stream = events.stream(999)
+        self.assertTrue((await stream.__anext__()).startswith('retry:'))
+        events.get_broker().publish(events.user_channel(999), {'type': 'task', 'id': 2})
+        self.assertTrue((await stream.__anext__()).startswith('event: task\n'))
+        await stream.aclose()
+        self.assertNotIn(events.user_channel(999), events.get_broker()._subscribers)
+
+
+@override_settings(ARCHIVE_CHUNK_SIZE=2)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_completed_at_follows_is_completed(self):
+        task = Task.objects.create(user=self.user, title='t', description='d', due_date=timezone.now())
+        self.assertIsNone(task.completed_at)
+        url = reverse('api:task-detail', kwargs={'pk': task.pk})
+        self.assertIsNotNone(self.client.patch(url, {'is_completed': True}, format='json').data['completed_at'])
+        self.assertIsNone(self.client.patch(url, {'is_completed': False}, format='json').data['completed_at'])
+
+    def test_old_completed_tasks_are_archived(self):
+        due = timezone.now()
+        for i in range(5):
+            task = Task.objects.create(user=self.user, title=f'old{i}', description=f'<p>d{i}</p>', due_date=due, is_completed=True)
+            task.shared_with.add(self.other)
+        Task.objects.update(completed_at=timezone.now() - timedelta(days=100))
+        Task.objects.create(user=self.user, title='recent', description='r', due_date=due, is_completed=True)
+        Task.objects.create(user=self.user, title='active', description='a', due_date=due)
+        old = sorted(Task.objects.filter(title__startswith='old').values_list('pk', flat=True))
+        archive_completed_tasks()
+        self.assertEqual(sorted(ArchivedTask.objects.values_list('pk', flat=True)), old)
+        self.assertEqual(self.client.get(reverse('api:task-list-create')).data['count'], 2)
+
+        response = self.client.get(reverse('api:task-archive'))
+        self.assertEqual(response.data['count'], 5)
+        self.assertNotIn('description', response.data['results'][0])
+        detail = self.client.get(reverse('api:task-archive-detail', kwargs={'pk': old[0]}))
+        self.assertEqual(detail.data['description'], '<p>d0</p>')
+        self.assertEqual(self.client.get(reverse('api:task-archive'), {'search': 'd3'}).data['count'], 1)
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(other.get(reverse('api:task-archive')).data['count'], 5)
+
+        self.user.is_active = False
+        self.user.save()
+        purge_user(self.user.pk)
+        self.assertFalse(ArchivedTask.objects.exists())
+
+
+class TagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.other)
+
+    def tag(self, name, client=None):
+        return (client or self.client).post(reverse('api:tag-list-create'), {'name': name}, format='json')
+
+    def note(self, title, tags, **extra):
+        response = self.client.post(reverse('api:note-list-create'), {
+            'title': title, 'content': 'x', 'tags': tags, **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def note_ids(self, **params):
+        return sorted(item['id'] for item in self.client.get(reverse('api:note-list-create'), params).data['results'])
+
+    def facets(self, client=None):
+        return {facet['name']: facet for facet in (client or self.client).get(reverse('api:tag-facets')).data}
+
+    def snapshot(self):
+        return {
+            (facet.user_id, facet.tag_id, facet.notes_count, facet.tasks_count)
+            for facet in TagFacet.objects.all() if facet.notes_count or facet.tasks_count
+        }
+
+    def assertFacetsConsistent(self):
+        before = self.snapshot()
+        rebuild_facets([self.user.pk, self.other.pk])
+        self.assertEqual(self.snapshot(), before)
+
+    def test_filtering_and_facets(self):
+        work, home = self.tag('work').data['id'], self.tag('home').data['id']
+        self.assertEqual(self.tag('work').status_code, 400)
+        foreign = self.tag('mine', self.other_client).data['id']
+        both = self.note('both', [work, home])
+        shared = self.note('shared', [work], shared_with=[self.other.email])
+        homely = self.note('home', [home])
+        response = self.client.post(reverse('api:note-list-create'), {
+            'title': 'bad', 'content': 'x', 'tags': [foreign],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.assertEqual(self.note_ids(tags=f'{work},{home}'), [both])
+        self.assertEqual(self.note_ids(tags=f'{work},{home}', tag_match='any'), sorted([both, shared, homely]))
+        self.assertEqual(self.client.get(reverse('api:note-list-create'), {'tags': 'x'}).status_code, 400)
+        facets = self.facets()
+        self.assertEqual((facets['work']['notes_count'], facets['home']['notes_count']), (2, 2))
+        facets = self.facets(self.other_client)
+        self.assertEqual(facets['work']['notes_count'], 1)
+        self.assertNotIn('home', facets)
+
+        self.assertEqual(self.client.delete(reverse('api:tag-detail', kwargs={'pk': home})).status_code, 204)
+        self.assertEqual(self.client.get(reverse('api:note-detail', kwargs={'pk': homely})).data['tags'], [])
+
+    def test_facets_follow_edits_trash_and_archive(self):
+        work, home = self.tag('work').data['id'], self.tag('home').data['id']
+        first, second = self.note('first', [work, home]), self.note('second', [work])
+        self.client.patch(reverse('api:note-detail', kwargs={'pk': second}), {
+            'tags': [work, home], 'shared_with': [self.other.email],
+        }, format='json')
+        self.client.patch(reverse('api:note-detail', kwargs={'pk': first}), {'tags': []}, format='json')
+        self.client.delete(reverse('api:note-detail', kwargs={'pk': second}))
+        task = self.client.post(reverse('api:task-list-create'), {
+            'title': 't', 'description': 'd', 'due_date': timezone.now().isoformat(), 'tags': [work],
+            'shared_with': [self.other.email],
+        }, format='json').data['id']
+        self.assertEqual(
+            [item['id'] for item in self.client.get(reverse('api:task-list-create'), {'tags': work}).data['results']],
+            [task],
+        )
+        self.assertFacetsConsistent()
+        self.client.post(reverse('api:trash-note-restore', kwargs={'pk': second}))
+        self.assertFacetsConsistent()
+        Task.objects.filter(pk=task).update(is_completed=True, completed_at=timezone.now() - timedelta(days=100))
+        archive_completed_tasks()
+        self.assertFacetsConsistent()
+        self.assertEqual(self.facets()['work']['tasks_count'], 0)
+
+
+@override_settings(STORAGE_QUOTA_BYTES=10000)
+class StorageQuotaTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def usage(self):
+        usage = StorageUsage.objects.get(user=self.user)
+        return usage.content_bytes, usage.file_bytes
+
+    def create_note(self, content, size=None):
+        data = {'title': 'n', 'content': content}
+        if size is not None:
+            data['file'] = SimpleUploadedFile('a.txt', b'x' * size)
+        return self.client.post(reverse('api:note-list-create'), data, format='multipart')
+
+    def test_counters_follow_writes_and_purges(self):
+        response = self.create_note('héllo', 1000)
+        self.assertEqual(response.status_code, 201, response.data)
+        pk = response.data['id']
+        self.assertEqual(self.usage(), (6, 1000))
+        path = Note.objects.get(pk=pk).file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('api:note-detail', kwargs={'pk': pk}), {
+                'file': SimpleUploadedFile('b.txt', b'y' * 300),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.usage(), (6, 300))
+        self.assertFalse(os.path.exists(path))
+        self.client.post(reverse('api:task-list-create'), {
+            'title': 't', 'description': 'abc', 'due_date': timezone.now().isoformat(),
+        }, format='json')
+        self.assertEqual(self.client.get(reverse('api:storage-usage')).data['total_bytes'], 309)
+
+        StorageUsage.objects.filter(user=self.user).update(content_bytes=999, file_bytes=0)
+        NoteBody.objects.update(size=None)
+        reconcile_storage_usage()
+        self.assertEqual(self.usage(), (9, 300))
+        self.client.delete(reverse('api:note-detail', kwargs={'pk': pk}))
+        Note.all_objects.update(deleted_at=timezone.now() - timedelta(days=60))
+        purge_deleted_items()
+        self.assertEqual(self.usage(), (3, 0))
+
+    def test_uploads_over_quota_are_rejected(self):
+        response = self.create_note('x', 10001)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('storage', response.data)
+
+    def test_content_patch_is_counted_after_splicing(self):
+        note = Note.objects.create(user=self.user, title='n', content='<p>x</p>')
+        response = self.client.patch(reverse('api:note-detail', kwargs={'pk': note.pk}), {
+            'content_patch': [{'offset': 3, 'insert': 'y' * 10000}], 'base_revision': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('storage', response.data)
+        self.assertEqual(Note.objects.get(pk=note.pk).content, '<p>x</p>')
+
+    def test_replaced_attachment_is_not_counted_twice(self):
+        pk = self.create_note('x', 6000).data['id']
+        response = self.client.patch(reverse('api:note-detail', kwargs={'pk': pk}), {
+            'file': SimpleUploadedFile('b.txt', b'y' * 5000),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.usage(), (1, 5000))
+
+
+@override_settings(ADMIN_ACTION_CHUNK_SIZE=3)
+class AdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pw'))
+        self.users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw') for i in range(5)]
+        self.tag = Tag.objects.create(user=self.users[0], name='t')
+        for i in range(10):
+            user = self.users[i % 5]
+            note = Note.objects.create(
+                user=user, title=f'n{i}', content='x', category=Category.objects.create(user=user, name=f'c{i}'),
+            )
+            if i % 5 == 0:
+                note.tags.add(self.tag)
+            Task.objects.create(user=user, title=f't{i}', description='x', due_date=timezone.now())
+
+    def test_changelists_and_forms(self):
+        for name in ('note', 'task', 'category'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(f'admin:api_{name}_changelist'))
+            self.assertEqual(response.status_code, 200)
+            # No per-row queries: the count does not grow with the ten rows listed.
+            self.assertLess(len(queries), 15, name)
+        self.assertEqual(self.client.get(reverse('admin:api_note_changelist'), {'q': 'n1'}).status_code, 200)
+        response = self.client.get(reverse('admin:api_note_change', args=[Note.objects.first().pk]))
+        self.assertContains(response, 'admin-autocomplete')
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'api', 'model_name': 'note', 'field_name': 'shared_with', 'term': 'user1',
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_actions(self):
+        changelist = reverse('admin:api_note_changelist')
+        ids = list(Note.objects.values_list('pk', flat=True))
+        self.assertEqual(TagFacet.objects.get(user=self.users[0], tag=self.tag).notes_count, 2)
+        response = self.client.post(changelist, {'action': 'move_to_trash', '_selected_action': ids})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Note.objects.exists())
+        self.assertFalse(TagFacet.objects.filter(user=self.users[0], tag=self.tag, notes_count__gt=0).exists())
+        self.client.post(changelist, {'action': 'restore_from_trash', '_selected_action': ids[:4]})
+        self.assertEqual(Note.objects.count(), 4)
+
+        tasks = list(Task.objects.values_list('pk', flat=True))
+        self.client.post(reverse('admin:api_task_changelist'), {'action': 'mark_completed', '_selected_action': tasks})
+        self.assertEqual(Task.objects.filter(is_completed=True, completed_at__isnull=False).count(), 10)
+        self.client.post(reverse('admin:api_task_delete', args=[tasks[0]]), {'post': 'yes'})
+        self.assertEqual((Task.all_objects.count(), Task.objects.count()), (10, 9))
+
+    def test_bodies_are_edited_on_the_change_form(self):
+        note = Note.objects.filter(user=self.users[0]).first()
+        url = reverse('admin:api_note_change', args=[note.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.context['adminform'].form.initial['content'], 'x')
+        data = {
+            'user': note.user_id, 'title': 'edited', 'content': '<p>new body</p>', 'category': note.category_id,
+            'tags': [self.tag.pk], 'shared_with': [], 'is_shared': '',
+        }
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302, response.context and response.context['adminform'].form.errors)
+        note = Note.objects.get(pk=note.pk)
+        self.assertEqual((note.title, note.content, note.revision), ('edited', '<p>new body</p>', 2))
+
+        task = Task.objects.first()
+        response = self.client.get(reverse('admin:api_task_change', args=[task.pk]))
+        self.assertEqual(response.context['adminform'].form.initial['description'], 'x')
+
+
+@skipUnless({'shard1', 'shard2'} <= set(settings.DATABASES), "needs `shard1` and `shard2` database aliases")
+@override_settings(SHARDS=['default', 'shard1', 'shard2'], SHARD_MIGRATION_GRACE_SECONDS=0)
+class ShardingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        sharding._id_blocks.clear()
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'pw') for i in range(6)]
+        # Users are placed by id modulo the number of shards.
+        self.remote = next(user for user in users if sharding.shard_for_user(user.pk) == 'shard1')
+        self.local = next(user for user in users if sharding.shard_for_user(user.pk) == 'default')
+        self.remote_client, self.local_client = APIClient(), APIClient()
+        self.remote_client.force_authenticate(self.remote)
+        self.local_client.force_authenticate(self.local)
+
+    def share_note(self):
+        tag = self.remote_client.post(reverse('api:tag-list-create'), {'name': 'work'}, format='json').data['id']
+        response = self.remote_client.post(reverse('api:note-list-create'), {
+            'title': 'remote', 'content': 'x', 'tags': [tag], 'shared_with': [self.local.email],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def list_ids(self, client, name='api:note-list-create'):
+        return sorted(item['id'] for item in client.get(reverse(name)).data['results'])
+
+    def test_users_are_placed_and_mirrored(self):
+        self.assertEqual(UserShard.objects.get(user=self.remote).alias, 'shard1')
+        for alias in ('shard1', 'shard2'):
+            self.assertEqual(User.objects.using(alias).count(), 6)
+        pk = self.share_note()
+        self.assertTrue(Note.objects.using('shard1').filter(pk=pk).exists())
+        self.assertFalse(Note.objects.using('default').filter(pk=pk).exists())
+        local = self.local_client.post(reverse('api:note-list-create'), {'title': 'local', 'content': 'y'}, format='json')
+        self.assertTrue(Note.objects.using('default').filter(pk=local.data['id']).exists())
+        # Ids come from IdSequence, so they are unique across shards.
+        self.assertNotEqual(pk, local.data['id'])
+
+    def test_sharing_across_shards(self):
+        pk = self.share_note()
+        local = self.local_client.post(reverse('api:note-list-create'), {'title': 'local', 'content': 'y'}, format='json')
+        self.assertTrue(SharedAccess.objects.filter(user=self.local, object_id=pk, alias='shard1').exists())
+        self.assertEqual(self.list_ids(self.local_client), sorted([pk, local.data['id']]))
+        self.assertEqual(self.list_ids(self.remote_client), [pk])
+        detail = reverse('api:note-detail', kwargs={'pk': pk})
+        self.assertEqual(self.remote_client.patch(detail, {'content': 'z'}, format='json').status_code, 200)
+        self.assertEqual(self.local_client.get(detail).data['content'], 'z')
+        self.assertEqual([facet['name'] for facet in self.local_client.get(reverse('api:tag-facets')).data], ['work'])
+
+        response = self.remote_client.post(reverse('api:task-list-create'), {
+            'title': 't', 'description': 'd', 'due_date': (timezone.now() + timedelta(days=1)).isoformat(),
+            'shared_with': [self.local.email],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.list_ids(self.local_client, 'api:task-list-create'), [response.data['id']])
+        calendar = self.local_client.get(reverse('api:task-calendar')).data['results']
+        self.assertEqual([entry['task'] for entry in calendar], [response.data['id']])
+
+        # A revoked share stays out of the list even before the access index catches up.
+        Note.shared_with.through.objects.using('shard1').filter(note_id=pk).delete()
+        self.assertTrue(SharedAccess.objects.filter(user=self.local, object_id=pk).exists())
+        self.assertEqual(self.list_ids(self.local_client), [local.data['id']])
+
+    def test_rebalance(self):
+        pk = self.share_note()
+        call_command('rebalance_shards', user=self.remote.pk, to='shard2', stdout=StringIO())
+        self.assertEqual(sharding.shard_for_user(self.remote.pk), 'shard2')
+        self.assertTrue(Note.objects.using('shard2').filter(pk=pk).exists())
+        self.assertFalse(Note.objects.using('shard1').filter(pk=pk).exists())
+        self.assertEqual(SharedAccess.objects.get(user=self.local, object_id=pk).alias, 'shard2')
+        self.assertEqual(self.remote_client.get(reverse('api:note-detail', kwargs={'pk': pk})).data['content'], 'x')
+        self.assertEqual(self.list_ids(self.local_client), [pk])
+
+        SharedAccess.objects.all().delete()
+        call_command('rebalance_shards', rebuild_access_index=True, stdout=StringIO())
+        self.assertTrue(SharedAccess.objects.filter(user=self.local, object_id=pk, alias='shard2').exists())
+
+    def test_writes_check_the_owner_in_the_directory(self):
+        pk = self.share_note()
+        detail = reverse('api:note-detail', kwargs={'pk': pk})
+        # Cached before the move started, as in a process that did not see it.
+        self.assertEqual(sharding.placement(self.remote.pk), ('shard1', False))
+        UserShard.objects.filter(user=self.remote).update(migrating=True)
+        response = self.remote_client.post(reverse('api:note-list-create'), {'title': 'q', 'content': 'x'}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.local_client.patch(detail, {'content': 'z'}, format='json').status_code, 503)
+        self.assertEqual(self.local_client.get(detail).data['content'], 'x')
+
+        old = timezone.now() - timedelta(days=settings.TASK_ARCHIVE_AFTER_DAYS + 1)
+        with sharding.use_shard('shard1'):
+            task = Task.objects.create(user=self.remote, title='done', due_date=old, is_completed=True)
+            Task.objects.filter(pk=task.pk).update(completed_at=old)
+        archive_completed_tasks()
+        self.assertTrue(Task.objects.using('shard1').filter(pk=task.pk).exists())
+        UserShard.objects.filter(user=self.remote).update(migrating=False)
+        archive_completed_tasks()
+        self.assertFalse(Task.objects.using('shard1').filter(pk=task.pk).exists())
+
+    def test_writes_during_the_copy_keep_the_user_in_place(self):
+        pk = self.share_note()
+        copy = RebalanceCommand._copy
+
+        def copy_then_write(command, model, *args):
+            copied = copy(command, model, *args)
+            if model is Note:
+                with sharding.use_shard('shard1'):
+                    Category.objects.create(user=self.remote, name='late')
+            return copied
+
+        with mock.patch.object(RebalanceCommand, '_copy', autospec=True, side_effect=copy_then_write):
+            with self.assertRaises(CommandError):
+                call_command('rebalance_shards', user=self.remote.pk, to='shard2', stdout=StringIO())
+        self.assertEqual(sharding.placement(self.remote.pk, cached=False), ('shard1', False))
+        self.assertFalse(Note.objects.using('shard2').filter(pk=pk).exists())
+        self.assertTrue(Category.objects.using('shard1').filter(name='late').exists())
+
+    def test_interrupted_moves_are_cleaned_up(self):
+        pk = self.share_note()
+        delete_rows = RebalanceCommand._delete_rows
+
+        def crash_on_source(command, user_id, alias):
+            if alias == 'shard1':
+                raise RuntimeError("interrupted")
+            delete_rows(command, user_id, alias)
+
+        with mock.patch.object(RebalanceCommand, '_delete_rows', autospec=True, side_effect=crash_on_source):
+            with self.assertRaises(RuntimeError):
+                call_command('rebalance_shards', user=self.remote.pk, to='shard2', stdout=StringIO())
+        self.assertEqual(sharding.placement(self.remote.pk, cached=False), ('shard2', False))
+        self.assertTrue(Note.objects.using('shard1').filter(pk=pk).exists())
+
+        call_command('rebalance_shards', cleanup=True, stdout=StringIO())
+        self.assertFalse(Note.objects.using('shard1').filter(pk=pk).exists())
+        self.assertTrue(Note.objects.using('shard2').filter(pk=pk).exists())
+        out = StringIO()
+        call_command('rebalance_shards', user=self.remote.pk, to='shard2', stdout=out)
+        self.assertIn('already on shard2', out.getvalue())
+        self.assertEqual(self.remote_client.get(reverse('api:note-detail', kwargs={'pk': pk})).data['content'], 'x')
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        typeahead.prefix_cache.clear()
+        self.user = User.objects.create_user('me', 'me@example.com', 'pw')
+        self.alice = User.objects.create_user('Alice', 'Alice.Smith@example.com', 'pw')
+        self.alfred = User.objects.create_user('alfred', 'alfred@example.com', 'pw')
+        User.objects.create_user('bob', 'bob@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def lookup(self, **params):
+        return self.client.get(reverse('api:user-lookup'), params)
+
+    def test_directory_search(self):
+        self.assertEqual(UserLookup.objects.get(user=self.alice).email, 'alice.smith@example.com')
+        self.assertEqual([user['email'] for user in self.lookup(q='ALF').data], ['alfred@example.com'])
+        # Below TYPEAHEAD_MIN_PREFIX only past share partners are suggested.
+        self.assertEqual(self.lookup(q='al').data, [])
+        self.assertEqual([user['id'] for user in self.lookup(q='alfr', limit=500).data], [self.alfred.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(typeahead.candidates('alfre'), [(self.alfred.pk, 'alfred@example.com', 'alfred')])
+        self.assertEqual(self.lookup(q='me@').data, [])
+        self.assertEqual(self.lookup(q='abc', limit='x').status_code, 400)
+        self.alfred.email = 'zed@example.com'
+        self.alfred.save()
+        self.assertEqual(UserLookup.objects.get(user=self.alfred).email, 'zed@example.com')
+
+    def test_share_partners_rank_first(self):
+        self.client.post(reverse('api:note-list-create'), {
+            'title': 'n', 'content': 'x', 'shared_with': [self.alice.email],
+        }, format='json')
+        self.assertEqual(
+            [(user['email'], user['shared_before']) for user in self.lookup(q='al').data],
+            [('Alice.Smith@example.com', True)],
+        )
+        self.assertEqual([user['username'] for user in self.lookup(q='ali').data], ['Alice'])
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['idempotency'].clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.body = {'title': 'n', 'content': 'x', 'shared_with': [self.other.email]}
+
+    def create(self, key=None, client=None, url=None, **changes):
+        headers = {} if key is None else {'HTTP_IDEMPOTENCY_KEY': key}
+        return (client or self.client).post(
+            url or reverse('api:note-list-create'), {**self.body, **changes}, format='json', **headers,
+        )
+
+    def test_retries_are_replayed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.create('k1')
+        self.assertEqual(first.status_code, 201)
+        sent = len(mail.outbox)
+        with self.assertNumQueries(0):
+            retry = self.create('k1')
+        self.assertEqual((retry.status_code, retry.data['id'], retry['Idempotent-Replayed']), (201, first.data['id'], 'true'))
+        self.assertEqual((len(mail.outbox), Note.objects.count()), (sent, 1))
+        self.assertEqual(self.create('k1', title='changed').status_code, 422)
+
+    def test_keys_are_scoped_to_path_and_user(self):
+        self.create('k1')
+        response = self.client.post(reverse('api:task-list-create'), {
+            'title': 't', 'description': 'd', 'due_date': '2030-01-01T00:00:00Z',
+        }, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 201)
+        other = APIClient()
+        other.force_authenticate(self.other)
+        self.assertEqual(self.create('k1', client=other, shared_with=[]).status_code, 201)
+        self.assertEqual(Note.objects.count(), 2)
+
+    def test_in_flight_and_failed_requests(self):
+        scope = hashlib.sha256(f"{reverse('api:note-list-create')}\nk2".encode()).hexdigest()
+        caches['idempotency'].add(f'lock:{self.user.pk}:{scope}', 'x', 60)
+        self.assertEqual(self.create('k2').status_code, 409)
+        # A failed request does not use up its key.
+        self.assertEqual(self.create('k3', title='').status_code, 400)
+        self.assertEqual(self.create('k3').status_code, 201)
+        self.assertEqual(self.create().status_code, 201)
+        self.assertEqual(self.create('x' * 256).status_code, 400)
@@ -0,0 +1,142 @@
+import functools
+import math
+import time
+
+from django.conf import settings
+from rest_framework import permissions
+from rest_framework.throttling import SimpleRateThrottle
+
+# Refills and takes one token from the bucket in KEYS[1] in a single step on the Redis
+# server, so concurrent requests from every worker see each other's updates.
+# ARGV: capacity, tokens per second, now, expiry in seconds. Returns {allowed, tokens}.
+TAKE_TOKEN = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'stamp')
+local capacity = tonumber(ARGV[1])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local stamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * tonumber(ARGV[2]))
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'stamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {allowed, tostring(tokens)}
+"""
+
+# Without THROTTLE_REDIS_URL, updates to a bucket are serialized with a short lock
+# taken through cache.add, which is atomic on every backend. A request that cannot get
+# the lock within LOCK_ATTEMPTS tries (about half a second) is let through rather than
+# answered with a 429 it may not deserve.
+LOCK_SECONDS = 1
+LOCK_ATTEMPTS = 100
+LOCK_RETRY_DELAY = 0.005
+
+
+@functools.lru_cache(maxsize=None)
+def bucket_script(url):
+    """TAKE_TOKEN on a Redis client for ``url``, created and registered once per process."""
+    import redis
+    return redis.Redis.from_url(url).register_script(TAKE_TOKEN)
+
+
+# The `TokenBucketThrottle` class replaces DRF's sliding-window history (a list of
+# timestamps per client) with a token bucket: `num_requests` tokens refilled evenly over
+# `duration`. The only state, a (tokens, timestamp) pair, is shared by every worker and
+# updated atomically: by a Lua script on the Redis server at THROTTLE_REDIS_URL, or under
+# a cache lock in the shared cache otherwise. Rejections are immediate 429s with Retry-After set to the
+# time until the next token.
+class TokenBucketThrottle(SimpleRateThrottle):
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        if settings.THROTTLE_REDIS_URL:
+            allowed, self.tokens = self._take_token_redis()
+        else:
+            allowed, self.tokens = self._take_token_locked()
+        return allowed
+
+    def _take_token_redis(self):
+        # A key of its own: the script keeps a Redis hash, not a pickled value.
+        key = self.cache.make_and_validate_key(f'{self.key}:bucket')
+        allowed, tokens = bucket_script(settings.THROTTLE_REDIS_URL)(
+            keys=[key],
+            args=[self.num_requests, self.num_requests / self.duration, self.now, math.ceil(self.duration)],
+        )
+        return bool(allowed), float(tokens)
+
+    def _take_token_locked(self):
+        lock_key = f'{self.key}:lock'
+        for _ in range(LOCK_ATTEMPTS):
+            if self.cache.add(lock_key, True, LOCK_SECONDS):
+                break
+            time.sleep(LOCK_RETRY_DELAY)
+        else:
+            return True, 0
+        try:
+            tokens, stamp = self.cache.get(self.key, (self.num_requests, self.now))
+            tokens = min(self.num_requests, tokens + max(0, self.now - stamp) * self.num_requests / self.duration)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.cache.set(self.key, (tokens, self.now), self.duration)
+        finally:
+            self.cache.delete(lock_key)
+        return allowed, tokens
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    """Overall budget per user (or per IP for anonymous clients)."""
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        return self.get_ident_key(request)
+
+
+class SearchRateThrottle(TokenBucketThrottle):
+    """Budget for ``?search=`` list queries, the most expensive reads we serve."""
+    scope = 'search'
+
+    def get_cache_key(self, request, view):
+        if not request.query_params.get('search'):
+            return None
+        return self.get_ident_key(request)
+
+
+class WriteRateThrottle(TokenBucketThrottle):
+    """Budget for unsafe methods (create, update, delete)."""
+    scope = 'write'
+
+    def get_cache_key(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return None
+        return self.get_ident_key(request)
+
+
+class AuthRateThrottle(TokenBucketThrottle):
+    """
+    Budget for login/registration, keyed by client IP so password-hashing
+    floods are cut off before they reach the hasher.
+    """
+    scope = 'auth'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_save
+
+
+def normalize(value):
+    return (value or '').strip().casefold()
+
+
+# The `PrefixCache` class is a small per-process LRU with a TTL for the candidate
+# lists of hot prefixes: a keystroke that repeats a popular prefix is answered
+# without touching the database.
+class PrefixCache:
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+prefix_cache = PrefixCache(settings.TYPEAHEAD_CACHE_SIZE, settings.TYPEAHEAD_CACHE_SECONDS)
+
+
+def _matches(entry, prefix):
+    return normalize(entry[1]).startswith(prefix) or normalize(entry[2]).startswith(prefix)
+
+
+def candidates(prefix):
+    """
+    Up to TYPEAHEAD_CANDIDATES active users whose email or username starts with
+    ``prefix``, as (id, email, username) tuples ordered by email. A cached list for
+    a shorter prefix that was not truncated already holds every match and is filtered
+    instead of querying again.
+    """
+    limit = settings.TYPEAHEAD_CANDIDATES
+    cached = prefix_cache.get(prefix)
+    if cached is not None:
+        return cached
+    for length in range(len(prefix) - 1, settings.TYPEAHEAD_MIN_PREFIX - 1, -1):
+        shorter = prefix_cache.get(prefix[:length])
+        if shorter is not None and len(shorter) < limit:
+            found = [entry for entry in shorter if _matches(entry, prefix)]
+            prefix_cache.set(prefix, found)
+            return found
+
+    from .models import UserLookup
+
+    found = {}
+    # One indexed range scan per column (an OR would defeat both indexes).
+    for column in ('email', 'username'):
+        rows = UserLookup.objects.filter(
+            **{f'{column}__startswith': prefix}, user__is_active=True
+        ).order_by(column).values_list('user_id', 'user__email', 'user__username')[:limit]
+        for row in rows:
+            found.setdefault(row[0], row)
+    found = sorted(found.values(), key=lambda entry: normalize(entry[1]))[:limit]
+    prefix_cache.set(prefix, found)
+    return found
+
+
+def _partners_key(user_id):
+    return f"typeahead:partners:{user_id}"
+
+
+def share_partners(user_id):
+    """
+    The TYPEAHEAD_PARTNERS users ``user_id`` has shared the most notes and tasks
+    with, most frequent first, as (id, email, username) tuples. Cached per user
+    and dropped when they share something new.
+    """
+    key = _partners_key(user_id)
+    partners = cache.get(key)
+    if partners is not None:
+        return partners
+    from .models import Note, Task
+
+    counts = {}
+    for model in (Note, Task):
+        kind = model._meta.model_name
+        rows = model.shared_with.through.objects.filter(**{f'{kind}__user_id': user_id}).values(
+            'user_id'
+        ).annotate(total=Count('pk')).values_list('user_id', 'total')
+        for partner_id, total in rows:
+            counts[partner_id] = counts.get(partner_id, 0) + total
+    counts.pop(user_id, None)
+    ranked = sorted(counts, key=counts.get, reverse=True)[:settings.TYPEAHEAD_PARTNERS]
+    users = {
+        row[0]: row for row in User.objects.filter(pk__in=ranked, is_active=True).values_list('pk', 'email', 'username')
+    }
+    partners = [users[pk] for pk in ranked if pk in users]
+    cache.set(key, partners, settings.TYPEAHEAD_PARTNER_CACHE_SECONDS)
+    return partners
+
+
+def suggest(user_id, query, limit):
+    """
+    Share recipients for ``query``: matching past share partners first, then other
+    users. The directory is only searched from TYPEAHEAD_MIN_PREFIX characters on,
+    so short prefixes cannot be used to list every account.
+    """
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    results = [
+        {'id': pk, 'email': email, 'username': username, 'shared_before': True}
+        for pk, email, username in share_partners(user_id)
+        if _matches((pk, email, username), prefix)
+    ][:limit]
+    if len(results) < limit and len(prefix) >= settings.TYPEAHEAD_MIN_PREFIX:
+        seen = {result['id'] for result in results} | {user_id}
+        for pk, email, username in candidates(prefix):
+            if pk not in seen and email:
+                results.append({'id': pk, 'email': email, 'username': username, 'shared_before': False})
+                if len(results) == limit:
+                    break
+    return results
+
+
+def user_saved(sender, instance, created, update_fields, raw, **kwargs):
+    from .models import UserLookup
+
+    # Logins save last_login only; skip anything that leaves the indexed columns alone.
+    if raw or (update_fields and not {'email', 'username'} & set(update_fields)):
+        return
+    UserLookup.objects.update_or_create(
+        user_id=instance.pk,
+        defaults={'email': normalize(instance.email), 'username': normalize(instance.username)},
+    )
+
+
+def shares_changed(sender, instance, action, reverse, **kwargs):
+    if action == 'post_add' and not reverse:
+        cache.delete(_partners_key(instance.user_id))
+
+
+def connect_signals():
+    from .models import Note, Task
+
+    post_save.connect(user_saved, sender=User, dispatch_uid='api.typeahead.user_saved')
+    for model in (Note, Task):
+        name = model._meta.model_name
+        m2m_changed.connect(shares_changed, sender=model.shared_with.through, dispatch_uid=f'api.typeahead.{name}_shares')
@@ -1,21 +1,57 @@
 from django.urls import path
-from .views import *
+from .views import (
+    RegisterView, LoginView, LogoutView,
+    NoteListCreateView, NoteRetrieveUpdateDestroyView,
+    NoteRevisionListView, NoteRevisionDetailView, NoteRevisionRestoreView,
+    TaskListCreateView, TaskCalendarView, TaskRetrieveUpdateDestroyView, TaskOccurrenceView,
+    ArchivedTaskListView, ArchivedTaskDetailView,
+    CalendarFeedTokenView, TaskICalFeedView, ChangeStreamTicketView, ChangeStreamView,
+    CategoryListCreateView, CategoryRetrieveUpdateDestroyView,
+    TagListCreateView, TagRetrieveUpdateDestroyView, TagFacetListView,
+    TrashedNoteListView, TrashedTaskListView, RestoreNoteView, RestoreTaskView, AccountDeleteView,
+    StorageUsageView, UserLookupView,
+)
 app_name = "api"
 
 urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', LoginView.as_view(), name='login'), 
     path('auth/logout/', LogoutView.as_view(), name='logout'),
+    path('auth/account/', AccountDeleteView.as_view(), name='account-delete'),
+    path('auth/storage/', StorageUsageView.as_view(), name='storage-usage'),
+    path('users/lookup/', UserLookupView.as_view(), name='user-lookup'),
     
     
     path('notes/', NoteListCreateView.as_view(), name='note-list-create'),
     path('notes/<int:pk>/', NoteRetrieveUpdateDestroyView.as_view(), name='note-detail'),
+    path('notes/<int:pk>/revisions/', NoteRevisionListView.as_view(), name='note-revisions'),
+    path('notes/<int:pk>/revisions/<int:number>/', NoteRevisionDetailView.as_view(), name='note-revision-detail'),
+    path('notes/<int:pk>/revisions/<int:number>/restore/', NoteRevisionRestoreView.as_view(), name='note-revision-restore'),
     
     path('tasks/', TaskListCreateView.as_view(), name='task-list-create'),
+    path('tasks/calendar/', TaskCalendarView.as_view(), name='task-calendar'),
+    path('tasks/archive/', ArchivedTaskListView.as_view(), name='task-archive'),
+    path('tasks/archive/<int:pk>/', ArchivedTaskDetailView.as_view(), name='task-archive-detail'),
     path('tasks/<int:pk>/', TaskRetrieveUpdateDestroyView.as_view(), name='task-detail'),
+    path('tasks/<int:pk>/occurrences/', TaskOccurrenceView.as_view(), name='task-occurrences'),
     
+    path('calendar/feed/', CalendarFeedTokenView.as_view(), name='calendar-feed-token'),
+    path('calendar/<str:token>.ics', TaskICalFeedView.as_view(), name='calendar-feed'),
+
+    path('events/ticket/', ChangeStreamTicketView.as_view(), name='change-stream-ticket'),
+    path('events/stream/', ChangeStreamView.as_view(), name='change-stream'),
+
+    path('trash/notes/', TrashedNoteListView.as_view(), name='trash-notes'),
+    path('trash/notes/<int:pk>/restore/', RestoreNoteView.as_view(), name='trash-note-restore'),
+    path('trash/tasks/', TrashedTaskListView.as_view(), name='trash-tasks'),
+    path('trash/tasks/<int:pk>/restore/', RestoreTaskView.as_view(), name='trash-task-restore'),
+
     path('categories/', CategoryListCreateView.as_view(), name='category-list-create'),
     path('categories/<int:pk>/', CategoryRetrieveUpdateDestroyView.as_view(), name='category-detail'),
+
+    path('tags/', TagListCreateView.as_view(), name='tag-list-create'),
+    path('tags/facets/', TagFacetListView.as_view(), name='tag-facets'),
+    path('tags/<int:pk>/', TagRetrieveUpdateDestroyView.as_view(), name='tag-detail'),
    
    
 ]
\ No newline at end of file
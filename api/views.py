@@ -1,38 +1,60 @@
-from rest_framework import generics, status, permissions,filters
-from rest_framework.response import Response
-from rest_framework.views import APIView
-from .serializers import *
+import itertools
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import login, authenticate
-from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
+from django.db import models, router, transaction
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.gzip import re_accepts_gzip
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from rest_framework import generics, status, permissions,filters
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError, PermissionDenied
 from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.exceptions import ValidationError
-from .permissions import *
-from django.db.models import Count, Q
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+from .models import ArchivedTask, Category, Note, NoteRevision, StorageUsage, Tag, TagFacet, Task, TaskOccurrence, CalendarFeedToken
+from .serializers import (
+    UserRegisterSerializer, LoginSerializer, CategorySerializer, NoteSerializer,
+    TaskSerializer, TaskOccurrenceSerializer, CalendarEntrySerializer,
+    NoteListSerializer, TaskListSerializer, TrashedNoteSerializer, TrashedTaskSerializer,
+    NoteRevisionSerializer, NoteRevisionDetailSerializer,
+    ArchivedTaskSerializer, ArchivedTaskDetailSerializer, TagSerializer, TagFacetSerializer,
+    StorageUsageSerializer, UserSuggestionSerializer, NoteRevisionConflict,
+)
+from .permissions import IsOwnerOrSharedWith, IsOwnerCategory
+from .mixins import IdempotentCreateMixin, ReplicaReadMixin, ShardMixin, ShardedListMixin
+from .throttling import AuthRateThrottle
+from .docs import document, register_docs, login_docs
+from . import events, ical, recurrence, revisions, sharding, typeahead
+from .task import purge_user
+from .schema import load_artifact
+from .tags import TagFilterBackend
 
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = [AllowAny]  
+    throttle_classes = [AuthRateThrottle]
     serializer_class = UserRegisterSerializer
-    #The @swagger_auto_schema decorator is used to define how the API documentation should appear for each view.
-    @swagger_auto_schema(
-        request_body=UserRegisterSerializer,
-        responses={
-            201: openapi.Response('User registered successfully', UserRegisterSerializer),
-            400: 'Bad Request'
-        }
-    )
-    
+    # @document attaches the OpenAPI description lazily; drf_yasg is only imported
+    # when the schema is generated (see api/docs.py).
+    @document(register_docs)
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
 
-        # Generate JWT tokens
+        # Generate JWT tokens (simplejwt is only needed here, so import it on first use)
+        from rest_framework_simplejwt.tokens import RefreshToken
         refresh = RefreshToken.for_user(user)
         access_token = refresh.access_token
 
@@ -51,15 +73,9 @@ class RegisterView(generics.CreateAPIView):
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [AuthRateThrottle]
 
-    @swagger_auto_schema(
-        request_body=LoginSerializer,
-        responses={
-            200: openapi.Response('Login successful', LoginSerializer),
-            401: 'Unauthorized'
-        }
-    )
-    
+    @document(login_docs)
     def post(self, request, *args, **kwargs):
         username = request.data.get("username")
         password = request.data.get("password")
@@ -78,88 +94,576 @@ class LoginView(APIView):
             return Response({"error": "Invalid credentials."}, status=401)
         
 
-class CategoryListCreateView(generics.ListCreateAPIView):
+class CategoryListCreateView(IdempotentCreateMixin, ShardMixin, generics.ListCreateAPIView):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user).annotate(notes_count=models.Count('notes'))
+        return Category.objects.filter(user=self.request.user).select_related('user').annotate(
+            notes_count=models.Count('notes', filter=models.Q(notes__deleted_at__isnull=True))
+        ).order_by('name')
 
    
 
-class CategoryRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class CategoryRetrieveUpdateDestroyView(ShardMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerCategory]  
 
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user).annotate(notes_count=models.Count('notes'))
+        return Category.objects.filter(user=self.request.user).select_related('user').annotate(
+            notes_count=models.Count('notes', filter=models.Q(notes__deleted_at__isnull=True))
+        ).order_by('name')
 
     def perform_destroy(self, instance):
         if instance.notes.exists():
             raise ValidationError("Cannot delete a category that has associated notes.")
-        instance.delete()        
+        # Notes in the trash keep pointing at it; restoring one restores the category.
+        instance.soft_delete()
+
+class TagListCreateView(IdempotentCreateMixin, ShardMixin, generics.ListCreateAPIView):
+    serializer_class = TagSerializer
+    permission_classes = [permissions.IsAuthenticated]
 
-class NoteListCreateView(generics.ListCreateAPIView):
+    def get_queryset(self):
+        return Tag.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class TagRetrieveUpdateDestroyView(ShardMixin, generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = TagSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Tag.objects.filter(user=self.request.user)
+
+
+class TagFacetListView(ShardMixin, generics.ListAPIView):
+    """
+    Per-tag counts of the notes and tasks the caller can see, including tags of
+    notes and tasks shared with them. Reads the maintained TagFacet rows, which
+    live with the tag, so shards the caller has shares on are read too.
+    """
+    serializer_class = TagFacetSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        return TagFacet.objects.filter(
+            models.Q(notes_count__gt=0) | models.Q(tasks_count__gt=0),
+            user=self.request.user,
+        ).select_related('tag__user').order_by('tag__name')
+
+    def list(self, request, *args, **kwargs):
+        home = sharding.current_shard()
+        aliases = {home}
+        for kind in ('note', 'task'):
+            aliases.update(sharding.remote_shares(request.user.pk, kind, home))
+        facets = [facet for alias in sorted(aliases) for facet in self.get_queryset().using(alias)]
+        facets.sort(key=lambda facet: facet.tag.name)
+        return Response(self.get_serializer(facets, many=True).data)
+
+
+class NoteListCreateView(IdempotentCreateMixin, ShardedListMixin, ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = NoteSerializer
+    shard_kind = 'note'
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'category']
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter, TagFilterBackend]
+    search_fields = ['title', 'category__name']
     ordering_fields = ['created_at', 'updated_at', 'due_date']
 
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return NoteListSerializer
+        return NoteSerializer
+
     def get_queryset(self):
-        return Note.objects.filter(
-            models.Q(user=self.request.user) |
-            models.Q(shared_with=self.request.user)
-        ).distinct().order_by('-updated_at')
+        return Note.objects.visible_to(self.request.user).select_related('user').prefetch_related(
+            'shared_with', 'tags'
+        ).order_by('-updated_at')
 
-   
+    
 
 
-class NoteRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class NoteRetrieveUpdateDestroyView(ShardMixin, ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = NoteSerializer
+    shard_kind = 'note'
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrSharedWith]
 
     def get_queryset(self):
-        return Note.objects.filter(
-            models.Q(user=self.request.user) |
-            models.Q(shared_with=self.request.user)
-        ).distinct().select_related('user').prefetch_related('shared_with')
+        return Note.objects.visible_to(self.request.user).select_related('user', 'body').prefetch_related('shared_with', 'tags')
 
     def perform_destroy(self, instance):
         if instance.user != self.request.user:
             raise ValidationError("You do not have permission to delete this note.")
-        instance.delete()      
+        # Soft delete: the note (and its attachments) go to the trash and are
+        # hard-deleted later by api.task.purge_deleted_items.
+        instance.soft_delete()
         
         
-class TaskListCreateView(generics.ListCreateAPIView):
+class NoteRevisionMixin(ShardMixin):
+    """Resolves the note in the URL among the notes the caller owns or that are shared with them."""
+    shard_kind = 'note'
+
+    def get_note(self, notes=None):
+        if notes is None:
+            notes = Note.objects.visible_to(self.request.user)
+        return get_object_or_404(notes, pk=self.kwargs['pk'])
+
+
+class NoteRevisionListView(ReplicaReadMixin, NoteRevisionMixin, generics.ListAPIView):
+    """The revision history of a note, newest first (without content)."""
+    serializer_class = NoteRevisionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return self.get_note().revisions.defer('data')
+
+
+class NoteRevisionDetailView(ReplicaReadMixin, NoteRevisionMixin, generics.RetrieveAPIView):
+    """One revision of a note, with its content rebuilt from the nearest snapshot."""
+    serializer_class = NoteRevisionDetailSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_object(self):
+        return get_object_or_404(self.get_note().revisions, number=self.kwargs['number'])
+
+
+class NoteRevisionRestoreView(ReplicaReadMixin, NoteRevisionMixin, generics.GenericAPIView):
+    """Makes the content of an old revision current again, recorded as a new revision."""
+    serializer_class = NoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        note = self.get_note(
+            Note.objects.visible_to(request.user).select_related('user', 'body').prefetch_related('shared_with', 'tags')
+        )
+        if note.user_id != request.user.pk:
+            raise PermissionDenied("Only the owner can restore revisions of this note.")
+        revision = get_object_or_404(note.revisions, number=self.kwargs['number'])
+        note.content = revision.get_content()
+        try:
+            note.save()
+        except revisions.RevisionConflict:
+            raise NoteRevisionConflict()
+        return Response(self.get_serializer(note).data)
+
+
+class TaskListCreateView(IdempotentCreateMixin, ShardedListMixin, ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = TaskSerializer
+    shard_kind = 'task'
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = ['title', 'category__name', 'description']
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter, TagFilterBackend]
+    # Descriptions are compressed in api_taskbody; their plain text is kept beside them.
+    search_fields = ['title', 'body__search_text']
     ordering_fields = ['due_date', 'created_at', 'updated_at']
 
-    def get_queryset(self):
-        return Task.objects.filter(
-            models.Q(user=self.request.user) |
-            models.Q(shared_with=self.request.user)
-        ).distinct().order_by('-due_date')
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return TaskListSerializer
+        return TaskSerializer
 
+    def get_queryset(self):
+        return Task.objects.visible_to(self.request.user).select_related('user').prefetch_related(
+            'shared_with', 'tags'
+        ).order_by('-due_date')
 
 
-class TaskRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
+class TaskRetrieveUpdateDestroyView(ShardMixin, ReplicaReadMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = TaskSerializer
+    shard_kind = 'task'
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrSharedWith]
 
     def get_queryset(self):
-        return Task.objects.filter(
-            models.Q(user=self.request.user) |
-            models.Q(shared_with=self.request.user)
-        ).distinct().select_related('user').prefetch_related('shared_with')
+        return Task.objects.visible_to(self.request.user).select_related('user', 'body').prefetch_related('shared_with', 'tags')
 
     def perform_destroy(self, instance):
         if instance.user != self.request.user:
             raise ValidationError("You do not have permission to delete this task.")
-        instance.delete()  
+        instance.soft_delete()
+
+class ArchivedTaskListView(ShardedListMixin, ReplicaReadMixin, generics.ListAPIView):
+    """
+    Task history: tasks completed more than TASK_ARCHIVE_AFTER_DAYS ago, which the
+    default task list no longer includes. Newest completion first.
+    """
+    serializer_class = ArchivedTaskSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    shard_kind = 'archivedtask'
+    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    search_fields = ['title', 'search_text']
+    ordering_fields = ['completed_at', 'due_date', 'created_at']
+
+    def get_queryset(self):
+        return ArchivedTask.objects.visible_to(self.request.user).select_related(
+            'user'
+        ).prefetch_related('shared_with').defer('description', 'search_text')
+
+
+class ArchivedTaskDetailView(ShardMixin, ReplicaReadMixin, generics.RetrieveAPIView):
+    serializer_class = ArchivedTaskDetailSerializer
+    shard_kind = 'archivedtask'
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return ArchivedTask.objects.visible_to(self.request.user).select_related(
+            'user'
+        ).prefetch_related('shared_with')
+
+
+class DateWindowMixin:
+    """
+    Parses the ``?start=&end=`` window (ISO 8601, defaulting to the next 30 days)
+    shared by the occurrence and calendar endpoints.
+    """
+
+    def get_window(self):
+        start = self._parse_datetime('start') or timezone.now()
+        end = self._parse_datetime('end') or start + timedelta(days=30)
+        if end < start:
+            raise ValidationError({"end": "end must not be before start."})
+        if end - start > recurrence.MAX_WINDOW:
+            raise ValidationError({"end": f"The window may not exceed {recurrence.MAX_WINDOW.days} days."})
+        return start, end
+
+    def _parse_datetime(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValidationError({param: "Enter a valid ISO 8601 date/time."})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+
+class TaskOccurrenceView(ShardMixin, ReplicaReadMixin, DateWindowMixin, generics.GenericAPIView):
+    """
+    GET expands the occurrences of a task inside the requested window.
+    POST records an exception for one occurrence.
+    """
+    serializer_class = TaskOccurrenceSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrSharedWith]
+    shard_kind = 'task'
+
+    def get_queryset(self):
+        return Task.objects.visible_to(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        task = self.get_object()
+        start, end = self.get_window()
+        serializer = self.get_serializer(task.occurrences(start, end), many=True)
+        return Response(serializer.data)
+
+    def post(self, request, *args, **kwargs):
+        task = self.get_object()
+        if task.user_id != request.user.pk:
+            raise PermissionDenied("Only the owner can update occurrences of this task.")
+        serializer = self.get_serializer(data=request.data, context={**self.get_serializer_context(), 'task': task})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class TaskCalendarView(ShardMixin, ReplicaReadMixin, DateWindowMixin, generics.GenericAPIView):
+    """
+    Tasks due between ``?start=`` and ``?end=``, with recurring tasks expanded into
+    their occurrences. One-off tasks come from a range scan on the due_date indexes.
+
+    Entries are ordered by (due date, task, original date). At most MAX_OCCURRENCES
+    are returned; when there are more, ``truncated`` is true and ``next`` is the URL
+    of the rest of the window: it starts at the last entry returned, and ``?after=``
+    (``<task id>@<original date>``) skips the entries up to it at that instant.
+    """
+    serializer_class = CalendarEntrySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Task.objects.visible_to(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        start, end = self.get_window()
+        overrides = models.Prefetch('occurrence_overrides', queryset=TaskOccurrence.objects.filter(
+            models.Q(original_date__range=(start, end)) |
+            models.Q(due_date__range=(start, end))
+        ))
+        # Tasks shared from other shards are read there by primary key.
+        remote = sharding.remote_shares(request.user.pk, 'task', sharding.current_shard())
+        entries = []
+        for tasks in [self.get_queryset()] + [Task.objects.using(alias).filter(pk__in=ids) for alias, ids in remote.items()]:
+            one_off = tasks.filter(recurrence_rule='', due_date__range=(start, end))
+            recurring = tasks.exclude(recurrence_rule='').filter(
+                models.Q(recurrence_end__isnull=True) | models.Q(recurrence_end__gte=start),
+                due_date__lte=end,
+            )
+            for task in itertools.chain(one_off.prefetch_related(overrides), recurring.prefetch_related(overrides)):
+                entries.extend(task.occurrences(start, end, overrides=task.occurrence_overrides.all()))
+        def key(entry):
+            return entry.due_date, entry.task_id, entry.original_date
+
+        entries.sort(key=key)
+        after = self.get_after()
+        if after is not None:
+            entries = [entry for entry in entries if entry.due_date > start or key(entry)[1:] > after]
+
+        next_url = None
+        if len(entries) > recurrence.MAX_OCCURRENCES:
+            entries = entries[:recurrence.MAX_OCCURRENCES]
+            last = entries[-1]
+            next_url = request.build_absolute_uri()
+            for param, value in (
+                ('start', last.due_date.isoformat()),
+                ('end', end.isoformat()),
+                ('after', f'{last.task_id}@{last.original_date.isoformat()}'),
+            ):
+                next_url = replace_query_param(next_url, param, value)
+
+        serializer = self.get_serializer(entries, many=True)
+        return Response({'truncated': next_url is not None, 'next': next_url, 'results': serializer.data})
+
+    def get_after(self):
+        value = self.request.query_params.get('after')
+        if not value:
+            return None
+        task_id, _, original_date = value.partition('@')
+        parsed = parse_datetime(original_date)
+        if not task_id.isdigit() or parsed is None:
+            raise ValidationError({"after": "Expected <task id>@<ISO 8601 date/time>."})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return int(task_id), parsed
+
+
+class CalendarFeedTokenView(APIView):
+    """
+    GET returns the caller's private iCalendar feed URL; POST rotates its token,
+    invalidating any previously shared URL.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        feed_token = CalendarFeedToken.for_user(request.user)
+        return Response(self._describe(request, feed_token))
+
+    def post(self, request):
+        feed_token = CalendarFeedToken.for_user(request.user)
+        feed_token.rotate()
+        return Response(self._describe(request, feed_token))
+
+    def _describe(self, request, feed_token):
+        path = reverse('api:calendar-feed', kwargs={'token': feed_token.token})
+        return {"url": request.build_absolute_uri(path)}
+
+
+class TaskICalFeedView(APIView):
+    """
+    Tokenized iCalendar feed of the tasks visible to a user. Responses carry a
+    strong ETag and Last-Modified so polling clients mostly get 304s.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, token):
+        feed_token = get_object_or_404(CalendarFeedToken.objects.select_related('user'), token=token)
+        with sharding.use_shard(sharding.shard_for_user(feed_token.user_id)):
+            return self.feed(request, feed_token)
+
+    def feed(self, request, feed_token):
+        user = feed_token.user
+        cutoff = timezone.now() - ical.FEED_HISTORY
+        current = (
+            models.Q(recurrence_rule='', due_date__gte=cutoff) |
+            (~models.Q(recurrence_rule='') & (models.Q(recurrence_end__isnull=True) | models.Q(recurrence_end__gte=cutoff)))
+        )
+        tasks = Task.objects.visible_to(user).filter(current)
+        # One queryset per shard; tasks shared from other shards are read by primary key.
+        querysets = [tasks]
+        for alias, ids in sharding.remote_shares(user.pk, 'task', sharding.current_shard()).items():
+            querysets.append(Task.objects.using(alias).filter(current, pk__in=ids))
+
+        aggregate = {'count': 0, 'last_modified': None, 'checksum': 0}
+        for counted in querysets:
+            totals = counted.aggregate(
+                count=models.Count('pk'), last_modified=models.Max('updated_at'), checksum=models.Sum('pk')
+            )
+            aggregate['count'] += totals['count']
+            aggregate['checksum'] += totals['checksum'] or 0
+            aggregate['last_modified'] = max(
+                filter(None, (aggregate['last_modified'], totals['last_modified'])), default=None
+            )
+        etag = quote_etag(ical.feed_etag(user, aggregate))
+        last_modified = aggregate['last_modified'] or feed_token.created_at
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(last_modified.timestamp())
+        )
+        if response is None:
+            response = HttpResponse(
+                ical.render_feed(user, querysets, etag), content_type='text/calendar; charset=utf-8'
+            )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+        response['Cache-Control'] = 'private, max-age=300'
+        return response
+
+
+class SchemaArtifactView(APIView):
+    """
+    Serves the pre-generated OpenAPI document with strong ETags and a gzip copy
+    compressed once per process, instead of introspecting every view per hit.
+    """
+    schema = None
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        artifact = load_artifact(settings.OPENAPI_SCHEMA_VERSION)
+        use_gzip = bool(re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        etag = artifact.gzip_etag if use_gzip else artifact.etag
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(artifact.gzipped if use_gzip else artifact.body, content_type='application/json')
+            if use_gzip:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=300'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class TrashedNoteListView(ShardMixin, generics.ListAPIView):
+    """The caller's soft-deleted notes, newest deletion first."""
+    serializer_class = TrashedNoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Note.all_objects.deleted().filter(user=self.request.user).select_related('user').prefetch_related(
+            'shared_with', 'tags'
+        ).order_by('-deleted_at')
+
+
+class TrashedTaskListView(ShardMixin, generics.ListAPIView):
+    """The caller's soft-deleted tasks, newest deletion first."""
+    serializer_class = TrashedTaskSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Task.all_objects.deleted().filter(user=self.request.user).select_related('user').prefetch_related(
+            'shared_with', 'tags'
+        ).order_by('-deleted_at')
+
+
+class RestoreNoteView(ShardMixin, ReplicaReadMixin, generics.GenericAPIView):
+    serializer_class = NoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Note.all_objects.deleted().filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        note = self.get_object()
+        note.restore()
+        if note.category_id is not None:
+            Category.all_objects.deleted().filter(pk=note.category_id).restore()
+        return Response(self.get_serializer(note).data)
+
+
+class RestoreTaskView(ShardMixin, ReplicaReadMixin, generics.GenericAPIView):
+    serializer_class = TaskSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Task.all_objects.deleted().filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        task = self.get_object()
+        task.restore()
+        return Response(self.get_serializer(task).data)
+
+
+class AccountDeleteView(ShardMixin, APIView):
+    """
+    Deletes the caller's account. Everything they own is hidden immediately with
+    three indexed UPDATEs; the rows, M2M links and media files are hard-deleted
+    in bounded chunks by the api.task.purge_user background job.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def delete(self, request):
+        user = request.user
+        with transaction.atomic(), transaction.atomic(using=router.db_for_write(Note)):
+            Category.objects.filter(user=user).soft_delete()
+            Note.objects.filter(user=user).soft_delete()
+            Task.objects.filter(user=user).soft_delete()
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+            Token.objects.filter(user=user).delete()
+            transaction.on_commit(lambda: purge_user.delay(user.pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class StorageUsageView(ShardMixin, APIView):
+    """The caller's storage counters and quota."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        usage, _ = StorageUsage.objects.get_or_create(user=request.user)
+        return Response(StorageUsageSerializer(usage).data)
+
+
+class UserLookupView(ShardMixin, APIView):
+    """
+    Typeahead for ``shared_with``: ``?q=`` is matched as a prefix of emails and
+    usernames, past share partners first. ``?limit=`` is capped at TYPEAHEAD_LIMIT.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', settings.TYPEAHEAD_LIMIT)), settings.TYPEAHEAD_LIMIT)
+        except ValueError:
+            raise ValidationError({"limit": "Expected an integer."})
+        suggestions = typeahead.suggest(request.user.pk, request.query_params.get('q', ''), max(limit, 1))
+        return Response(UserSuggestionSerializer(suggestions, many=True).data)
+
+
+class ChangeStreamTicketView(APIView):
+    """
+    Issues a short-lived ticket for the change stream. Browsers' EventSource cannot
+    send the Authorization header, so the stream authenticates with ``?ticket=``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        ticket = events.issue_ticket(request.user)
+        stream_url = request.build_absolute_uri(f"{reverse('api:change-stream')}?ticket={ticket}")
+        return Response({
+            'ticket': ticket,
+            'stream_url': stream_url,
+            'expires_in': settings.EVENT_TICKET_MAX_AGE,
+        })
+
+
+class ChangeStreamView(View):
+    """
+    Server-sent events for the notes and tasks the ticket's user owns or has been
+    shared. This is an async view: serve it through the ASGI application so an open
+    stream costs a coroutine, not a worker thread.
+    """
+
+    async def get(self, request):
+        user_id = events.read_ticket(request.GET.get('ticket', ''))
+        if user_id is None or not await User.objects.filter(pk=user_id, is_active=True).aexists():
+            return JsonResponse({"detail": "Invalid or expired stream ticket."}, status=401)
+        response = StreamingHttpResponse(events.stream(user_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 
 class LogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -11,14 +11,30 @@ app = Celery('productivity_pro')
 # the configuration object to child processes.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-# Load task modules from all registered Django app configs.
-app.autodiscover_tasks()
+# Celery's Django fixup closes every DB connection around each task unless this is set.
+# Reuse them instead; api.db.metrics applies CONN_MAX_AGE and health checks per task.
+app.conf.CELERY_DB_REUSE_MAX = int(os.environ.get('CELERY_DB_REUSE_MAX', 1000))
+
+# Load task modules from all registered Django app configs (ours live in <app>/task.py).
+app.autodiscover_tasks(related_name='task')
 
 
 
 app.conf.beat_schedule = {
     'send-task-reminders-daily': {
-        'task': 'your_app.tasks.send_task_reminders',
+        'task': 'api.task.send_task_reminders',
         'schedule': crontab(hour=9, minute=0),  
     },
+    'purge-deleted-items-nightly': {
+        'task': 'api.task.purge_deleted_items',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'archive-completed-tasks-nightly': {
+        'task': 'api.task.archive_completed_tasks',
+        'schedule': crontab(hour=3, minute=30),
+    },
+    'reconcile-storage-usage-weekly': {
+        'task': 'api.task.reconcile_storage_usage',
+        'schedule': crontab(hour=4, minute=0, day_of_week='sun'),
+    },
 }
\ No newline at end of file
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from django.contrib.messages import constants as messages
 from datetime import timedelta
+from kombu import Queue
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,6 +54,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.AdmissionControlMiddleware",
+    "api.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,10 +87,111 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
         
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserRateThrottle',
+        'api.throttling.SearchRateThrottle',
+        'api.throttling.WriteRateThrottle',
+    ],
+    # Token buckets: "N/period" allows bursts of N and refills N tokens per period.
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '600/min',
+        'search': '30/min',
+        'write': '120/min',
+        'auth': '10/min',
+    },
 }
 
+# The OpenAPI document is generated at deploy time into a versioned artifact.
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'schema'
+OPENAPI_SCHEMA_VERSION = 'v1'
+
+SWAGGER_SETTINGS = {
+    'SPEC_URL': 'schema-json',
+}
+REDOC_SETTINGS = {
+    'SPEC_URL': 'schema-json',
+}
+
+# Requests a single worker process serves concurrently before shedding with 429.
+ADMISSION_MAX_INFLIGHT_REQUESTS = int(os.environ.get('ADMISSION_MAX_INFLIGHT_REQUESTS', 32))
+ADMISSION_RETRY_AFTER = 1
+
+# Change stream (api.events): server-sent events, served by the ASGI application.
+# With REDIS_EVENTS_URL set, events published by any process reach every stream.
+if os.environ.get('REDIS_EVENTS_URL'):
+    EVENT_BROKER = 'api.events.RedisBroker'
+    EVENT_BROKER_OPTIONS = {'url': os.environ['REDIS_EVENTS_URL']}
+else:
+    EVENT_BROKER = 'api.events.InMemoryBroker'
+    EVENT_BROKER_OPTIONS = {}
+EVENT_TICKET_MAX_AGE = 60
+EVENT_STREAM_KEEPALIVE = 15
+EVENT_STREAM_MAX_SECONDS = 3600
+EVENT_STREAM_RETRY_MS = 3000
+
+# Response compression (api.middleware.CompressionMiddleware): bodies below the
+# threshold fit in a packet or two and are sent as-is. Brotli is used when the
+# `brotli` package is installed and the client accepts it.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+# Views whose responses carry credentials (auth tokens, the stream ticket, the private
+# feed URL). Compressing a secret alongside attacker-influenced input leaks it through
+# the response size (BREACH), so these are always sent uncompressed.
+COMPRESSION_EXCLUDED_VIEWS = [
+    'api:register', 'api:login', 'api:calendar-feed-token', 'api:change-stream-ticket',
+    'token_obtain_pair', 'token_refresh',
+]
+
+# Throttle buckets, replica stickiness and other shared state live in the cache; point
+# REDIS_CACHE_URL at Redis in production so every worker shares it.
+# Stored Idempotency-Key responses get their own alias so they expire after
+# IDEMPOTENCY_KEY_TTL and (locally) are capped at IDEMPOTENCY_MAX_ENTRIES.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_MAX_ENTRIES = 10000
+IDEMPOTENCY_LOCK_SECONDS = 60
+
+if os.environ.get('REDIS_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_CACHE_URL'],
+        },
+        'idempotency': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_CACHE_URL'],
+            'KEY_PREFIX': 'idempotency',
+            'TIMEOUT': IDEMPOTENCY_KEY_TTL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'idempotency': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'idempotency',
+            'TIMEOUT': IDEMPOTENCY_KEY_TTL,
+            'OPTIONS': {'MAX_ENTRIES': IDEMPOTENCY_MAX_ENTRIES},
+        },
+    }
+
+# Throttle buckets (api.throttling) are updated by a Lua script on this Redis server;
+# without it they are kept in the cache under a short lock.
+THROTTLE_REDIS_URL = os.environ.get('REDIS_CACHE_URL')
+
 MESSAGE_TAGS = {
     messages.DEBUG: 'alert-info',
     messages.INFO: 'alert-info',
@@ -99,6 +203,21 @@ MESSAGE_TAGS = {
 
 ROOT_URLCONF = "productivity_pro.urls"
 
+# Process role: "web" (default) or "worker". Start Celery with REMINO_PROCESS_ROLE=worker
+# so it skips the web-only apps and URLs (admin, docs, TinyMCE, CORS) it never uses.
+PROCESS_ROLE = os.environ.get('REMINO_PROCESS_ROLE', 'web')
+WEB_ONLY_APPS = [
+    "django.contrib.admin",
+    "django.contrib.messages",
+    "django.contrib.staticfiles",
+    'tinymce',
+    'corsheaders',
+    'drf_yasg',
+]
+if PROCESS_ROLE == 'worker':
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in WEB_ONLY_APPS]
+    ROOT_URLCONF = "productivity_pro.worker_urls"
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -140,22 +259,77 @@ SIMPLE_JWT = {
 #for mysql lite
 # DATABASES = {
 #     "default": {
-#         "ENGINE": "django.db.backends.sqlite3",
+#         "ENGINE": "api.db.backends.sqlite3",
 #         "NAME": BASE_DIR / "db.sqlite3",
 #     }
 # }
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'api.db.backends.mysql',
         'NAME': 'Remino_db',
         'USER': 'root',
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '3306',
+        'OPTIONS': {'connect_timeout': 5},
     }
 }
 
+# Read replicas: every alias whose name starts with "replica" can serve safe-method
+# reads from the note/task views and the reminder scan (see api/routers.py).
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Shards: every alias whose name starts with "shard" holds the categories, tags, notes
+# and tasks of the users placed on it, alongside `default` (see api/sharding.py).
+# Users, tokens and the shard directory live in `default`.
+for index, host in enumerate(filter(None, os.environ.get('DB_SHARD_HOSTS', '').split(',')), start=1):
+    DATABASES[f'shard{index}'] = {**DATABASES['default'], 'HOST': host}
+
+#for local replica testing with two sqlite files
+# DATABASES = {
+#     "default": {"ENGINE": "api.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"},
+#     "replica": {"ENGINE": "api.db.backends.sqlite3", "NAME": BASE_DIR / "db_replica.sqlite3",
+#                 "TEST": {"MIRROR": "default"}},
+# }
+
+#for local shard testing with several sqlite files
+# DATABASES = {
+#     "default": {"ENGINE": "api.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"},
+#     "shard1": {"ENGINE": "api.db.backends.sqlite3", "NAME": BASE_DIR / "db_shard1.sqlite3"},
+#     "shard2": {"ENGINE": "api.db.backends.sqlite3", "NAME": BASE_DIR / "db_shard2.sqlite3"},
+# }
+
+# Persistent connections for web and Celery workers: keep a connection for up to
+# DB_CONN_MAX_AGE seconds, ping it before reuse, and recycle it after DB_CONN_MAX_USES
+# requests/tasks. The api.db.backends engines record connect, reuse and age metrics.
+for database in DATABASES.values():
+    database.setdefault('CONN_MAX_AGE', int(os.environ.get('DB_CONN_MAX_AGE', 60)))
+    database.setdefault('CONN_HEALTH_CHECKS', True)
+    database.setdefault('CONN_MAX_USES', int(os.environ.get('DB_CONN_MAX_USES', 1000)))
+
+DATABASE_ROUTERS = ['api.routers.ShardRouter', 'api.routers.PrimaryReplicaRouter']
+
+# Shard aliases in placement order; a single shard disables sharding entirely. New
+# rows of sharded models take ids from IdSequence in blocks of SHARD_ID_BLOCK_SIZE.
+SHARDS = ['default'] + sorted(alias for alias in DATABASES if alias.startswith('shard'))
+SHARD_ID_BLOCK_SIZE = 100
+SHARD_DIRECTORY_CACHE_SECONDS = 300
+# How long rebalance_shards waits after flagging a user as migrating before copying,
+# so requests that checked the directory just before the flag finish their writes.
+SHARD_MIGRATION_GRACE_SECONDS = 5
+
+# Replica aliases that may serve reads; empty sends every read to the primary.
+REPLICAS = sorted(alias for alias in DATABASES if alias.startswith('replica'))
+
+# Seconds a user's reads stay on the primary after they write (read-your-writes).
+REPLICA_STICKY_SECONDS = 5
+
 
 
 # Password validation
@@ -186,13 +360,80 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
-CELERY_BROKER_URL = 'redis://localhost:6379/0'  # Redis URL
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'  # Redis for storing task results
+# Set CELERY_BROKER_URL=memory:// and CELERY_RESULT_BACKEND=cache+memory:// to run without Redis.
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')  # Redis URL
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')  # Redis for storing task results
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'  # Adjust as needed
 
+# Dedicated queues so a bulk reminder burst never sits in front of share notifications.
+# Run separate workers per queue, e.g. `celery -A productivity_pro worker -Q mail.transactional`.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = (
+    Queue('mail.transactional'),
+    Queue('mail.bulk'),
+    Queue('maintenance'),
+    Queue('default'),
+)
+# With the Redis transport 0 is the highest priority and 9 the lowest.
+CELERY_TASK_ROUTES = {
+    'api.task.send_share_notification': {'queue': 'mail.transactional', 'priority': 0},
+    'api.task.send_task_reminder': {'queue': 'mail.bulk', 'priority': 6},
+    'api.task.send_task_reminders': {'queue': 'maintenance', 'priority': 3},
+    'api.task.purge_*': {'queue': 'maintenance', 'priority': 9},
+    'api.task.archive_*': {'queue': 'maintenance', 'priority': 9},
+    'api.task.reconcile_*': {'queue': 'maintenance', 'priority': 9},
+}
+CELERY_TASK_DEFAULT_PRIORITY = 3
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
+}
+# Prefetching more than one message per process would defeat priorities and rate limits.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+
+# Soft-deleted notes/tasks stay restorable from the trash for this long before the
+# purge job hard-deletes them, PURGE_CHUNK_SIZE rows per transaction.
+TRASH_RETENTION_DAYS = 30
+PURGE_CHUNK_SIZE = 500
+
+# Completed tasks older than this move to the archive table, ARCHIVE_CHUNK_SIZE per
+# transaction, so the active task table stays small.
+TASK_ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_CHUNK_SIZE = 500
+
+# Per-user cap on note/task bodies plus note attachments (None disables it). Usage is
+# kept in StorageUsage; the reconcile job re-measures STORAGE_RECONCILE_CHUNK_SIZE
+# users per batch.
+STORAGE_QUOTA_BYTES = int(os.environ.get('STORAGE_QUOTA_MB', 500)) * 1024 * 1024
+STORAGE_RECONCILE_CHUNK_SIZE = 200
+
+# Admin changelists show the table statistics instead of COUNT(*) for unfiltered
+# lists larger than this; bulk admin actions update this many rows per transaction.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+ADMIN_ACTION_CHUNK_SIZE = 1000
+
+# Share-recipient typeahead (api/typeahead.py): at most TYPEAHEAD_LIMIT suggestions;
+# the user directory is searched from TYPEAHEAD_MIN_PREFIX characters, keeping up to
+# TYPEAHEAD_CANDIDATES matches per prefix in a per-process LRU of TYPEAHEAD_CACHE_SIZE
+# prefixes. Past share partners (the top TYPEAHEAD_PARTNERS) rank first.
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MIN_PREFIX = 3
+TYPEAHEAD_CANDIDATES = 50
+TYPEAHEAD_CACHE_SIZE = 1024
+TYPEAHEAD_CACHE_SECONDS = 60
+TYPEAHEAD_PARTNERS = 50
+TYPEAHEAD_PARTNER_CACHE_SECONDS = 300
+
+# Per-worker send rates; keep (rate x mail workers) under the SMTP provider's quota.
+MAIL_RATE_LIMITS = {
+    'transactional': os.environ.get('MAIL_RATE_TRANSACTIONAL', '5/s'),
+    'bulk': os.environ.get('MAIL_RATE_BULK', '2/s'),
+}
+
 SITE_URL = "http://localhost:8000"
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -0,0 +1,21 @@
+# Settings for running the test suite without MySQL or Redis:
+#   python manage.py test api --settings=productivity_pro.test_settings
+# Every alias is an SQLite database. `replica` mirrors `default`, and the shards sit
+# alongside it, but reads stay on the primary and sharding stays off (REPLICAS and
+# SHARDS below) unless a test turns them on with override_settings.
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'api.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+    'replica': {
+        'ENGINE': 'api.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3', 'TEST': {'MIRROR': 'default'},
+    },
+    'shard1': {'ENGINE': 'api.db.backends.sqlite3', 'NAME': BASE_DIR / 'db_shard1.sqlite3'},
+    'shard2': {'ENGINE': 'api.db.backends.sqlite3', 'NAME': BASE_DIR / 'db_shard2.sqlite3'},
+}
+REPLICAS = []
+SHARDS = ['default']
+
+EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+CELERY_BROKER_URL = 'memory://'
+CELERY_RESULT_BACKEND = 'cache+memory://'
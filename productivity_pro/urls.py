@@ -14,27 +14,47 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import functools
+
 from django.contrib import admin
 from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path, include, re_path
-from rest_framework_simplejwt.views import (TokenObtainPairView, TokenRefreshView,)
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Remino API",
-      default_version='v1',
-      description="API documentation for Remino",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email=""),
-      license=openapi.License(name="BSD License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from api.views import SchemaArtifactView
+
+
+def lazy_view(factory):
+    """
+    Build a view (and import whatever it needs) on its first request instead of
+    at URLconf import, which also happens in Celery workers calling reverse().
+    """
+    factory = functools.lru_cache(maxsize=None)(factory)
+
+    # DRF views are CSRF-exempt; the middleware checks the wrapper, not the real view.
+    @csrf_exempt
+    def view(request, *args, **kwargs):
+        return factory()(request, *args, **kwargs)
+    return view
+
+
+def lazy_class_view(dotted_path):
+    return lazy_view(lambda: import_string(dotted_path).as_view())
+
+
+@functools.lru_cache(maxsize=None)
+def schema_view():
+    from drf_yasg.views import get_schema_view
+    from api.schema_generator import API_INFO, DocumentedSchemaGenerator
+    return get_schema_view(
+       API_INFO,
+       public=True,
+       permission_classes=(permissions.AllowAny,),
+       generator_class=DocumentedSchemaGenerator,
+    )
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -44,15 +64,17 @@ urlpatterns = [
     path('tinymce/', include('tinymce.urls')),
     
     #rest_framework.authtoken
-    path('api/auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/auth/token/', lazy_class_view('rest_framework_simplejwt.views.TokenObtainPairView'), name='token_obtain_pair'),
+    path('api/auth/token/refresh/', lazy_class_view('rest_framework_simplejwt.views.TokenRefreshView'), name='token_refresh'),
     
-    # Swagger endpoints
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+    # Swagger endpoints: JSON is the pre-generated artifact (manage.py generate_openapi_schema);
+    # the UI pages only render a shell that fetches it via SWAGGER_SETTINGS['SPEC_URL'].
+    path('swagger.json', SchemaArtifactView.as_view(), name='schema-json'),
+    re_path(r'^swagger(?P<format>\.yaml)$', lazy_view(lambda: schema_view().without_ui(cache_timeout=60 * 60)), name='schema-yaml'),
+    path('swagger/', lazy_view(lambda: schema_view().with_ui('swagger', cache_timeout=0)), name='schema-swagger-ui'),
 
     # ReDoc endpoint
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('redoc/', lazy_view(lambda: schema_view().with_ui('redoc', cache_timeout=0)), name='schema-redoc'),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
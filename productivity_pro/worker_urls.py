@@ -0,0 +1,11 @@
+"""
+URL configuration for Celery workers (REMINO_PROCESS_ROLE=worker).
+
+Workers only call reverse() on API routes to build links in emails, so they
+skip the admin, TinyMCE and documentation routes and everything those import.
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('api.urls')),
+]